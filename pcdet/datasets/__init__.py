@@ -1,3 +1,5 @@
+from functools import partial
+
 import torch
 from torch.utils.data import DataLoader
 from torch.utils.data import DistributedSampler as _DistributedSampler
@@ -81,9 +83,13 @@ def build_dataloader(dataset_cfg, class_names, batch_size, dist, root_path=None,
     else:
         sampler = None
 
+    # batches are only collated straight into pinned memory in the main process, pinned buffers do not survive the
+    # pickling from worker processes
+    collate_pin_memory = dataset_cfg.get('COLLATE_PIN_MEMORY', False) and workers == 0
     dataloader = DataLoader(
         dataset, batch_size=batch_size, pin_memory=True, num_workers=workers,
-        shuffle=(sampler is None) and training, collate_fn=dataset.collate_batch,
+        shuffle=(sampler is None) and training,
+        collate_fn=partial(dataset.collate_batch, pin_memory=collate_pin_memory),
         drop_last=False, sampler=sampler, timeout=0
     )
 
@@ -94,6 +100,7 @@ def build_semi_dataloader(dataset_cfg, class_names, batch_size, dist, root_path=
                      logger=None, merge_all_iters_to_one_epoch=False):
 
     assert merge_all_iters_to_one_epoch is False
+    collate_pin_memory = dataset_cfg.get('COLLATE_PIN_MEMORY', False) and workers == 0
 
     train_infos, test_infos, labeled_infos, unlabeled_infos = _semi_dataset_dict[dataset_cfg.DATASET]['PARTITION_FUNC'](
         info_paths = dataset_cfg.INFO_PATH,
@@ -117,7 +124,8 @@ def build_semi_dataloader(dataset_cfg, class_names, batch_size, dist, root_path=
 
     pretrain_dataloader = DataLoader(
         pretrain_dataset, batch_size=batch_size['pretrain'], pin_memory=True, num_workers=workers,
-        shuffle=(pretrain_sampler is None) and True, collate_fn=pretrain_dataset.collate_batch,
+        shuffle=(pretrain_sampler is None) and True,
+        collate_fn=partial(pretrain_dataset.collate_batch, pin_memory=collate_pin_memory),
         drop_last=False, sampler=pretrain_sampler, timeout=0
     )
 
@@ -134,7 +142,8 @@ def build_semi_dataloader(dataset_cfg, class_names, batch_size, dist, root_path=
         labeled_sampler = None
     labeled_dataloader = DataLoader(
         labeled_dataset, batch_size=batch_size['labeled'], pin_memory=True, num_workers=workers,
-        shuffle=(labeled_sampler is None) and True, collate_fn=labeled_dataset.collate_batch,
+        shuffle=(labeled_sampler is None) and True,
+        collate_fn=partial(labeled_dataset.collate_batch, pin_memory=collate_pin_memory),
         drop_last=False, sampler=labeled_sampler, timeout=0
     )
 
@@ -151,7 +160,8 @@ def build_semi_dataloader(dataset_cfg, class_names, batch_size, dist, root_path=
         unlabeled_sampler = None
     unlabeled_dataloader = DataLoader(
         unlabeled_dataset, batch_size=batch_size['unlabeled'], pin_memory=True, num_workers=workers,
-        shuffle=(unlabeled_sampler is None) and True, collate_fn=unlabeled_dataset.collate_batch,
+        shuffle=(unlabeled_sampler is None) and True,
+        collate_fn=partial(unlabeled_dataset.collate_batch, pin_memory=collate_pin_memory),
         drop_last=False, sampler=unlabeled_sampler, timeout=0
     )
 
@@ -169,7 +179,8 @@ def build_semi_dataloader(dataset_cfg, class_names, batch_size, dist, root_path=
         test_sampler = None
     test_dataloader = DataLoader(
         test_dataset, batch_size=batch_size['test'], pin_memory=True, num_workers=workers,
-        shuffle=(test_sampler is None) and False, collate_fn=test_dataset.collate_batch,
+        shuffle=(test_sampler is None) and False,
+        collate_fn=partial(test_dataset.collate_batch, pin_memory=collate_pin_memory),
         drop_last=False, sampler=test_sampler, timeout=0
     )
 
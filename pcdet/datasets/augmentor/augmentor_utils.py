@@ -3,6 +3,8 @@ import math
 import copy
 from ...utils import common_utils
 
+GLOBAL_TRANSFORM_NAMES = ['random_world_flip', 'random_world_rotation', 'random_world_scaling', 'random_world_translation']
+
 
 def random_flip_along_x(gt_boxes, points):
     """
@@ -76,6 +78,91 @@ def global_scaling(gt_boxes, points, scale_range):
 
     return gt_boxes, points
 
+def get_global_transform(aug_configs):
+    """
+    Draws the random numbers of consecutive random_world_flip/rotation/scaling/translation augmentations in the same
+    order as they would do themselves and composes them into one transform
+    Args:
+        aug_configs: list of augmentation configs, NAME in ['random_world_flip', 'random_world_rotation',
+            'random_world_scaling', 'random_world_translation']
+    Returns:
+        transform: dict
+            affine: (3, 4), [x, y, z] => affine[:, :3] @ [x, y, z] + affine[:, 3]
+            heading: [sign, offset], heading => sign * heading + offset
+            scale: scale of the box sizes
+            velocity: (2, 2), [vx, vy] => velocity @ [vx, vy]
+    """
+    linear, offset = np.eye(3), np.zeros(3)
+    heading_sign, heading_offset, box_scale = 1.0, 0.0, 1.0
+    velocity = np.eye(2)
+
+    for cur_cfg in aug_configs:
+        if cur_cfg.NAME == 'random_world_flip':
+            for cur_axis in cur_cfg['ALONG_AXIS_LIST']:
+                assert cur_axis in ['x', 'y']
+                enable = np.random.choice([False, True], replace=False, p=[0.5, 0.5])
+                if not enable:
+                    continue
+                flip = np.diag([1.0, -1.0, 1.0]) if cur_axis == 'x' else np.diag([-1.0, 1.0, 1.0])
+                linear, offset, velocity = flip @ linear, flip @ offset, flip[:2, :2] @ velocity
+                heading_sign = -heading_sign
+                heading_offset = -heading_offset if cur_axis == 'x' else -(heading_offset + np.pi)
+
+        elif cur_cfg.NAME == 'random_world_rotation':
+            rot_range = cur_cfg['WORLD_ROT_ANGLE']
+            if not isinstance(rot_range, list):
+                rot_range = [-rot_range, rot_range]
+            noise_rotation = np.random.uniform(rot_range[0], rot_range[1])
+            cosa, sina = np.cos(noise_rotation), np.sin(noise_rotation)
+            rot = np.array([[cosa, -sina, 0], [sina, cosa, 0], [0, 0, 1]])
+            linear, offset, velocity = rot @ linear, rot @ offset, rot[:2, :2] @ velocity
+            heading_offset += noise_rotation
+
+        elif cur_cfg.NAME == 'random_world_scaling':
+            scale_range = cur_cfg['WORLD_SCALE_RANGE']
+            if scale_range[1] - scale_range[0] < 1e-3:
+                continue
+            noise_scale = np.random.uniform(scale_range[0], scale_range[1])
+            linear, offset, box_scale = linear * noise_scale, offset * noise_scale, box_scale * noise_scale
+
+        elif cur_cfg.NAME == 'random_world_translation':
+            offset_range = cur_cfg['WORLD_TRANSLATION_RANGE']
+            for cur_axis in cur_cfg['ALONG_AXIS_LIST']:
+                assert cur_axis in ['x', 'y', 'z']
+                offset[['x', 'y', 'z'].index(cur_axis)] += np.random.uniform(offset_range[0], offset_range[1])
+
+        else:
+            raise NotImplementedError
+
+    transform = {
+        'affine': np.concatenate((linear, offset[:, np.newaxis]), axis=1),
+        'heading': np.array([heading_sign, heading_offset]),
+        'scale': box_scale,
+        'velocity': velocity
+    }
+    return transform
+
+def global_transform(gt_boxes, points, transform):
+    """
+    Applies a transform of get_global_transform in one pass
+    Args:
+        gt_boxes: (N, 7 + C), [x, y, z, dx, dy, dz, heading, [vx], [vy]], or None
+        points: (M, 3 + C)
+        transform: dict of get_global_transform
+    Returns:
+    """
+    affine = transform['affine']
+    points[:, 0:3] = points[:, 0:3] @ affine[:, :3].T.astype(points.dtype) + affine[:, 3].astype(points.dtype)
+
+    if gt_boxes is not None:
+        gt_boxes[:, 0:3] = gt_boxes[:, 0:3] @ affine[:, :3].T + affine[:, 3]
+        gt_boxes[:, 3:6] *= transform['scale']
+        gt_boxes[:, 6] = transform['heading'][0] * gt_boxes[:, 6] + transform['heading'][1]
+        if gt_boxes.shape[1] > 7:
+            gt_boxes[:, 7:9] = gt_boxes[:, 7:9] @ transform['velocity'].T
+
+    return gt_boxes, points
+
 def random_image_flip_horizontal(image, depth_map, gt_boxes, calib):
     """
     Performs random horizontal flip augmentation
@@ -467,4 +554,214 @@ def get_points_in_box(points, gt_box):
 
     points = points[mask]
 
-    return points, mask
\ No newline at end of file
+    return points, mask
+
+
+def get_points_in_boxes(points, gt_boxes):
+    """
+    Batched get_points_in_box, the points are sorted along x once so that every box only checks the points in its x range
+    Args:
+        points: (M, 3 + C)
+        gt_boxes: (N, 7 + C), [x, y, z, dx, dy, dz, heading, [vx], [vy]]
+    Returns:
+        point_indices: (K), indices of the points inside the boxes, grouped by box
+        box_indices: (K), index of the box each of these points is inside of
+    """
+    MARGIN = 1e-1
+    order = np.argsort(points[:, 0], kind='stable')
+    sorted_x = points[order, 0]
+    abs_cos, abs_sin = np.abs(np.cos(gt_boxes[:, 6])), np.abs(np.sin(gt_boxes[:, 6]))
+    half_x = (gt_boxes[:, 3] * abs_cos + gt_boxes[:, 4] * abs_sin) / 2.0
+    half_y = (gt_boxes[:, 3] * abs_sin + gt_boxes[:, 4] * abs_cos) / 2.0
+    starts = np.searchsorted(sorted_x, gt_boxes[:, 0] - half_x - 2 * MARGIN, side='left')
+    ends = np.searchsorted(sorted_x, gt_boxes[:, 0] + half_x + 2 * MARGIN, side='right')
+    num_candidates = np.maximum(ends - starts, 0)
+
+    box_indices = np.repeat(np.arange(gt_boxes.shape[0]), num_candidates)
+    candidate_offsets = np.arange(num_candidates.sum()) - np.repeat(np.cumsum(num_candidates) - num_candidates, num_candidates)
+    point_indices = order[np.repeat(starts, num_candidates) + candidate_offsets]
+    in_y_range = np.abs(points[point_indices, 1] - gt_boxes[box_indices, 1]) <= half_y[box_indices] + 2 * MARGIN
+    point_indices, box_indices = point_indices[in_y_range], box_indices[in_y_range]
+
+    boxes = gt_boxes[box_indices]
+    shift_x = points[point_indices, 0] - boxes[:, 0]
+    shift_y = points[point_indices, 1] - boxes[:, 1]
+    shift_z = points[point_indices, 2] - boxes[:, 2]
+    cosa, sina = np.cos(-boxes[:, 6]).astype(shift_x.dtype), np.sin(-boxes[:, 6]).astype(shift_x.dtype)
+    local_x = shift_x * cosa + shift_y * (-sina)
+    local_y = shift_x * sina + shift_y * cosa
+
+    mask = np.logical_and(abs(shift_z) <= boxes[:, 5] / 2.0, \
+             np.logical_and(abs(local_x) <= boxes[:, 3] / 2.0 + MARGIN, \
+                 abs(local_y) <= boxes[:, 4] / 2.0 + MARGIN))
+
+    return point_indices[mask], box_indices[mask]
+
+def transform_points_in_boxes(points, gt_boxes, transform_func):
+    """
+    Applies transform_func to the points of all boxes as one grouped operation. The loop versions look up the points of
+    a box after the previous boxes have been transformed, so if a point is inside two boxes or is moved into a later box,
+    the boxes are processed one by one as there, but only over the points inside any box.
+    Args:
+        points: (M, 3 + C)
+        gt_boxes: (N, 7 + C), [x, y, z, dx, dy, dz, heading, [vx], [vy]], boxes before the transform
+        transform_func: (box_points (K, 3 + C), box_indices (K)) => transformed box_points (K, 3 + C)
+    Returns:
+        points: (M, 3 + C)
+    """
+    point_indices, box_indices = get_points_in_boxes(points, gt_boxes)
+    box_points = transform_func(points[point_indices], box_indices)
+
+    num_boxes_of_points = np.bincount(point_indices, minlength=points.shape[0])
+    is_sequential = (num_boxes_of_points > 1).any()
+    if not is_sequential:
+        moved_indices, moved_box_indices = get_points_in_boxes(box_points, gt_boxes)
+        is_sequential = (moved_box_indices > box_indices[moved_indices]).any()
+
+    if not is_sequential:
+        points[point_indices] = box_points
+        return points
+
+    point_indices = num_boxes_of_points.nonzero()[0]
+    inside_points = points[point_indices]
+    for idx, box in enumerate(gt_boxes):
+        points_in_box, mask = get_points_in_box(inside_points, box)
+        inside_points[mask] = transform_func(points_in_box, np.full(points_in_box.shape[0], idx))
+    points[point_indices] = inside_points
+
+    return points
+
+def random_local_translation_batched(gt_boxes, points, offset_range, axis):
+    """
+    Batched random_local_translation_along_x/y/z, draws the same random numbers
+    Args:
+        gt_boxes: (N, 7), [x, y, z, dx, dy, dz, heading, [vx], [vy]]
+        points: (M, 3 + C),
+        offset_range: [min max]]
+        axis: 0, 1 or 2
+    Returns:
+    """
+    offsets = np.random.uniform(offset_range[0], offset_range[1], gt_boxes.shape[0])
+
+    def translate(box_points, box_indices):
+        box_points[:, axis] += offsets.astype(box_points.dtype)[box_indices]
+        return box_points
+
+    points = transform_points_in_boxes(points, gt_boxes, translate)
+    gt_boxes[:, axis] += offsets.astype(gt_boxes.dtype)
+
+    return gt_boxes, points
+
+def random_local_translation_along_x_batched(gt_boxes, points, offset_range):
+    return random_local_translation_batched(gt_boxes, points, offset_range, axis=0)
+
+def random_local_translation_along_y_batched(gt_boxes, points, offset_range):
+    return random_local_translation_batched(gt_boxes, points, offset_range, axis=1)
+
+def random_local_translation_along_z_batched(gt_boxes, points, offset_range):
+    return random_local_translation_batched(gt_boxes, points, offset_range, axis=2)
+
+def local_scaling_batched(gt_boxes, points, scale_range):
+    """
+    Batched local_scaling, draws the same random numbers
+    Args:
+        gt_boxes: (N, 7), [x, y, z, dx, dy, dz, heading]
+        points: (M, 3 + C),
+        scale_range: [min, max]
+    Returns:
+    """
+    if scale_range[1] - scale_range[0] < 1e-3:
+        return gt_boxes, points
+
+    noise_scales = np.random.uniform(scale_range[0], scale_range[1], gt_boxes.shape[0])
+
+    def scale(box_points, box_indices):
+        centers = gt_boxes[box_indices, 0:3]
+        box_points[:, 0] -= centers[:, 0]
+        box_points[:, 1] -= centers[:, 1]
+        box_points[:, 2] -= centers[:, 2]
+        box_points[:, :3] *= noise_scales.astype(box_points.dtype)[box_indices, np.newaxis]
+        box_points[:, 0] += centers[:, 0]
+        box_points[:, 1] += centers[:, 1]
+        box_points[:, 2] += centers[:, 2]
+        return box_points
+
+    points = transform_points_in_boxes(points, gt_boxes, scale)
+    gt_boxes[:, 3:6] *= noise_scales.astype(gt_boxes.dtype)[:, np.newaxis]
+
+    return gt_boxes, points
+
+def local_rotation_batched(gt_boxes, points, rot_range):
+    """
+    Batched local_rotation, draws the same random numbers
+    Args:
+        gt_boxes: (N, 7), [x, y, z, dx, dy, dz, heading, [vx], [vy]]
+        points: (M, 3 + C),
+        rot_range: [min, max]
+    Returns:
+    """
+    noise_rotations = np.random.uniform(rot_range[0], rot_range[1], gt_boxes.shape[0])
+
+    def rotate(box_points, box_indices):
+        centers = gt_boxes[box_indices, 0:3]
+        box_points[:, 0] -= centers[:, 0]
+        box_points[:, 1] -= centers[:, 1]
+        box_points[:, 2] -= centers[:, 2]
+        box_points = common_utils.rotate_points_along_z(
+            box_points[:, np.newaxis, :], noise_rotations[box_indices]
+        )[:, 0, :]
+        box_points[:, 0] += centers[:, 0]
+        box_points[:, 1] += centers[:, 1]
+        box_points[:, 2] += centers[:, 2]
+        return box_points
+
+    points = transform_points_in_boxes(points, gt_boxes, rotate)
+    gt_boxes[:, 6] += noise_rotations.astype(gt_boxes.dtype)
+    if gt_boxes.shape[1] > 8:
+        gt_boxes[:, 7:9] = common_utils.rotate_points_along_z(
+            np.hstack((gt_boxes[:, 7:9], np.zeros((gt_boxes.shape[0], 1))))[:, np.newaxis, :],
+            noise_rotations
+        )[:, 0, 0:2]
+
+    return gt_boxes, points
+
+def local_frustum_dropout_batched(gt_boxes, points, intensity_range, direction):
+    """
+    Batched local_frustum_dropout_top/bottom/left/right, draws the same random numbers
+    Args:
+        gt_boxes: (N, 7), [x, y, z, dx, dy, dz, heading, [vx], [vy]],
+        points: (M, 3 + C),
+        intensity: [min, max]
+        direction: 'top', 'bottom', 'left' or 'right'
+    Returns:
+    """
+    intensities = np.random.uniform(intensity_range[0], intensity_range[1], gt_boxes.shape[0])
+    point_indices, box_indices = get_points_in_boxes(points, gt_boxes)
+
+    axis = 2 if direction in ['top', 'bottom'] else 1
+    center, size = gt_boxes[box_indices, axis], gt_boxes[box_indices, axis + 3]
+    intensity = intensities.astype(gt_boxes.dtype)[box_indices]
+    if direction in ['top', 'left']:
+        threshold = (center + size / 2) - intensity * size
+        dropped = points[point_indices, axis] >= threshold
+    else:
+        threshold = (center - size / 2) + intensity * size
+        dropped = points[point_indices, axis] <= threshold
+
+    mask = np.ones(points.shape[0], dtype=bool)
+    mask[point_indices[dropped]] = False
+    points = points[mask]
+
+    return gt_boxes, points
+
+def local_frustum_dropout_top_batched(gt_boxes, points, intensity_range):
+    return local_frustum_dropout_batched(gt_boxes, points, intensity_range, direction='top')
+
+def local_frustum_dropout_bottom_batched(gt_boxes, points, intensity_range):
+    return local_frustum_dropout_batched(gt_boxes, points, intensity_range, direction='bottom')
+
+def local_frustum_dropout_left_batched(gt_boxes, points, intensity_range):
+    return local_frustum_dropout_batched(gt_boxes, points, intensity_range, direction='left')
+
+def local_frustum_dropout_right_batched(gt_boxes, points, intensity_range):
+    return local_frustum_dropout_batched(gt_boxes, points, intensity_range, direction='right')
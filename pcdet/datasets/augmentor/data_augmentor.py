@@ -7,7 +7,7 @@ from . import augmentor_utils, database_sampler
 
 
 class DataAugmentor(object):
-    def __init__(self, root_path, augmentor_configs, class_names, logger=None):
+    def __init__(self, root_path, augmentor_configs, class_names, logger=None, num_gpu_augmentations=0):
         self.root_path = root_path
         self.class_names = class_names
         self.logger = logger
@@ -15,13 +15,26 @@ class DataAugmentor(object):
         self.data_augmentor_queue = []
         aug_config_list = augmentor_configs if isinstance(augmentor_configs, list) \
             else augmentor_configs.AUG_CONFIG_LIST
-
+        if not isinstance(augmentor_configs, list):
+            aug_config_list = [x for x in aug_config_list if x.NAME not in augmentor_configs.DISABLE_AUG_LIST]
+        # the last num_gpu_augmentations run in the model instead, see processor/gpu_data_processor.py
+        aug_config_list = aug_config_list[:len(aug_config_list) - num_gpu_augmentations]
+
+        # consecutive global transforms are composed into one random_world_transform
+        fuse_global_transforms = not isinstance(augmentor_configs, list) and \
+            augmentor_configs.get('FUSE_GLOBAL_TRANSFORMS', False)
+        global_transform_cfgs = []
         for cur_cfg in aug_config_list:
-            if not isinstance(augmentor_configs, list):
-                if cur_cfg.NAME in augmentor_configs.DISABLE_AUG_LIST:
-                    continue
+            if fuse_global_transforms and cur_cfg.NAME in augmentor_utils.GLOBAL_TRANSFORM_NAMES:
+                global_transform_cfgs.append(cur_cfg)
+                continue
+            if len(global_transform_cfgs) > 0:
+                self.data_augmentor_queue.append(self.random_world_transform(config=global_transform_cfgs))
+                global_transform_cfgs = []
             cur_augmentor = getattr(self, cur_cfg.NAME)(config=cur_cfg)
             self.data_augmentor_queue.append(cur_augmentor)
+        if len(global_transform_cfgs) > 0:
+            self.data_augmentor_queue.append(self.random_world_transform(config=global_transform_cfgs))
 
     def gt_sampling(self, config=None):
         db_sampler = database_sampler.DataBaseSampler(
@@ -79,6 +92,21 @@ class DataAugmentor(object):
         data_dict['points'] = points
         return data_dict
 
+    def random_world_transform(self, data_dict=None, config=None):
+        """
+        Fused random_world_flip/rotation/scaling/translation, config is the list of their configs
+        """
+        if data_dict is None:
+            return partial(self.random_world_transform, config=config)
+        transform = augmentor_utils.get_global_transform(config)
+        gt_boxes, points = augmentor_utils.global_transform(
+            data_dict['gt_boxes'], data_dict['points'], transform
+        )
+
+        data_dict['gt_boxes'] = gt_boxes
+        data_dict['points'] = points
+        return data_dict
+
     def random_image_flip(self, data_dict=None, config=None):
         if data_dict is None:
             return partial(self.random_image_flip, config=config)
@@ -126,7 +154,9 @@ class DataAugmentor(object):
         gt_boxes, points = data_dict['gt_boxes'], data_dict['points']
         for cur_axis in config['ALONG_AXIS_LIST']:
             assert cur_axis in ['x', 'y', 'z']
-            gt_boxes, points = getattr(augmentor_utils, 'random_local_translation_along_%s' % cur_axis)(
+            gt_boxes, points = getattr(augmentor_utils, 'random_local_translation_along_%s%s' % (
+                cur_axis, '_batched' if config.get('BATCHED', False) else ''
+            ))(
                 gt_boxes, points, offset_range,
             )
 
@@ -143,7 +173,9 @@ class DataAugmentor(object):
         rot_range = config['LOCAL_ROT_ANGLE']
         if not isinstance(rot_range, list):
             rot_range = [-rot_range, rot_range]
-        gt_boxes, points = augmentor_utils.local_rotation(
+        local_rotation = augmentor_utils.local_rotation_batched if config.get('BATCHED', False) \
+            else augmentor_utils.local_rotation
+        gt_boxes, points = local_rotation(
             data_dict['gt_boxes'], data_dict['points'], rot_range=rot_range
         )
 
@@ -157,7 +189,9 @@ class DataAugmentor(object):
         """
         if data_dict is None:
             return partial(self.random_local_scaling, config=config)
-        gt_boxes, points = augmentor_utils.local_scaling(
+        local_scaling = augmentor_utils.local_scaling_batched if config.get('BATCHED', False) \
+            else augmentor_utils.local_scaling
+        gt_boxes, points = local_scaling(
             data_dict['gt_boxes'], data_dict['points'], config['LOCAL_SCALE_RANGE']
         )
 
@@ -195,7 +229,9 @@ class DataAugmentor(object):
         gt_boxes, points = data_dict['gt_boxes'], data_dict['points']
         for direction in config['DIRECTION']:
             assert direction in ['top', 'bottom', 'left', 'right']
-            gt_boxes, points = getattr(augmentor_utils, 'local_frustum_dropout_%s' % direction)(
+            gt_boxes, points = getattr(augmentor_utils, 'local_frustum_dropout_%s%s' % (
+                direction, '_batched' if config.get('BATCHED', False) else ''
+            ))(
                 gt_boxes, points, intensity_range,
             )
 
@@ -1,9 +1,7 @@
 import pickle
 
 import os
-import copy
 import numpy as np
-import SharedArray
 import torch.distributed as dist
 
 from ...ops.iou3d_nms import iou3d_nms_utils
@@ -22,6 +20,8 @@ class DataBaseSampler(object):
             self.db_infos[class_name] = []
             
         self.use_shared_memory = sampler_cfg.get('USE_SHARED_MEMORY', False)
+        self.use_mmap_db_data = sampler_cfg.get('USE_MMAP_DB_DATA', False) and not self.use_shared_memory
+        self._mmap_db_data = None
         
         for db_info_path in sampler_cfg.DB_INFO_PATH:
             db_info_path = self.root_path.resolve() / db_info_path
@@ -54,6 +54,7 @@ class DataBaseSampler(object):
     def __getstate__(self):
         d = dict(self.__dict__)
         del d['logger']
+        d['_mmap_db_data'] = None
         return d
 
     def __setstate__(self, d):
@@ -61,6 +62,9 @@ class DataBaseSampler(object):
 
     def __del__(self):
         if self.use_shared_memory:
+            # only imported with USE_SHARED_MEMORY, the packed database of USE_MMAP_DB_DATA does not need SharedArray
+            import SharedArray
+
             self.logger.info('Deleting GT database from shared memory')
             cur_rank, num_gpus = common_utils.get_dist_info()
             sa_key = self.sampler_cfg.DB_DATA_PATH[0]
@@ -88,6 +92,27 @@ class DataBaseSampler(object):
         self.logger.info('GT database has been saved to shared memory')
         return sa_key
 
+    def get_gt_database_data(self):
+        """
+        Returns the packed GT database (M, C) that `global_data_offset` of the db_infos points into, either attached
+        from shared memory or memory-mapped read-only from DB_DATA_PATH, or None if objects are read from single files
+        """
+        if self.use_shared_memory:
+            import SharedArray
+
+            gt_database_data = SharedArray.attach(f"shm://{self.gt_database_data_key}")
+            gt_database_data.setflags(write=0)
+            return gt_database_data
+
+        if self.use_mmap_db_data:
+            if self._mmap_db_data is None:
+                assert self.sampler_cfg.DB_DATA_PATH.__len__() == 1, 'Current only support single DB_DATA'
+                db_data_path = self.root_path.resolve() / self.sampler_cfg.DB_DATA_PATH[0]
+                self._mmap_db_data = np.load(db_data_path, mmap_mode='r')
+            return self._mmap_db_data
+
+        return None
+
     def filter_by_difficulty(self, db_infos, removed_difficulty):
         new_db_infos = {}
         for key, dinfos in db_infos.items():
@@ -156,6 +181,37 @@ class DataBaseSampler(object):
         gt_boxes[:, 2] -= mv_height  # lidar view
         return gt_boxes, mv_height
 
+    @staticmethod
+    def get_bev_collision_matrix(boxes_a, boxes_b, aabb_margin=0.1):
+        """
+        Pairs whose enclosing axis-aligned BEV rectangles (padded by aabb_margin, which has to stay above the 1e-2
+        corner margin of the rotated iou kernel) are apart can not overlap, so the rotated BEV iou is only
+        computed for the remaining candidate pairs
+        Args:
+            boxes_a: (N, 7 + C) [x, y, z, dx, dy, dz, heading, ...]
+            boxes_b: (M, 7 + C) [x, y, z, dx, dy, dz, heading, ...]
+            aabb_margin:
+
+        Returns:
+            collision: (N, M) bool, True if the rotated BEV iou of the two boxes is not zero
+        """
+        def get_bev_half_extents(boxes):
+            angle_cos, angle_sin = np.abs(np.cos(boxes[:, 6])), np.abs(np.sin(boxes[:, 6]))
+            half_x = (boxes[:, 3] * angle_cos + boxes[:, 4] * angle_sin) / 2 + aabb_margin
+            half_y = (boxes[:, 3] * angle_sin + boxes[:, 4] * angle_cos) / 2 + aabb_margin
+            return half_x, half_y
+
+        half_x_a, half_y_a = get_bev_half_extents(boxes_a)
+        half_x_b, half_y_b = get_bev_half_extents(boxes_b)
+        collision = (np.abs(boxes_a[:, None, 0] - boxes_b[None, :, 0]) <= half_x_a[:, None] + half_x_b[None, :]) & \
+                    (np.abs(boxes_a[:, None, 1] - boxes_b[None, :, 1]) <= half_y_a[:, None] + half_y_b[None, :])
+
+        rows, cols = collision.any(axis=1).nonzero()[0], collision.any(axis=0).nonzero()[0]
+        if rows.shape[0] > 0:
+            iou = iou3d_nms_utils.boxes_bev_iou_cpu(boxes_a[rows, 0:7], boxes_b[cols, 0:7])
+            collision[np.ix_(rows, cols)] &= (iou != 0)
+        return collision
+
     def add_sampled_boxes_to_scene(self, data_dict, sampled_gt_boxes, total_valid_sampled_dict):
         gt_boxes_mask = data_dict['gt_boxes_mask']
         gt_boxes = data_dict['gt_boxes'][gt_boxes_mask]
@@ -168,31 +224,32 @@ class DataBaseSampler(object):
             data_dict.pop('calib')
             data_dict.pop('road_plane')
 
-        obj_points_list = []
-        if self.use_shared_memory:
-            gt_database_data = SharedArray.attach(f"shm://{self.gt_database_data_key}")
-            gt_database_data.setflags(write=0)
+        gt_database_data = self.get_gt_database_data()
+        if gt_database_data is not None:
+            # copy the object points straight out of the packed database into one buffer, it is their only copy
+            data_offsets = np.array([info['global_data_offset'] for info in total_valid_sampled_dict], dtype=np.int64)
+            num_obj_points = data_offsets[:, 1] - data_offsets[:, 0]
+            obj_points = np.empty((num_obj_points.sum(), gt_database_data.shape[1]), dtype=gt_database_data.dtype)
+            cur_offset = 0
+            for (start_offset, end_offset), cur_num in zip(data_offsets, num_obj_points):
+                obj_points[cur_offset:cur_offset + cur_num] = gt_database_data[start_offset:end_offset]
+                cur_offset += cur_num
         else:
-            gt_database_data = None 
-
-        for idx, info in enumerate(total_valid_sampled_dict):
-            if self.use_shared_memory:
-                start_offset, end_offset = info['global_data_offset']
-                obj_points = copy.deepcopy(gt_database_data[start_offset:end_offset])
-            else:
+            obj_points_list = []
+            for info in total_valid_sampled_dict:
                 file_path = self.root_path / info['path']
-                obj_points = np.fromfile(str(file_path), dtype=np.float32).reshape(
-                    [-1, self.sampler_cfg.NUM_POINT_FEATURES])
+                obj_points_list.append(np.fromfile(str(file_path), dtype=np.float32).reshape(
+                    [-1, self.sampler_cfg.NUM_POINT_FEATURES]))
+            num_obj_points = np.array([x.shape[0] for x in obj_points_list], dtype=np.int64)
+            obj_points = np.concatenate(obj_points_list, axis=0)
 
-            obj_points[:, :3] += info['box3d_lidar'][:3]
+        obj_centers = np.stack([info['box3d_lidar'][:3] for info in total_valid_sampled_dict], axis=0)
+        obj_points[:, :3] += np.repeat(obj_centers, num_obj_points, axis=0)
 
-            if self.sampler_cfg.get('USE_ROAD_PLANE', False):
-                # mv height
-                obj_points[:, 2] -= mv_height[idx]
-
-            obj_points_list.append(obj_points)
+        if self.sampler_cfg.get('USE_ROAD_PLANE', False):
+            # mv height
+            obj_points[:, 2] -= np.repeat(mv_height, num_obj_points, axis=0)
 
-        obj_points = np.concatenate(obj_points_list, axis=0)
         sampled_gt_names = np.array([x['name'] for x in total_valid_sampled_dict])
 
         large_sampled_gt_boxes = box_utils.enlarge_box3d(
@@ -225,8 +282,7 @@ class DataBaseSampler(object):
         """
         gt_boxes = data_dict['gt_boxes']
         gt_names = data_dict['gt_names'].astype(str)
-        existed_boxes = gt_boxes
-        total_valid_sampled_dict = []
+        sampled_dict_list, sampled_boxes_list = [], []
         for class_name, sample_group in self.sample_groups.items():
             if self.limit_whole_scene:
                 num_gt = np.sum(class_name == gt_names)
@@ -239,18 +295,34 @@ class DataBaseSampler(object):
                 if self.sampler_cfg.get('DATABASE_WITH_FAKELIDAR', False):
                     sampled_boxes = box_utils.boxes3d_kitti_fakelidar_to_lidar(sampled_boxes)
 
-                iou1 = iou3d_nms_utils.boxes_bev_iou_cpu(sampled_boxes[:, 0:7], existed_boxes[:, 0:7])
-                iou2 = iou3d_nms_utils.boxes_bev_iou_cpu(sampled_boxes[:, 0:7], sampled_boxes[:, 0:7])
-                iou2[range(sampled_boxes.shape[0]), range(sampled_boxes.shape[0])] = 0
-                iou1 = iou1 if iou1.shape[1] > 0 else iou2
-                valid_mask = ((iou1.max(axis=1) + iou2.max(axis=1)) == 0).nonzero()[0]
-                valid_sampled_dict = [sampled_dict[x] for x in valid_mask]
-                valid_sampled_boxes = sampled_boxes[valid_mask]
+                sampled_dict_list.append(sampled_dict)
+                sampled_boxes_list.append(sampled_boxes)
+
+        total_valid_sampled_dict = []
+        sampled_gt_boxes = gt_boxes[:0]
+        if sampled_boxes_list.__len__() > 0:
+            # all groups are checked in one pass, a sampled box is kept if it does not overlap the gt boxes, any other
+            # box sampled in its group, or the boxes kept from the previous groups
+            sampled_boxes = np.concatenate(sampled_boxes_list, axis=0)
+            group_ids = np.concatenate([np.full(x.shape[0], k) for k, x in enumerate(sampled_boxes_list)])
+            num_gt, num_sampled = gt_boxes.shape[0], sampled_boxes.shape[0]
+
+            collision = self.get_bev_collision_matrix(
+                sampled_boxes, np.concatenate((gt_boxes[:, 0:7], sampled_boxes[:, 0:7]), axis=0)
+            )
+            iou1, iou2 = collision[:, :num_gt], collision[:, num_gt:]
+            iou2[range(num_sampled), range(num_sampled)] = False
+            valid_mask = ~iou1.any(axis=1) & ~(iou2 & (group_ids[:, None] == group_ids[None, :])).any(axis=1)
+
+            for k in range(1, sampled_boxes_list.__len__()):
+                cur_group, prev_groups = group_ids == k, valid_mask & (group_ids < k)
+                valid_mask[cur_group] &= ~iou2[cur_group][:, prev_groups].any(axis=1)
 
-                existed_boxes = np.concatenate((existed_boxes, valid_sampled_boxes), axis=0)
-                total_valid_sampled_dict.extend(valid_sampled_dict)
+            valid_mask = valid_mask.nonzero()[0]
+            sampled_dict = [x for cur_sampled_dict in sampled_dict_list for x in cur_sampled_dict]
+            total_valid_sampled_dict = [sampled_dict[x] for x in valid_mask]
+            sampled_gt_boxes = np.concatenate((gt_boxes, sampled_boxes[valid_mask]), axis=0)[num_gt:]
 
-        sampled_gt_boxes = existed_boxes[gt_boxes.shape[0]:, :]
         if total_valid_sampled_dict.__len__() > 0:
             data_dict = self.add_sampled_boxes_to_scene(data_dict, sampled_gt_boxes, total_valid_sampled_dict)
 
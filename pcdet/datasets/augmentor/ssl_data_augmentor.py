@@ -3,6 +3,7 @@ import numpy as np
 import copy
 
 from ...utils import common_utils
+from . import augmentor_utils
 from .ssl_database_sampler import SSLDataBaseSampler
 
 class SSLDataAugmentor(object):
@@ -14,12 +15,25 @@ class SSLDataAugmentor(object):
         self.aug_list = []
         self.augmentor_queue = []
         aug_config_list = augmentor_configs.AUG_CONFIG_LIST
+        # consecutive global transforms are composed into one random_world_transform
+        fuse_global_transforms = augmentor_configs.get('FUSE_GLOBAL_TRANSFORMS', False)
+        global_transform_cfgs = []
         for cur_cfg in aug_config_list:
             if cur_cfg.NAME in augmentor_configs.DISABLE_AUG_LIST:
                 continue
+            if fuse_global_transforms and cur_cfg.NAME in augmentor_utils.GLOBAL_TRANSFORM_NAMES:
+                global_transform_cfgs.append(cur_cfg)
+                continue
+            if len(global_transform_cfgs) > 0:
+                self.augmentor_queue.append(self.random_world_transform(config=global_transform_cfgs))
+                self.aug_list.append('random_world_transform')
+                global_transform_cfgs = []
             cur_augmentor = getattr(self, cur_cfg.NAME)(config=cur_cfg)
             self.augmentor_queue.append(cur_augmentor)
             self.aug_list.append(cur_cfg.NAME)
+        if len(global_transform_cfgs) > 0:
+            self.augmentor_queue.append(self.random_world_transform(config=global_transform_cfgs))
+            self.aug_list.append('random_world_transform')
 
     def gt_sampling(self, config=None):
         db_sampler = SSLDataBaseSampler(
@@ -128,6 +142,25 @@ class SSLDataAugmentor(object):
             data_dict['gt_boxes'] = gt_boxes
         return data_dict
 
+    def random_world_transform(self, data_dict=None, config=None):
+        """
+        Fused random_world_flip/rotation/scaling/translation, config is the list of their configs
+        """
+        if data_dict is None:
+            return partial(self.random_world_transform, config=config)
+
+        transform = augmentor_utils.get_global_transform(config)
+        gt_boxes, points = augmentor_utils.global_transform(
+            data_dict.get('gt_boxes', None), data_dict['points'], transform
+        )
+
+        data_dict['augmentation_params']['random_world_transform'] = transform
+
+        data_dict['points'] = points
+        if 'gt_boxes' in data_dict:
+            data_dict['gt_boxes'] = gt_boxes
+        return data_dict
+
     def forward(self, data_dict):
         """
         Args:
@@ -0,0 +1,55 @@
+"""
+Cache of the collated batches of a test dataloader, used by tools/test.py --eval_all --cache_batches.
+
+The first pass runs the dataloader as usual and pickles every batch to one file (in /dev/shm when cache_dir is
+'/dev/shm', in the temp dir by default) before it is moved to the GPU, the following passes read the batches back from
+that file instead of decoding, augmenting and voxelizing every frame again. With distributed testing every rank caches
+its own part of the test set, the DistributedSampler of the test set does not shuffle.
+"""
+
+import os
+import pickle
+import tempfile
+import weakref
+
+from .frame_cache import remove_file
+
+
+class BatchCache(object):
+    def __init__(self, dataloader, cache_dir=None, logger=None):
+        """
+        Args:
+            dataloader: test dataloader, its sampler must yield the same order in every pass
+            cache_dir: directory of the cache file, defaults to the temp dir
+            logger:
+        """
+        self.dataloader = dataloader
+        self.dataset = dataloader.dataset
+        self.logger = logger
+
+        fd, self.path = tempfile.mkstemp(prefix='pcdet_batch_cache_', suffix='.pkl', dir=cache_dir)
+        os.close(fd)
+        self._finalizer = weakref.finalize(self, remove_file, self.path, os.getpid())
+        self.num_cached = 0
+
+    def __len__(self):
+        return len(self.dataloader)
+
+    def __iter__(self):
+        if self.num_cached == len(self.dataloader):
+            with open(self.path, 'rb') as f:
+                for _ in range(self.num_cached):
+                    yield pickle.load(f)
+            return
+
+        # an interrupted first pass is written again from the start
+        self.num_cached = 0
+        with open(self.path, 'wb') as f:
+            for batch_dict in self.dataloader:
+                # the batch is modified in place by load_data_to_gpu and the model, so it is saved first
+                pickle.dump(batch_dict, f, protocol=pickle.HIGHEST_PROTOCOL)
+                yield batch_dict
+        self.num_cached = len(self.dataloader)
+        if self.logger is not None:
+            self.logger.info('Batch cache: %d batches, %.1f MB, %s' % (
+                self.num_cached, os.path.getsize(self.path) / 1024 ** 2, self.path))
@@ -5,8 +5,11 @@ import numpy as np
 import torch.utils.data as torch_data
 
 from ..utils import common_utils
+from . import frame_cache, info_store
+from .evaluator import CollectingEvaluator
 from .augmentor.data_augmentor import DataAugmentor
 from .processor.data_processor import DataProcessor
+from .processor.gpu_data_processor import get_gpu_stage_configs
 from .processor.point_feature_encoder import PointFeatureEncoder
 
 
@@ -27,12 +30,17 @@ class DatasetTemplate(torch_data.Dataset):
             self.dataset_cfg.POINT_FEATURE_ENCODING,
             point_cloud_range=self.point_cloud_range
         )
+        # the end of the training pipeline can run on the GPU in the model, see Detector3DTemplate.build_gpu_processor
+        self.gpu_augmentor_configs, self.gpu_processor_configs = get_gpu_stage_configs(self.dataset_cfg) \
+            if self.training and self.dataset_cfg.get('USE_GPU_PROCESSOR', False) else ([], [])
         self.data_augmentor = DataAugmentor(
-            self.root_path, self.dataset_cfg.DATA_AUGMENTOR, self.class_names, logger=self.logger
+            self.root_path, self.dataset_cfg.DATA_AUGMENTOR, self.class_names, logger=self.logger,
+            num_gpu_augmentations=len(self.gpu_augmentor_configs)
         ) if self.training else None
         self.data_processor = DataProcessor(
             self.dataset_cfg.DATA_PROCESSOR, point_cloud_range=self.point_cloud_range,
-            training=self.training, num_point_features=self.point_feature_encoder.num_point_features
+            training=self.training, num_point_features=self.point_feature_encoder.num_point_features,
+            num_gpu_processors=len(self.gpu_processor_configs)
         )
 
         self.grid_size = self.data_processor.grid_size
@@ -45,10 +53,29 @@ class DatasetTemplate(torch_data.Dataset):
         else:
             self.depth_downsample_factor = None
 
+        self.frame_cache = frame_cache.build_frame_cache(self.dataset_cfg, logger=self.logger)
+
     @property
     def mode(self):
         return 'train' if self.training else 'test'
 
+    def get_cached_frame(self, key, load_func):
+        """
+        Loads a decoded frame through the frame cache of FRAME_CACHE_MAX_MB, which is shared by the workers
+        Args:
+            key: key of the frame, e.g. the path of its file
+            load_func: function without arguments that loads the frame when it is not cached
+        Returns:
+            points: (N, C), owned by the caller
+        """
+        if getattr(self, 'frame_cache', None) is None:
+            return load_func()
+        points = self.frame_cache.get(key)
+        if points is None:
+            points = load_func()
+            self.frame_cache.put(key, points)
+        return points
+
     def __getstate__(self):
         d = dict(self.__dict__)
         del d['logger']
@@ -57,8 +84,20 @@ class DatasetTemplate(torch_data.Dataset):
     def __setstate__(self, d):
         self.__dict__.update(d)
 
+    def get_info_path(self, info_path):
+        """
+        Returns the columnar counterpart of a pickled info file (see info_store.py) if USE_COLUMNAR_INFOS is enabled
+        and the converted file exists, otherwise the given path.
+        """
+        info_path = Path(info_path)
+        if self.dataset_cfg.get('USE_COLUMNAR_INFOS', False):
+            columnar_info_path = info_path.with_suffix(info_store.COLUMNAR_INFO_SUFFIX)
+            if columnar_info_path.exists():
+                return columnar_info_path
+        return info_path
+
     @staticmethod
-    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None):
+    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None, result_writer=None):
         """
         To support a custom dataset, implement this function to receive the predicted results from the model, and then
         transform the unified normative coordinate to your required coordinate, and optionally save them to disk.
@@ -71,10 +110,25 @@ class DatasetTemplate(torch_data.Dataset):
                 pred_labels: (N), Tensor
             class_names:
             output_path: if it is not None, save the results to this path
+            result_writer: optional ResultWriter, if it is not None, the results are saved by its background threads
         Returns:
 
         """
 
+    def build_evaluator(self, class_names, **kwargs):
+        """
+        To support streaming evaluation (STREAMING_EVAL), implement this function to return a DatasetEvaluator that
+        accumulates the per-frame statistics as the predictions arrive. By default the predictions are collected and
+        passed to self.evaluation at the end.
+
+        Args:
+            class_names:
+            **kwargs: the kwargs of self.evaluation
+        Returns:
+            evaluator: DatasetEvaluator
+        """
+        return CollectingEvaluator(self, class_names, **kwargs)
+
     def merge_all_iters_to_one_epoch(self, merge=True, epochs=None):
         if merge:
             self._merge_all_iters_to_one_epoch = True
@@ -158,7 +212,10 @@ class DatasetTemplate(torch_data.Dataset):
         return data_dict
 
     @staticmethod
-    def collate_batch(batch_list, _unused=False):
+    def collate_batch(batch_list, _unused=False, pin_memory=False):
+        """
+        Every key is written into one array allocated with its final size, in page-locked memory if pin_memory
+        """
         data_dict = defaultdict(list)
         for cur_sample in batch_list:
             for key, val in cur_sample.items():
@@ -169,58 +226,26 @@ class DatasetTemplate(torch_data.Dataset):
         for key, val in data_dict.items():
             try:
                 if key in ['voxels', 'voxel_num_points']:
-                    ret[key] = np.concatenate(val, axis=0)
-                elif key in ['points', 'voxel_coords']:
-                    coors = []
-                    for i, coor in enumerate(val):
-                        coor_pad = np.pad(coor, ((0, 0), (1, 0)), mode='constant', constant_values=i)
-                        coors.append(coor_pad)
-                    ret[key] = np.concatenate(coors, axis=0)
+                    ret[key] = common_utils.concatenate_batch(val, pin_memory=pin_memory)
+                elif key in ['points', 'voxel_coords', 'point_voxel_coords']:
+                    ret[key] = common_utils.concatenate_with_batch_index(val, pin_memory=pin_memory)
                 elif key in ['gt_boxes']:
-                    max_gt = max([len(x) for x in val])
-                    batch_gt_boxes3d = np.zeros((batch_size, max_gt, val[0].shape[-1]), dtype=np.float32)
-                    for k in range(batch_size):
-                        batch_gt_boxes3d[k, :val[k].__len__(), :] = val[k]
-                    ret[key] = batch_gt_boxes3d
+                    ret[key] = common_utils.stack_with_padding(val, pad_value=0, dtype=np.float32, pin_memory=pin_memory)
                 elif key in ['gt_boxes2d']:
-                    max_boxes = 0
                     max_boxes = max([len(x) for x in val])
-                    batch_boxes2d = np.zeros((batch_size, max_boxes, val[0].shape[-1]), dtype=np.float32)
+                    batch_boxes2d = common_utils.empty_batch_array(
+                        (batch_size, max_boxes, val[0].shape[-1]), np.float32, pin_memory=pin_memory
+                    )
+                    batch_boxes2d.fill(0)
                     for k in range(batch_size):
                         if val[k].size > 0:
                             batch_boxes2d[k, :val[k].__len__(), :] = val[k]
                     ret[key] = batch_boxes2d
                 elif key in ["images", "depth_maps"]:
-                    # Get largest image size (H, W)
-                    max_h = 0
-                    max_w = 0
-                    for image in val:
-                        max_h = max(max_h, image.shape[0])
-                        max_w = max(max_w, image.shape[1])
-
-                    # Change size of images
-                    images = []
-                    for image in val:
-                        pad_h = common_utils.get_pad_params(desired_size=max_h, cur_size=image.shape[0])
-                        pad_w = common_utils.get_pad_params(desired_size=max_w, cur_size=image.shape[1])
-                        pad_width = (pad_h, pad_w)
-                        # Pad with nan, to be replaced later in the pipeline.
-                        pad_value = np.nan
-
-                        if key == "images":
-                            pad_width = (pad_h, pad_w, (0, 0))
-                        elif key == "depth_maps":
-                            pad_width = (pad_h, pad_w)
-
-                        image_pad = np.pad(image,
-                                           pad_width=pad_width,
-                                           mode='constant',
-                                           constant_values=pad_value)
-
-                        images.append(image_pad)
-                    ret[key] = np.stack(images, axis=0)
+                    # Pad at the end of (H, W) to the largest image, with nan, to be replaced later in the pipeline.
+                    ret[key] = common_utils.stack_with_padding(val, pad_value=np.nan, pin_memory=pin_memory)
                 else:
-                    ret[key] = np.stack(val, axis=0)
+                    ret[key] = common_utils.stack_batch(val, pin_memory=pin_memory)
             except:
                 print('Error in collate_batch: key=%s' % key)
                 raise TypeError
@@ -0,0 +1,76 @@
+"""
+Incremental evaluation of the predictions, used by eval_one_epoch with STREAMING_EVAL in the dataset config.
+
+The evaluator of a dataset (DatasetTemplate.build_evaluator) receives the annos of every batch as soon as they are
+generated, so that a dataset can compute the per-frame IoUs and matching statistics during inference and only keep
+those, and reduces them to the final metrics in evaluate(). With distributed testing every rank has its own
+evaluator, their results are gathered and merged on rank 0 before evaluate().
+"""
+
+
+class DatasetEvaluator(object):
+    def __init__(self, dataset, class_names, **kwargs):
+        """
+        Args:
+            dataset:
+            class_names:
+            **kwargs: the kwargs of dataset.evaluation, e.g. eval_metric and output_path
+        """
+        self.dataset = dataset
+        self.class_names = class_names
+        self.eval_kwargs = kwargs
+
+    def update(self, det_annos):
+        """
+        Args:
+            det_annos: list of the annos of generate_prediction_dicts for one batch
+        """
+        raise NotImplementedError
+
+    def get_results(self):
+        """
+        Returns:
+            results: picklable accumulated results of this evaluator, gathered from every rank with
+                common_utils.gather_results_dist for merge_results
+        """
+        raise NotImplementedError
+
+    def merge_results(self, results_list):
+        """
+        Args:
+            results_list: get_results() of every rank, in rank order, they replace the results of this evaluator
+        """
+        raise NotImplementedError
+
+    def evaluate(self):
+        """
+        Returns:
+            result_str, result_dict: same as dataset.evaluation
+        """
+        raise NotImplementedError
+
+
+class CollectingEvaluator(DatasetEvaluator):
+    """
+    Default evaluator of the datasets without incremental statistics: it keeps all the annos and calls
+    dataset.evaluation at the end
+    """
+    def __init__(self, dataset, class_names, **kwargs):
+        super().__init__(dataset, class_names, **kwargs)
+        self.det_annos = []
+
+    def update(self, det_annos):
+        self.det_annos += det_annos
+
+    def get_results(self):
+        return self.det_annos
+
+    def merge_results(self, results_list):
+        # same order as common_utils.merge_results_dist, the padding of the DistributedSampler is dropped
+        det_annos = []
+        for annos in zip(*results_list):
+            det_annos.extend(list(annos))
+        self.det_annos = det_annos[:len(self.dataset)]
+
+    def evaluate(self):
+        return self.dataset.evaluation(self.det_annos, self.class_names, **self.eval_kwargs)
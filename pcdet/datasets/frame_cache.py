@@ -0,0 +1,188 @@
+"""
+Size-bounded LRU cache of decoded point clouds, shared by the dataloader workers.
+
+The cache lives in one memory-mapped file (in /dev/shm when it has room) that is created by the dataset in the main
+process, so that the forked dataloader workers share it and a frame decoded by one worker is served to all of them in
+the following epochs. The file holds:
+    - header: [clock, hits, misses, evictions]
+    - table:  one entry per cached frame (key hash, offset, nbytes, shape, dtype, last use)
+    - data:   the raw arrays, placed first-fit, the least recently used frames are evicted until the new one fits
+All accesses hold one multiprocessing.Lock, a hit copies the array out of the cache under the lock.
+
+Enable it with FRAME_CACHE_MAX_MB in the dataset config, every dataset loads its frames through
+DatasetTemplate.get_cached_frame.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import weakref
+import multiprocessing
+
+import numpy as np
+
+_ALIGNMENT = 64
+_CLOCK, _HITS, _MISSES, _EVICTIONS = range(4)
+_ENTRY_DTYPE = np.dtype([
+    ('key', np.uint64), ('used', np.int64), ('offset', np.int64), ('nbytes', np.int64),
+    ('rows', np.int64), ('cols', np.int64), ('dtype', np.int64), ('last_used', np.int64)
+])
+# numpy dtypes of the cached arrays, stored by their index
+_DTYPES = [np.dtype(x) for x in ['float32', 'float64', 'int32', 'int64', 'uint8', 'int8', 'int16', 'uint16']]
+
+
+def remove_file(path, owner_pid):
+    """
+    Finalizer of the cache files, only the process that created the file removes it, not the forked workers
+    """
+    if os.getpid() == owner_pid and os.path.exists(path):
+        os.remove(path)
+
+
+def _get_key_hash(key):
+    return np.uint64(int.from_bytes(hashlib.blake2b(repr(key).encode(), digest_size=8).digest(), 'little'))
+
+
+class FrameCache(object):
+    def __init__(self, max_bytes, max_frames=None, cache_dir=None, logger=None):
+        """
+        Args:
+            max_bytes: budget of the cached arrays
+            max_frames: size of the entry table, defaults to one entry per 64KB of budget
+            cache_dir: directory of the cache file, defaults to /dev/shm if it has room for the budget
+            logger:
+        """
+        self.max_bytes = int(max_bytes)
+        self.max_frames = int(max_frames) if max_frames is not None else max(self.max_bytes // (64 * 1024), 1024)
+
+        if cache_dir is None:
+            cache_dir = '/dev/shm' if os.path.isdir('/dev/shm') and \
+                shutil.disk_usage('/dev/shm').free > self.max_bytes else tempfile.gettempdir()
+        fd, self.path = tempfile.mkstemp(prefix='pcdet_frame_cache_', dir=cache_dir)
+        os.close(fd)
+        self._finalizer = weakref.finalize(self, remove_file, self.path, os.getpid())
+
+        self.header_bytes = 4 * 8
+        self.table_bytes = self.max_frames * _ENTRY_DTYPE.itemsize
+        self.data_offset = int(np.ceil((self.header_bytes + self.table_bytes) / _ALIGNMENT)) * _ALIGNMENT
+        with open(self.path, 'r+b') as f:
+            f.truncate(self.data_offset + self.max_bytes)
+        self.lock = multiprocessing.Lock()
+        self._open()
+
+        if logger is not None:
+            logger.info('Frame cache: %.1f MB, %d frames at most, %s' % (
+                self.max_bytes / 1024 ** 2, self.max_frames, self.path))
+
+    def _open(self):
+        self.buffer = np.memmap(self.path, dtype=np.uint8, mode='r+')
+        self.header = self.buffer[:self.header_bytes].view(np.int64)
+        self.table = self.buffer[self.header_bytes:self.header_bytes + self.table_bytes].view(_ENTRY_DTYPE)
+        self.data = self.buffer[self.data_offset:]
+
+    def __getstate__(self):
+        # spawned workers map the same file again
+        d = dict(self.__dict__)
+        for key in ['buffer', 'header', 'table', 'data', '_finalizer']:
+            d.pop(key, None)
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self._open()
+
+    def _find(self, key_hash):
+        indices = np.nonzero((self.table['key'] == key_hash) & (self.table['used'] == 1))[0]
+        return indices[0] if indices.shape[0] > 0 else None
+
+    def _evict_lru(self):
+        used_indices = np.nonzero(self.table['used'] == 1)[0]
+        lru_idx = used_indices[np.argmin(self.table['last_used'][used_indices])]
+        self.table['used'][lru_idx] = 0
+        self.header[_EVICTIONS] += 1
+
+    def _allocate(self, nbytes):
+        """
+        First-fit over the gaps between the cached arrays, evicting the least recently used frames until one fits
+        Returns:
+            entry_idx, offset
+        """
+        while True:
+            used_indices = np.nonzero(self.table['used'] == 1)[0]
+            free_indices = np.nonzero(self.table['used'] == 0)[0]
+            if free_indices.shape[0] > 0:
+                entries = self.table[used_indices]
+                entries = entries[np.argsort(entries['offset'])]
+                gap_starts = np.concatenate(([0], entries['offset'] + entries['nbytes']))
+                gap_ends = np.concatenate((entries['offset'], [self.max_bytes]))
+                gap_starts = (gap_starts + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+                fits = np.nonzero(gap_ends - gap_starts >= nbytes)[0]
+                if fits.shape[0] > 0:
+                    return free_indices[0], int(gap_starts[fits[0]])
+            self._evict_lru()
+
+    def get(self, key):
+        """
+        Returns:
+            array: a copy of the cached array, None if the key is not cached
+        """
+        key_hash = _get_key_hash(key)
+        with self.lock:
+            entry_idx = self._find(key_hash)
+            if entry_idx is None:
+                self.header[_MISSES] += 1
+                return None
+            self.header[_HITS] += 1
+            self.header[_CLOCK] += 1
+            self.table['last_used'][entry_idx] = self.header[_CLOCK]
+            entry = self.table[entry_idx]
+            array = self.data[entry['offset']:entry['offset'] + entry['nbytes']].view(_DTYPES[entry['dtype']])
+            return array.reshape(entry['rows'], entry['cols']).copy()
+
+    def put(self, key, array):
+        """
+        Args:
+            key: any key with a stable repr, e.g. the file path of the frame
+            array: (N, C), frames larger than the whole budget are not cached
+        """
+        assert array.ndim == 2 and array.dtype in _DTYPES, 'Only 2D numeric arrays are cached'
+        if array.nbytes > self.max_bytes:
+            return
+
+        key_hash = _get_key_hash(key)
+        with self.lock:
+            if self._find(key_hash) is not None:
+                return
+            entry_idx, offset = self._allocate(array.nbytes)
+            self.data[offset:offset + array.nbytes] = np.ascontiguousarray(array).view(np.uint8).reshape(-1)
+            self.header[_CLOCK] += 1
+            self.table[entry_idx] = (
+                key_hash, 1, offset, array.nbytes, array.shape[0], array.shape[1],
+                _DTYPES.index(array.dtype), self.header[_CLOCK]
+            )
+
+    def get_stats(self):
+        with self.lock:
+            used_mask = self.table['used'] == 1
+            return {
+                'hits': int(self.header[_HITS]),
+                'misses': int(self.header[_MISSES]),
+                'evictions': int(self.header[_EVICTIONS]),
+                'num_frames': int(used_mask.sum()),
+                'bytes': int(self.table['nbytes'][used_mask].sum())
+            }
+
+
+def build_frame_cache(dataset_cfg, logger=None):
+    """
+    Returns:
+        frame_cache: FrameCache with the budget of FRAME_CACHE_MAX_MB, None if the cache is disabled
+    """
+    max_mb = dataset_cfg.get('FRAME_CACHE_MAX_MB', 0)
+    if max_mb <= 0:
+        return None
+    return FrameCache(
+        max_bytes=max_mb * 1024 ** 2, max_frames=dataset_cfg.get('FRAME_CACHE_MAX_FRAMES', None),
+        cache_dir=dataset_cfg.get('FRAME_CACHE_DIR', None), logger=logger
+    )
@@ -0,0 +1,362 @@
+"""
+Columnar, memory-mapped storage for the per-frame dataset infos.
+
+The pickled `*_infos_*.pkl` files hold a list of nested per-frame dicts, which every dataloader worker has to unpickle
+and keep as Python objects. This module flattens such a list into columns stored in a single file:
+    - fixed:  leaves with the same shape in every frame (scalars, calib matrices, image shapes), stored as (N, ...)
+    - ragged: per-object arrays (boxes, names, difficulty, num_points_in_gt, ...), stored concatenated along the
+              first axis together with an (N + 1) offset array
+    - object: everything else (None, lists, dicts of lists), pickled per frame together with an (N + 1) offset array
+The file is memory-mapped read-only, so the pages are shared between all processes reading the same file.
+
+Convert the existing info files with:
+    python -m pcdet.datasets.info_store --info_paths ../data/kitti/kitti_infos_train.pkl ../data/kitti/kitti_infos_val.pkl
+"""
+
+import json
+import mmap
+import pickle
+from copy import deepcopy
+from pathlib import Path
+
+import numpy as np
+
+COLUMNAR_INFO_SUFFIX = '.infostore'
+
+_MAGIC = b'PCDETINF'
+_ALIGNMENT = 64
+
+
+def _flatten_info(info, prefix=(), leaves=None):
+    if leaves is None:
+        leaves = {}
+    for key, val in info.items():
+        if isinstance(val, dict) and len(val) > 0 and all(isinstance(k, str) for k in val.keys()):
+            _flatten_info(val, prefix + (key,), leaves)
+        else:
+            leaves[prefix + (key,)] = val
+    return leaves
+
+
+def _is_scalar(val):
+    return isinstance(val, (bool, int, float, str, np.bool_, np.integer, np.floating, np.str_))
+
+
+def _build_column(values, mask):
+    """
+    Args:
+        values: list of the leaf values of the frames that have this leaf
+        mask: (N), bool, frames that have this leaf
+    Returns:
+        column: dict with the column description and the numpy arrays to store
+    """
+    column = None
+    if mask.all() and all(_is_scalar(v) for v in values):
+        kinds = set(np.asarray(v).dtype.kind for v in values)
+        if len(kinds) == 1 and kinds.pop() in 'biufU':
+            column = {'kind': 'fixed', 'scalar': True, 'arrays': {'data': np.array(values)}}
+
+    elif all(isinstance(v, np.ndarray) and v.ndim > 0 and v.dtype.kind in 'biufUS' for v in values):
+        same_dtype = len(set(v.dtype for v in values)) == 1 or all(v.dtype.kind in 'US' for v in values)
+        trailing = set(v.shape[1:] for v in values if v.shape[0] > 0)
+        if same_dtype and len(trailing) <= 1:
+            trailing = trailing.pop() if len(trailing) == 1 else values[0].shape[1:]
+            arrays = [v.reshape((0,) + trailing) if v.shape[0] == 0 else v for v in values]
+            dtype = np.result_type(*arrays)
+            if len(set(v.shape for v in arrays)) == 1:
+                data = np.zeros((mask.shape[0],) + arrays[0].shape, dtype=dtype)
+                data[mask] = np.stack(arrays, axis=0)
+                column = {'kind': 'fixed', 'scalar': False, 'arrays': {'data': data}}
+            else:
+                lengths = np.zeros(mask.shape[0], dtype=np.int64)
+                lengths[mask] = [v.shape[0] for v in arrays]
+                offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+                data = np.concatenate(arrays, axis=0).astype(dtype, copy=False)
+                column = {'kind': 'ragged', 'arrays': {'data': data, 'offsets': offsets}}
+
+    if column is None:
+        blobs = [b''] * mask.shape[0]
+        for k, v in zip(mask.nonzero()[0], values):
+            blobs[k] = pickle.dumps(v)
+        lengths = np.array([len(b) for b in blobs], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        data = np.frombuffer(b''.join(blobs), dtype=np.uint8)
+        column = {'kind': 'object', 'arrays': {'data': data, 'offsets': offsets}}
+
+    if not mask.all():
+        column['arrays']['present'] = mask.astype(np.uint8)
+    return column
+
+
+def write_columnar_infos(infos, save_path):
+    """
+    Args:
+        infos: list of per-frame info dicts, as stored in the pickled info files
+        save_path: path of the columnar info file to write
+    """
+    leaves_list = [_flatten_info(info) for info in infos]
+    keys = []
+    for leaves in leaves_list:
+        for key in leaves.keys():
+            if key not in keys:
+                keys.append(key)
+
+    header = {'num_frames': len(infos), 'columns': []}
+    blobs = []
+    cur_offset = 0
+    for key in keys:
+        mask = np.array([key in leaves for leaves in leaves_list], dtype=np.bool_)
+        column = _build_column([leaves[key] for leaves in leaves_list if key in leaves], mask)
+        desc = {'key': list(key), 'kind': column['kind'], 'scalar': column.get('scalar', False), 'arrays': {}}
+        for name, arr in column['arrays'].items():
+            arr = np.ascontiguousarray(arr)
+            desc['arrays'][name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': cur_offset}
+            blobs.append(arr.tobytes())
+            cur_offset += len(blobs[-1])
+            padding = (-cur_offset) % _ALIGNMENT
+            blobs.append(b'\0' * padding)
+            cur_offset += padding
+        header['columns'].append(desc)
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = len(_MAGIC) + 8 + len(header_bytes)
+    data_start += (-data_start) % _ALIGNMENT
+    with open(save_path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(np.array([len(header_bytes)], dtype='<u8').tobytes())
+        f.write(header_bytes)
+        f.write(b'\0' * (data_start - len(_MAGIC) - 8 - len(header_bytes)))
+        for blob in blobs:
+            f.write(blob)
+
+
+class ColumnarInfoFile(object):
+    """
+    Read-only view of one columnar info file. Frames are rebuilt lazily from the memory map.
+    """
+    def __init__(self, info_path):
+        self.info_path = str(info_path)
+        self._open()
+
+    def _open(self):
+        with open(self.info_path, 'rb') as f:
+            assert f.read(len(_MAGIC)) == _MAGIC, 'Not a columnar info file: %s' % self.info_path
+            header_len = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+            header = json.loads(f.read(header_len).decode('utf-8'))
+            data_start = len(_MAGIC) + 8 + header_len
+            data_start += (-data_start) % _ALIGNMENT
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.num_frames = header['num_frames']
+        self.columns = []
+        for desc in header['columns']:
+            arrays = {}
+            for name, arr_desc in desc['arrays'].items():
+                dtype = np.dtype(arr_desc['dtype'])
+                shape = tuple(arr_desc['shape'])
+                count = int(np.prod(shape)) if len(shape) > 0 else 1
+                arrays[name] = np.frombuffer(
+                    self._mmap, dtype=dtype, count=count, offset=data_start + arr_desc['offset']
+                ).reshape(shape)
+            self.columns.append({
+                'key': tuple(desc['key']), 'kind': desc['kind'], 'scalar': desc['scalar'], 'arrays': arrays
+            })
+
+    def __getstate__(self):
+        return {'info_path': self.info_path}
+
+    def __setstate__(self, d):
+        self.info_path = d['info_path']
+        self._open()
+
+    def __len__(self):
+        return self.num_frames
+
+    def has_key(self, key):
+        """
+        Args:
+            key: top-level key of the info dicts, like 'annos'
+        Returns:
+            mask: (N), bool, whether the frame has this key
+        """
+        mask = np.zeros(self.num_frames, dtype=np.bool_)
+        for column in self.columns:
+            if column['key'][0] != key:
+                continue
+            if 'present' in column['arrays']:
+                mask |= column['arrays']['present'].astype(np.bool_)
+            else:
+                mask[:] = True
+        return mask
+
+    def get(self, index, copy=False):
+        """
+        Args:
+            index: int, frame index in this file
+            copy: bool, return writable copies instead of read-only views of the memory map
+        Returns:
+            info: the per-frame info dict
+        """
+        info = {}
+        for column in self.columns:
+            arrays = column['arrays']
+            if 'present' in arrays and not arrays['present'][index]:
+                continue
+            if column['kind'] == 'fixed':
+                val = arrays['data'][index]
+                if column['scalar']:
+                    val = val.item()
+                elif copy:
+                    val = val.copy()
+            elif column['kind'] == 'ragged':
+                offsets = arrays['offsets']
+                val = arrays['data'][offsets[index]:offsets[index + 1]]
+                if copy:
+                    val = val.copy()
+            else:
+                offsets = arrays['offsets']
+                val = pickle.loads(arrays['data'][offsets[index]:offsets[index + 1]].tobytes())
+
+            cur_dict = info
+            for sub_key in column['key'][:-1]:
+                cur_dict = cur_dict.setdefault(sub_key, {})
+            cur_dict[column['key'][-1]] = val
+        return info
+
+
+class InfoStore(object):
+    """
+    List-like sequence of per-frame infos backed by one or more sources, each either a columnar info file or a plain
+    list of info dicts. Selecting, slicing and merging only touch the (source, frame) index arrays.
+    """
+    def __init__(self, sources, source_ids=None, frame_ids=None):
+        self.sources = sources
+        if source_ids is None:
+            source_ids = np.concatenate(
+                [np.full(len(src), k, dtype=np.int32) for k, src in enumerate(sources)] + [np.zeros(0, np.int32)]
+            )
+            frame_ids = np.concatenate(
+                [np.arange(len(src), dtype=np.int64) for src in sources] + [np.zeros(0, np.int64)]
+            )
+        self.source_ids = source_ids
+        self.frame_ids = frame_ids
+
+    def __len__(self):
+        return self.source_ids.shape[0]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.get(index)
+
+    def __getitem__(self, index):
+        if isinstance(index, (slice, list, np.ndarray)):
+            return self.select(np.arange(len(self))[index])
+        return self.get(index)
+
+    def get(self, index, copy=False):
+        """
+        Args:
+            index: int
+            copy: bool, return an info dict that can be modified in place without touching the store
+        Returns:
+            info: dict
+        """
+        source = self.sources[self.source_ids[index]]
+        frame_id = int(self.frame_ids[index])
+        if isinstance(source, ColumnarInfoFile):
+            return source.get(frame_id, copy=copy)
+        return deepcopy(source[frame_id]) if copy else source[frame_id]
+
+    def select(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        return InfoStore(self.sources, self.source_ids[indices], self.frame_ids[indices])
+
+    def has_key(self, key):
+        mask = np.zeros(len(self), dtype=np.bool_)
+        for k, source in enumerate(self.sources):
+            cur_mask = self.source_ids == k
+            if isinstance(source, ColumnarInfoFile):
+                mask[cur_mask] = source.has_key(key)[self.frame_ids[cur_mask]]
+            else:
+                mask[cur_mask] = [key in source[i] for i in self.frame_ids[cur_mask]]
+        return mask
+
+
+def load_infos(info_path):
+    """
+    Args:
+        info_path: path of a pickled info file or a columnar info file
+    Returns:
+        infos: list of info dicts for pickled files, InfoStore for columnar files
+    """
+    info_path = Path(info_path)
+    if info_path.suffix == COLUMNAR_INFO_SUFFIX:
+        return InfoStore([ColumnarInfoFile(info_path)])
+    with open(info_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def merge_infos(*infos_list):
+    """
+    Concatenates info lists and/or info stores. Returns a plain list if no info store is involved.
+    """
+    if not any(isinstance(infos, InfoStore) for infos in infos_list):
+        return [info for infos in infos_list for info in infos]
+
+    sources, source_ids, frame_ids = [], [], []
+    for infos in infos_list:
+        if isinstance(infos, InfoStore):
+            source_ids.append(infos.source_ids.astype(np.int32) + len(sources))
+            frame_ids.append(infos.frame_ids)
+            sources.extend(infos.sources)
+        elif len(infos) > 0:
+            source_ids.append(np.full(len(infos), len(sources), dtype=np.int32))
+            frame_ids.append(np.arange(len(infos), dtype=np.int64))
+            sources.append(list(infos))
+    return InfoStore(sources, np.concatenate(source_ids), np.concatenate(frame_ids))
+
+
+def select_infos(infos, indices):
+    if isinstance(infos, InfoStore):
+        return infos.select(indices)
+    return [infos[i] for i in indices]
+
+
+def filter_infos_by_key(infos, key):
+    """
+    Keeps the frames that have `key`, like list(filter(lambda info: key in info, infos))
+    """
+    if isinstance(infos, InfoStore):
+        return infos.select(infos.has_key(key).nonzero()[0])
+    return [info for info in infos if key in info]
+
+
+def get_info_copy(infos, index):
+    """
+    Returns an info dict that can be modified in place. Pickled infos are deep-copied, columnar infos are rebuilt from
+    copies of the per-frame slices of the memory map.
+    """
+    if isinstance(infos, InfoStore):
+        return infos.get(index, copy=True)
+    return deepcopy(infos[index])
+
+
+def convert_info_file(info_path, save_path=None):
+    info_path = Path(info_path)
+    save_path = Path(save_path) if save_path is not None else info_path.with_suffix(COLUMNAR_INFO_SUFFIX)
+    with open(info_path, 'rb') as f:
+        infos = pickle.load(f)
+    write_columnar_infos(infos, save_path)
+    return save_path
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='convert pickled info files to columnar info files')
+    parser.add_argument('--info_paths', type=str, nargs='+', required=True, help='pickled info files to convert')
+    args = parser.parse_args()
+
+    for cur_info_path in args.info_paths:
+        cur_save_path = convert_info_file(cur_info_path)
+        print('Columnar info file is saved to %s' % cur_save_path)
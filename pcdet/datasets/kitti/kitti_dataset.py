@@ -7,6 +7,7 @@ from skimage import io
 from . import kitti_utils
 from ...ops.roiaware_pool3d import roiaware_pool3d_utils
 from ...utils import box_utils, calibration_kitti, common_utils, object3d_kitti
+from .. import info_store
 from ..dataset import DatasetTemplate
 
 
@@ -38,14 +39,13 @@ class KittiDataset(DatasetTemplate):
         kitti_infos = []
 
         for info_path in self.dataset_cfg.INFO_PATH[mode]:
-            info_path = self.root_path / info_path
+            info_path = self.get_info_path(self.root_path / info_path)
             if not info_path.exists():
                 continue
-            with open(info_path, 'rb') as f:
-                infos = pickle.load(f)
-                kitti_infos.extend(infos)
+            kitti_infos.append(info_store.load_infos(info_path))
 
-        self.kitti_infos.extend(kitti_infos)
+        kitti_infos = info_store.merge_infos(*kitti_infos)
+        self.kitti_infos = info_store.merge_infos(self.kitti_infos, kitti_infos)
 
         if self.logger is not None:
             self.logger.info('Total samples for KITTI dataset: %d' % (len(kitti_infos)))
@@ -63,7 +63,9 @@ class KittiDataset(DatasetTemplate):
     def get_lidar(self, idx):
         lidar_file = self.root_split_path / 'velodyne' / ('%s.bin' % idx)
         assert lidar_file.exists()
-        return np.fromfile(str(lidar_file), dtype=np.float32).reshape(-1, 4)
+        return self.get_cached_frame(
+            str(lidar_file), lambda: np.fromfile(str(lidar_file), dtype=np.float32).reshape(-1, 4)
+        )
 
     def get_image(self, idx):
         """
@@ -226,9 +228,12 @@ class KittiDataset(DatasetTemplate):
 
         database_save_path = Path(self.root_path) / ('gt_database' if split == 'train' else ('gt_database_%s' % split))
         db_info_save_path = Path(self.root_path) / ('kitti_dbinfos_%s.pkl' % split)
+        db_data_save_path = Path(self.root_path) / ('kitti_gt_database_%s_global.npy' % split)
 
         database_save_path.mkdir(parents=True, exist_ok=True)
         all_db_infos = {}
+        point_offset_cnt = 0
+        stacked_gt_points = []
 
         with open(info_path, 'rb') as f:
             infos = pickle.load(f)
@@ -263,6 +268,10 @@ class KittiDataset(DatasetTemplate):
                     db_info = {'name': names[i], 'path': db_path, 'image_idx': sample_idx, 'gt_idx': i,
                                'box3d_lidar': gt_boxes[i], 'num_points_in_gt': gt_points.shape[0],
                                'difficulty': difficulty[i], 'bbox': bbox[i], 'score': annos['score'][i]}
+                    # it will be used if you choose to use shared memory or memory-mapped reads for gt sampling
+                    stacked_gt_points.append(gt_points)
+                    db_info['global_data_offset'] = [point_offset_cnt, point_offset_cnt + gt_points.shape[0]]
+                    point_offset_cnt += gt_points.shape[0]
                     if names[i] in all_db_infos:
                         all_db_infos[names[i]].append(db_info)
                     else:
@@ -273,8 +282,12 @@ class KittiDataset(DatasetTemplate):
         with open(db_info_save_path, 'wb') as f:
             pickle.dump(all_db_infos, f)
 
+        # it will be used if you choose to use shared memory or memory-mapped reads for gt sampling
+        stacked_gt_points = np.concatenate(stacked_gt_points, axis=0)
+        np.save(db_data_save_path, stacked_gt_points)
+
     @staticmethod
-    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None):
+    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None, result_writer=None):
         """
         Args:
             batch_dict:
@@ -285,6 +298,7 @@ class KittiDataset(DatasetTemplate):
                 pred_labels: (N), Tensor
             class_names:
             output_path:
+            result_writer:
 
         Returns:
 
@@ -335,18 +349,10 @@ class KittiDataset(DatasetTemplate):
 
             if output_path is not None:
                 cur_det_file = output_path / ('%s.txt' % frame_id)
-                with open(cur_det_file, 'w') as f:
-                    bbox = single_pred_dict['bbox']
-                    loc = single_pred_dict['location']
-                    dims = single_pred_dict['dimensions']  # lhw -> hwl
-
-                    for idx in range(len(bbox)):
-                        print('%s -1 -1 %.4f %.4f %.4f %.4f %.4f %.4f %.4f %.4f %.4f %.4f %.4f %.4f %.4f'
-                              % (single_pred_dict['name'][idx], single_pred_dict['alpha'][idx],
-                                 bbox[idx][0], bbox[idx][1], bbox[idx][2], bbox[idx][3],
-                                 dims[idx][1], dims[idx][2], dims[idx][0], loc[idx][0],
-                                 loc[idx][1], loc[idx][2], single_pred_dict['rotation_y'][idx],
-                                 single_pred_dict['score'][idx]), file=f)
+                if result_writer is not None:
+                    result_writer.submit(kitti_utils.write_prediction_file, cur_det_file, single_pred_dict)
+                else:
+                    kitti_utils.write_prediction_file(cur_det_file, single_pred_dict)
 
         return annos
 
@@ -373,7 +379,7 @@ class KittiDataset(DatasetTemplate):
         if self._merge_all_iters_to_one_epoch:
             index = index % len(self.kitti_infos)
 
-        info = copy.deepcopy(self.kitti_infos[index])
+        info = info_store.get_info_copy(self.kitti_infos, index)
 
         sample_idx = info['point_cloud']['lidar_idx']
         img_shape = info['image']['image_shape']
@@ -337,6 +337,125 @@ def fused_compute_statistics(overlaps,
         dc_num += dc_nums[i]
 
 
+@numba.jit(nopython=True, parallel=True, cache=True)
+def parallel_compute_thresholds(overlaps,
+                                overlap_offsets,
+                                gt_offsets,
+                                dt_offsets,
+                                dc_offsets,
+                                gt_datas,
+                                dt_datas,
+                                dontcares,
+                                ignored_gts,
+                                ignored_dets,
+                                metric,
+                                min_overlap):
+    """scores of the matched detections of all examples, in example order.
+    Args:
+        overlaps: flattened (num_dt, num_gt) overlaps of all examples,
+            example i is overlap_offsets[i]:overlap_offsets[i + 1]
+        gt_offsets/dt_offsets/dc_offsets: (num_examples + 1), offsets of
+            the examples in the concatenated datas
+    """
+    num_examples = gt_offsets.shape[0] - 1
+    example_thresholds = np.zeros((gt_offsets[-1], ))
+    num_thresholds = np.zeros((num_examples, ), dtype=np.int64)
+    for i in numba.prange(num_examples):
+        gt_start, gt_end = gt_offsets[i], gt_offsets[i + 1]
+        dt_start, dt_end = dt_offsets[i], dt_offsets[i + 1]
+        overlap = overlaps[overlap_offsets[i]:overlap_offsets[i + 1]].reshape(
+            (dt_end - dt_start, gt_end - gt_start))
+        _, _, _, _, thresholds = compute_statistics_jit(
+            overlap,
+            gt_datas[gt_start:gt_end],
+            dt_datas[dt_start:dt_end],
+            ignored_gts[gt_start:gt_end],
+            ignored_dets[dt_start:dt_end],
+            dontcares[dc_offsets[i]:dc_offsets[i + 1]],
+            metric,
+            min_overlap=min_overlap,
+            thresh=0.0,
+            compute_fp=False)
+        example_thresholds[gt_start:gt_start + thresholds.shape[0]] = thresholds
+        num_thresholds[i] = thresholds.shape[0]
+
+    all_thresholds = np.zeros((num_thresholds.sum(), ))
+    thresh_idx = 0
+    for i in range(num_examples):
+        all_thresholds[thresh_idx:thresh_idx + num_thresholds[i]] = \
+            example_thresholds[gt_offsets[i]:gt_offsets[i] + num_thresholds[i]]
+        thresh_idx += num_thresholds[i]
+    return all_thresholds
+
+
+@numba.jit(nopython=True, parallel=True, cache=True)
+def parallel_compute_statistics(overlaps,
+                                overlap_offsets,
+                                gt_offsets,
+                                dt_offsets,
+                                dc_offsets,
+                                gt_datas,
+                                dt_datas,
+                                dontcares,
+                                ignored_gts,
+                                ignored_dets,
+                                metric,
+                                min_overlap,
+                                thresholds,
+                                compute_aos=False):
+    """same as fused_compute_statistics over all examples, the examples run
+    in parallel and are summed up in example order afterwards. the result of
+    an example only depends on which of its detections are above the score
+    threshold, so it is only recomputed when a threshold lets more through.
+    Returns:
+        pr: (num_thresholds, 4), tp/fp/fn/similarity
+    """
+    num_examples = gt_offsets.shape[0] - 1
+    example_pr = np.zeros((num_examples, thresholds.shape[0], 4))
+    for i in numba.prange(num_examples):
+        gt_start, gt_end = gt_offsets[i], gt_offsets[i + 1]
+        dt_start, dt_end = dt_offsets[i], dt_offsets[i + 1]
+        overlap = overlaps[overlap_offsets[i]:overlap_offsets[i + 1]].reshape(
+            (dt_end - dt_start, gt_end - gt_start))
+        dt_data = dt_datas[dt_start:dt_end]
+        ignored_det = ignored_dets[dt_start:dt_end]
+        last_num_above = -1
+        tp, fp, fn, similarity = 0, 0, 0, 0.0
+        for t in range(thresholds.shape[0]):
+            num_above = 0
+            for j in range(dt_end - dt_start):
+                if ignored_det[j] != -1 and not dt_data[j, -1] < thresholds[t]:
+                    num_above += 1
+            if num_above != last_num_above:
+                tp, fp, fn, similarity, _ = compute_statistics_jit(
+                    overlap,
+                    gt_datas[gt_start:gt_end],
+                    dt_data,
+                    ignored_gts[gt_start:gt_end],
+                    ignored_det,
+                    dontcares[dc_offsets[i]:dc_offsets[i + 1]],
+                    metric,
+                    min_overlap=min_overlap,
+                    thresh=thresholds[t],
+                    compute_fp=True,
+                    compute_aos=compute_aos)
+                last_num_above = num_above
+            example_pr[i, t, 0] = tp
+            example_pr[i, t, 1] = fp
+            example_pr[i, t, 2] = fn
+            example_pr[i, t, 3] = similarity
+
+    pr = np.zeros((thresholds.shape[0], 4))
+    for i in range(num_examples):
+        for t in range(thresholds.shape[0]):
+            pr[t, 0] += example_pr[i, t, 0]
+            pr[t, 1] += example_pr[i, t, 1]
+            pr[t, 2] += example_pr[i, t, 2]
+            if example_pr[i, t, 3] != -1:
+                pr[t, 3] += example_pr[i, t, 3]
+    return pr
+
+
 def calculate_iou_partly(gt_annos, dt_annos, metric, num_parts=50):
     """fast iou algorithm. this function can be used independently to
     do result analysis. Must be used in CAMERA coordinate system.
@@ -445,6 +564,30 @@ def _prepare_data(gt_annos, dt_annos, current_class, difficulty):
             total_dc_num, total_num_valid_gt)
 
 
+def prepare_all_data(gt_annos, dt_annos, current_classes, difficultys):
+    """_prepare_data of every (class, difficulty), concatenated over the
+    examples. it doesn't depend on the metric, so do_eval computes it once
+    for the bbox, bev and 3d evaluation.
+    Returns:
+        dict of (class, difficulty): (gt_datas, dt_datas, dontcares,
+            ignored_gts, ignored_dets, total_dc_num, total_num_valid_gt)
+    """
+    prepared_datas = {}
+    for current_class in current_classes:
+        for difficulty in difficultys:
+            rets = _prepare_data(gt_annos, dt_annos, current_class, difficulty)
+            (gt_datas_list, dt_datas_list, ignored_gts, ignored_dets,
+             dontcares, total_dc_num, total_num_valid_gt) = rets
+            prepared_datas[(current_class, difficulty)] = (
+                np.concatenate(gt_datas_list, 0),
+                np.concatenate(dt_datas_list, 0),
+                np.concatenate(dontcares, 0),
+                np.concatenate(ignored_gts, 0),
+                np.concatenate(ignored_dets, 0),
+                total_dc_num, total_num_valid_gt)
+    return prepared_datas
+
+
 def eval_class(gt_annos,
                dt_annos,
                current_classes,
@@ -452,7 +595,8 @@ def eval_class(gt_annos,
                metric,
                min_overlaps,
                compute_aos=False,
-               num_parts=100):
+               num_parts=100,
+               prepared_datas=None):
     """Kitti eval. support 2d/bev/3d/aos eval. support 0.5:0.05:0.95 coco AP.
     Args:
         gt_annos: dict, must from get_label_annos() in kitti_common.py
@@ -462,16 +606,22 @@ def eval_class(gt_annos,
         metric: eval type. 0: bbox, 1: bev, 2: 3d
         min_overlaps: float, min overlap. format: [num_overlap, metric, class].
         num_parts: int. a parameter for fast calculate algorithm
+        prepared_datas: dict, optional result of prepare_all_data()
 
     Returns:
         dict of recall, precision and aos
     """
     assert len(gt_annos) == len(dt_annos)
-    num_examples = len(gt_annos)
-    split_parts = get_split_parts(num_examples, num_parts)
+    if prepared_datas is None:
+        prepared_datas = prepare_all_data(gt_annos, dt_annos, current_classes, difficultys)
 
     rets = calculate_iou_partly(dt_annos, gt_annos, metric, num_parts)
     overlaps, parted_overlaps, total_dt_num, total_gt_num = rets
+    overlaps_flat = np.concatenate(
+        [overlap.ravel() for overlap in overlaps] + [np.zeros(0)], 0).astype(np.float64)
+    overlap_offsets = np.cumsum([0] + [overlap.size for overlap in overlaps])
+    gt_offsets = np.cumsum(np.concatenate([[0], total_gt_num]))
+    dt_offsets = np.cumsum(np.concatenate([[0], total_dt_num]))
     N_SAMPLE_PTS = 41
     num_minoverlap = len(min_overlaps)
     num_class = len(current_classes)
@@ -483,57 +633,18 @@ def eval_class(gt_annos,
     aos = np.zeros([num_class, num_difficulty, num_minoverlap, N_SAMPLE_PTS])
     for m, current_class in enumerate(current_classes):
         for l, difficulty in enumerate(difficultys):
-            rets = _prepare_data(gt_annos, dt_annos, current_class, difficulty)
-            (gt_datas_list, dt_datas_list, ignored_gts, ignored_dets,
-             dontcares, total_dc_num, total_num_valid_gt) = rets
+            (gt_datas, dt_datas, dontcares, ignored_gts, ignored_dets,
+             total_dc_num, total_num_valid_gt) = prepared_datas[(current_class, difficulty)]
+            dc_offsets = np.cumsum(np.concatenate([[0], total_dc_num]))
+            datas = (overlaps_flat, overlap_offsets, gt_offsets, dt_offsets,
+                     dc_offsets, gt_datas, dt_datas, dontcares, ignored_gts,
+                     ignored_dets, metric)
             for k, min_overlap in enumerate(min_overlaps[:, metric, m]):
-                thresholdss = []
-                for i in range(len(gt_annos)):
-                    rets = compute_statistics_jit(
-                        overlaps[i],
-                        gt_datas_list[i],
-                        dt_datas_list[i],
-                        ignored_gts[i],
-                        ignored_dets[i],
-                        dontcares[i],
-                        metric,
-                        min_overlap=min_overlap,
-                        thresh=0.0,
-                        compute_fp=False)
-                    tp, fp, fn, similarity, thresholds = rets
-                    thresholdss += thresholds.tolist()
-                thresholdss = np.array(thresholdss)
+                thresholdss = parallel_compute_thresholds(*datas, min_overlap)
                 thresholds = get_thresholds(thresholdss, total_num_valid_gt)
                 thresholds = np.array(thresholds)
-                pr = np.zeros([len(thresholds), 4])
-                idx = 0
-                for j, num_part in enumerate(split_parts):
-                    gt_datas_part = np.concatenate(
-                        gt_datas_list[idx:idx + num_part], 0)
-                    dt_datas_part = np.concatenate(
-                        dt_datas_list[idx:idx + num_part], 0)
-                    dc_datas_part = np.concatenate(
-                        dontcares[idx:idx + num_part], 0)
-                    ignored_dets_part = np.concatenate(
-                        ignored_dets[idx:idx + num_part], 0)
-                    ignored_gts_part = np.concatenate(
-                        ignored_gts[idx:idx + num_part], 0)
-                    fused_compute_statistics(
-                        parted_overlaps[j],
-                        pr,
-                        total_gt_num[idx:idx + num_part],
-                        total_dt_num[idx:idx + num_part],
-                        total_dc_num[idx:idx + num_part],
-                        gt_datas_part,
-                        dt_datas_part,
-                        dc_datas_part,
-                        ignored_gts_part,
-                        ignored_dets_part,
-                        metric,
-                        min_overlap=min_overlap,
-                        thresholds=thresholds,
-                        compute_aos=compute_aos)
-                    idx += num_part
+                pr = parallel_compute_statistics(
+                    *datas, min_overlap, thresholds, compute_aos)
                 for i in range(len(thresholds)):
                     recall[m, l, k, i] = pr[i, 0] / (pr[i, 0] + pr[i, 2])
                     precision[m, l, k, i] = pr[i, 0] / (pr[i, 0] + pr[i, 1])
@@ -584,8 +695,9 @@ def do_eval(gt_annos,
             PR_detail_dict=None):
     # min_overlaps: [num_minoverlap, metric, num_class]
     difficultys = [0, 1, 2]
+    prepared_datas = prepare_all_data(gt_annos, dt_annos, current_classes, difficultys)
     ret = eval_class(gt_annos, dt_annos, current_classes, difficultys, 0,
-                     min_overlaps, compute_aos)
+                     min_overlaps, compute_aos, prepared_datas=prepared_datas)
     # ret: [num_class, num_diff, num_minoverlap, num_sample_points]
     mAP_bbox = get_mAP(ret["precision"])
     mAP_bbox_R40 = get_mAP_R40(ret["precision"])
@@ -602,7 +714,7 @@ def do_eval(gt_annos,
             PR_detail_dict['aos'] = ret['orientation']
 
     ret = eval_class(gt_annos, dt_annos, current_classes, difficultys, 1,
-                     min_overlaps)
+                     min_overlaps, prepared_datas=prepared_datas)
     mAP_bev = get_mAP(ret["precision"])
     mAP_bev_R40 = get_mAP_R40(ret["precision"])
 
@@ -610,7 +722,7 @@ def do_eval(gt_annos,
         PR_detail_dict['bev'] = ret['precision']
 
     ret = eval_class(gt_annos, dt_annos, current_classes, difficultys, 2,
-                     min_overlaps)
+                     min_overlaps, prepared_datas=prepared_datas)
     mAP_3d = get_mAP(ret["precision"])
     mAP_3d_R40 = get_mAP_R40(ret["precision"])
     if PR_detail_dict is not None:
@@ -63,4 +63,26 @@ def calib_to_matricies(calib):
     R0 = np.vstack((R0, np.array([0, 0, 0, 1], dtype=np.float32)))  # (4, 4)
     V2R = R0 @ V2C
     P2 = calib.P2
-    return V2R, P2
\ No newline at end of file
+    return V2R, P2
+
+
+def write_prediction_file(file_path, pred_dict):
+    """
+    Writes the predictions of one frame in the KITTI label format, the whole frame is formatted at once
+    Args:
+        file_path:
+        pred_dict: dict of generate_prediction_dicts, name, alpha, bbox, dimensions (lhw), location, rotation_y, score
+    """
+    bbox = pred_dict['bbox']
+    loc = pred_dict['location']
+    dims = pred_dict['dimensions']  # lhw -> hwl
+    values = np.stack([
+        pred_dict['alpha'], bbox[:, 0], bbox[:, 1], bbox[:, 2], bbox[:, 3], dims[:, 1], dims[:, 2], dims[:, 0],
+        loc[:, 0], loc[:, 1], loc[:, 2], pred_dict['rotation_y'], pred_dict['score']
+    ], axis=1).astype(np.float64)
+    rows = np.empty((values.shape[0], 14), dtype=object)
+    rows[:, 0] = pred_dict['name']
+    rows[:, 1:] = values
+    row_format = '%s -1 -1' + ' %.4f' * 13 + '\n'
+    with open(file_path, 'w') as f:
+        f.write((row_format * rows.shape[0]) % tuple(rows.ravel().tolist()))
@@ -39,12 +39,16 @@ class LyftDataset(DatasetTemplate):
         mask = ~((np.abs(points[:, 0]) < center_radius*1.5) & (np.abs(points[:, 1]) < center_radius))
         return points[mask]
 
+    @staticmethod
+    def load_lidar_file(lidar_path):
+        points = np.fromfile(str(lidar_path), dtype=np.float32, count=-1)
+        if points.shape[0] % 5 != 0:
+            points = points[: points.shape[0] - (points.shape[0] % 5)]
+        return points.reshape([-1, 5])[:, :4]
+
     def get_sweep(self, sweep_info):
         lidar_path = self.root_path / sweep_info['lidar_path']
-        points_sweep = np.fromfile(str(lidar_path), dtype=np.float32, count=-1)
-        if points_sweep.shape[0] % 5 != 0:
-            points_sweep = points_sweep[: points_sweep.shape[0] - (points_sweep.shape[0] % 5)]
-        points_sweep = points_sweep.reshape([-1, 5])[:, :4]
+        points_sweep = self.get_cached_frame(str(lidar_path), lambda: self.load_lidar_file(lidar_path))
 
         points_sweep = self.remove_ego_points(points_sweep).T
         if sweep_info['transform_matrix'] is not None:
@@ -58,10 +62,7 @@ class LyftDataset(DatasetTemplate):
     def get_lidar_with_sweeps(self, index, max_sweeps=1):
         info = self.infos[index]
         lidar_path = self.root_path / info['lidar_path']
-        points = np.fromfile(str(lidar_path), dtype=np.float32, count=-1)
-        if points.shape[0] % 5 != 0:
-            points = points[: points.shape[0] - (points.shape[0] % 5)]
-        points = points.reshape([-1, 5])[:, :4]
+        points = self.get_cached_frame(str(lidar_path), lambda: self.load_lidar_file(lidar_path))
 
         sweep_points_list = [points]
         sweep_times_list = [np.zeros((points.shape[0], 1))]
@@ -106,7 +107,7 @@ class LyftDataset(DatasetTemplate):
 
         return data_dict
 
-    def generate_prediction_dicts(self, batch_dict, pred_dicts, class_names, output_path=None):
+    def generate_prediction_dicts(self, batch_dict, pred_dicts, class_names, output_path=None, result_writer=None):
         """
         Args:
             batch_dict:
@@ -117,6 +118,7 @@ class LyftDataset(DatasetTemplate):
                 pred_labels: (N), Tensor
             class_names:
             output_path:
+            result_writer:
         Returns:
         """
         def get_template_prediction(num_samples):
@@ -208,9 +210,12 @@ class LyftDataset(DatasetTemplate):
 
         database_save_path = self.root_path / f'gt_database'
         db_info_save_path = self.root_path / f'lyft_dbinfos_{max_sweeps}sweeps.pkl'
+        db_data_save_path = self.root_path / f'lyft_gt_database_{max_sweeps}sweeps_global.npy'
 
         database_save_path.mkdir(parents=True, exist_ok=True)
         all_db_infos = {}
+        point_offset_cnt = 0
+        stacked_gt_points = []
 
         for idx in tqdm(range(len(self.infos))):
             sample_idx = idx
@@ -237,6 +242,10 @@ class LyftDataset(DatasetTemplate):
                     db_path = str(filepath.relative_to(self.root_path))  # gt_database/xxxxx.bin
                     db_info = {'name': gt_names[i], 'path': db_path, 'image_idx': sample_idx, 'gt_idx': i,
                                'box3d_lidar': gt_boxes[i], 'num_points_in_gt': gt_points.shape[0]}
+                    # it will be used if you choose to use shared memory or memory-mapped reads for gt sampling
+                    stacked_gt_points.append(gt_points)
+                    db_info['global_data_offset'] = [point_offset_cnt, point_offset_cnt + gt_points.shape[0]]
+                    point_offset_cnt += gt_points.shape[0]
                     if gt_names[i] in all_db_infos:
                         all_db_infos[gt_names[i]].append(db_info)
                     else:
@@ -247,6 +256,10 @@ class LyftDataset(DatasetTemplate):
         with open(db_info_save_path, 'wb') as f:
             pickle.dump(all_db_infos, f)
 
+        # it will be used if you choose to use shared memory or memory-mapped reads for gt sampling
+        stacked_gt_points = np.concatenate(stacked_gt_points, axis=0)
+        np.save(db_data_save_path, stacked_gt_points)
+
 
 def create_lyft_info(version, data_path, save_path, split, max_sweeps=10):
     from lyft_dataset_sdk.lyftdataset import LyftDataset
@@ -46,6 +46,7 @@ import json
 from collections import defaultdict
 from pathlib import Path
 
+import numba
 import numpy as np
 from pyquaternion import Quaternion
 from shapely.geometry import Polygon
@@ -269,55 +270,166 @@ def get_ious(gt_boxes, predicted_box):
     return [predicted_box.get_iou(x) for x in gt_boxes]
 
 
-def recall_precision(gt, predictions, iou_threshold_list):
-    num_gts = len(gt)
+def get_box_params(boxes):
+    """Center, size and ground orientation of a list of detection dicts, same as the ones of Box3D.
 
-    if num_gts == 0:
-        return -1, -1, -1
+    Args:
+        boxes: list of dicts with translation/size/rotation
 
-    image_gts = group_by_key(gt, "sample_token")
-    image_gts = wrap_in_box(image_gts)
+    Returns:
+        box_params: (N, 8), [x, y, z, width, length, height, cos, sin]
 
-    sample_gt_checked = {sample_token: np.zeros((len(boxes), len(iou_threshold_list))) for sample_token, boxes in image_gts.items()}
+    """
+    translations = np.array([x["translation"] for x in boxes], dtype=np.float64).reshape(-1, 3)
+    sizes = np.array([x["size"] for x in boxes], dtype=np.float64).reshape(-1, 3)
+    rotations = np.array([x["rotation"] for x in boxes], dtype=np.float64).reshape(-1, 4)
+
+    if np.any(np.isnan(translations)) or np.any(np.isnan(sizes)) or np.any(np.isnan(rotations)):
+        raise ValueError("Translation, size and rotation may not be NaN!")
+    assert np.all(sizes > 0)
+
+    # first column of the rotation matrix of the normalised quaternion [w, x, y, z]
+    rotations = rotations / np.linalg.norm(rotations, axis=1, keepdims=True)
+    w, x, y, z = rotations[:, 0], rotations[:, 1], rotations[:, 2], rotations[:, 3]
+    cos_angle = w * w + x * x - y * y - z * z
+    sin_angle = 2 * (x * y + w * z)
+
+    return np.concatenate([translations, sizes, cos_angle[:, None], sin_angle[:, None]], axis=1)
+
+
+@numba.jit(nopython=True)
+def get_ground_corners(box):
+    """Counter-clockwise corners of the base of the box, in the order of Box3D.calculate_ground_bbox_coords."""
+    center_x, center_y = box[0], box[1]
+    half_width, half_length = box[3] / 2, box[4] / 2
+    cos_angle, sin_angle = box[6], box[7]
+    corners = np.zeros((4, 2))
+    corners[0, 0] = center_x + half_length * cos_angle + half_width * sin_angle
+    corners[0, 1] = center_y + half_length * sin_angle - half_width * cos_angle
+    corners[1, 0] = center_x + half_length * cos_angle - half_width * sin_angle
+    corners[1, 1] = center_y + half_length * sin_angle + half_width * cos_angle
+    corners[2, 0] = center_x - half_length * cos_angle - half_width * sin_angle
+    corners[2, 1] = center_y - half_length * sin_angle + half_width * cos_angle
+    corners[3, 0] = center_x - half_length * cos_angle + half_width * sin_angle
+    corners[3, 1] = center_y - half_length * sin_angle - half_width * cos_angle
+    return corners
+
+
+@numba.jit(nopython=True)
+def convex_intersection_area(subject, clip):
+    """Area of the intersection of two counter-clockwise convex quadrilaterals (Sutherland-Hodgman clipping)."""
+    polygon = np.zeros((16, 2))
+    clipped = np.zeros((16, 2))
+    polygon[:4] = subject
+    num_points = 4
+    for i in range(4):
+        a_x, a_y = clip[i, 0], clip[i, 1]
+        edge_x, edge_y = clip[(i + 1) % 4, 0] - a_x, clip[(i + 1) % 4, 1] - a_y
+        num_clipped = 0
+        for j in range(num_points):
+            p_x, p_y = polygon[j, 0], polygon[j, 1]
+            q_x, q_y = polygon[(j + 1) % num_points, 0], polygon[(j + 1) % num_points, 1]
+            p_side = edge_x * (p_y - a_y) - edge_y * (p_x - a_x)
+            q_side = edge_x * (q_y - a_y) - edge_y * (q_x - a_x)
+            if p_side >= 0:
+                clipped[num_clipped, 0], clipped[num_clipped, 1] = p_x, p_y
+                num_clipped += 1
+            if (p_side >= 0) != (q_side >= 0):
+                t = p_side / (p_side - q_side)
+                clipped[num_clipped, 0] = p_x + t * (q_x - p_x)
+                clipped[num_clipped, 1] = p_y + t * (q_y - p_y)
+                num_clipped += 1
+        polygon, clipped = clipped, polygon
+        num_points = num_clipped
+        if num_points < 3:
+            return 0.0
+
+    area = 0.0
+    for j in range(num_points):
+        k = (j + 1) % num_points
+        area += polygon[j, 0] * polygon[k, 1] - polygon[k, 0] * polygon[j, 1]
+    return abs(area) / 2
+
+
+@numba.jit(nopython=True)
+def get_max_overlaps(pred_boxes, pred_sample_ids, gt_boxes, gt_offsets):
+    """Same as Box3D.get_iou of every prediction against the GTs of its sample.
 
-    predictions = sorted(predictions, key=lambda x: x["score"], reverse=True)
+    Args:
+        pred_boxes: (N, 8), from get_box_params
+        pred_sample_ids: (N), -1 for samples without GT
+        gt_boxes: (M, 8), grouped by sample, sample i is gt_offsets[i]:gt_offsets[i + 1]
+        gt_offsets: (num_samples + 1)
 
-    # go down dets and mark TPs and FPs
-    num_predictions = len(predictions)
-    tp = np.zeros((num_predictions, len(iou_threshold_list)))
-    fp = np.zeros((num_predictions, len(iou_threshold_list)))
+    Returns:
+        max_overlaps: (N), -inf for samples without GT
+        gt_argmax: (N), index into gt_boxes of the first GT with the max overlap
 
-    for prediction_index, prediction in enumerate(predictions):
-        predicted_box = Box3D(**prediction)
+    """
+    num_preds = pred_boxes.shape[0]
+    max_overlaps = np.full(num_preds, -np.inf)
+    gt_argmax = np.full(num_preds, -1, dtype=np.int64)
+    for i in range(num_preds):
+        sample_id = pred_sample_ids[i]
+        if sample_id < 0:
+            continue
+        pred_box = pred_boxes[i]
+        pred_corners = get_ground_corners(pred_box)
+        pred_volume = pred_box[3] * pred_box[4] * pred_box[5]
+        for j in range(gt_offsets[sample_id], gt_offsets[sample_id + 1]):
+            gt_box = gt_boxes[j]
+            min_z = max(gt_box[2] - gt_box[5] / 2, pred_box[2] - pred_box[5] / 2)
+            max_z = min(gt_box[2] + gt_box[5] / 2, pred_box[2] + pred_box[5] / 2)
+            intersection = max(0, max_z - min_z) * convex_intersection_area(pred_corners, get_ground_corners(gt_box))
+            union = pred_volume + gt_box[3] * gt_box[4] * gt_box[5] - intersection
+            iou = min(max(intersection / union, 0), 1)
+            if iou > max_overlaps[i]:
+                max_overlaps[i] = iou
+                gt_argmax[i] = j
+    return max_overlaps, gt_argmax
+
+
+@numba.jit(nopython=True)
+def match_predictions(max_overlaps, gt_argmax, num_gts, iou_thresholds):
+    """Greedy matching in score order for all IOU thresholds at once, every GT is matched at most once.
 
-        sample_token = prediction["sample_token"]
+    Returns:
+        tp, fp: (N, num_thresholds)
+
+    """
+    tp = np.zeros((max_overlaps.shape[0], iou_thresholds.shape[0]))
+    fp = np.zeros((max_overlaps.shape[0], iou_thresholds.shape[0]))
+    gt_checked = np.zeros((num_gts, iou_thresholds.shape[0]))
+    for i in range(max_overlaps.shape[0]):
+        for k in range(iou_thresholds.shape[0]):
+            if max_overlaps[i] > iou_thresholds[k] and gt_checked[gt_argmax[i], k] == 0:
+                tp[i, k] = 1.0
+                gt_checked[gt_argmax[i], k] = 1
+            else:
+                fp[i, k] = 1.0
+    return tp, fp
 
-        max_overlap = -np.inf
-        jmax = -1
 
-        try:
-            gt_boxes = image_gts[sample_token]  # gt_boxes per sample
-            gt_checked = sample_gt_checked[sample_token]  # gt flags per sample
-        except KeyError:
-            gt_boxes = []
-            gt_checked = None
+def recall_precision(gt, predictions, iou_threshold_list):
+    num_gts = len(gt)
 
-        if len(gt_boxes) > 0:
-            overlaps = get_ious(gt_boxes, predicted_box)
+    if num_gts == 0:
+        return -1, -1, -1
 
-            max_overlap = np.max(overlaps)
+    image_gts = group_by_key(gt, "sample_token")
+    sample_ids = {sample_token: i for i, sample_token in enumerate(image_gts.keys())}
+    gt_offsets = np.cumsum([0] + [len(boxes) for boxes in image_gts.values()])
+    gt_boxes = get_box_params([box for boxes in image_gts.values() for box in boxes])
 
-            jmax = np.argmax(overlaps)
+    predictions = sorted(predictions, key=lambda x: x["score"], reverse=True)
+    pred_boxes = get_box_params(predictions)
+    pred_sample_ids = np.array([sample_ids.get(x["sample_token"], -1) for x in predictions], dtype=np.int64)
 
-        for i, iou_threshold in enumerate(iou_threshold_list):
-            if max_overlap > iou_threshold:
-                if gt_checked[jmax, i] == 0:
-                    tp[prediction_index, i] = 1.0
-                    gt_checked[jmax, i] = 1
-                else:
-                    fp[prediction_index, i] = 1.0
-            else:
-                fp[prediction_index, i] = 1.0
+    # go down dets and mark TPs and FPs
+    max_overlaps, gt_argmax = get_max_overlaps(pred_boxes, pred_sample_ids, gt_boxes, gt_offsets)
+    tp, fp = match_predictions(
+        max_overlaps, gt_argmax, num_gts, np.array(iou_threshold_list, dtype=np.float64).reshape(-1)
+    )
 
     # compute precision recall
     fp = np.cumsum(fp, axis=0)
@@ -1,4 +1,3 @@
-import copy
 import pickle
 from pathlib import Path
 
@@ -7,6 +6,7 @@ from tqdm import tqdm
 
 from ...ops.roiaware_pool3d import roiaware_pool3d_utils
 from ...utils import common_utils
+from .. import info_store
 from ..dataset import DatasetTemplate
 
 
@@ -26,14 +26,13 @@ class NuScenesDataset(DatasetTemplate):
         nuscenes_infos = []
 
         for info_path in self.dataset_cfg.INFO_PATH[mode]:
-            info_path = self.root_path / info_path
+            info_path = self.get_info_path(self.root_path / info_path)
             if not info_path.exists():
                 continue
-            with open(info_path, 'rb') as f:
-                infos = pickle.load(f)
-                nuscenes_infos.extend(infos)
+            nuscenes_infos.append(info_store.load_infos(info_path))
+        nuscenes_infos = info_store.merge_infos(*nuscenes_infos)
 
-        self.infos.extend(nuscenes_infos)
+        self.infos = info_store.merge_infos(self.infos, nuscenes_infos)
         self.logger.info('Total samples for NuScenes dataset: %d' % (len(nuscenes_infos)))
 
     def balanced_infos_resampling(self, infos):
@@ -43,24 +42,25 @@ class NuScenesDataset(DatasetTemplate):
         if self.class_names is None:
             return infos
 
-        cls_infos = {name: [] for name in self.class_names}
-        for info in infos:
+        cls_inds = {name: [] for name in self.class_names}
+        for idx, info in enumerate(infos):
             for name in set(info['gt_names']):
                 if name in self.class_names:
-                    cls_infos[name].append(info)
+                    cls_inds[name].append(idx)
 
-        duplicated_samples = sum([len(v) for _, v in cls_infos.items()])
-        cls_dist = {k: len(v) / duplicated_samples for k, v in cls_infos.items()}
+        duplicated_samples = sum([len(v) for _, v in cls_inds.items()])
+        cls_dist = {k: len(v) / duplicated_samples for k, v in cls_inds.items()}
 
-        sampled_infos = []
+        sampled_inds = []
 
         frac = 1.0 / len(self.class_names)
         ratios = [frac / v for v in cls_dist.values()]
 
-        for cur_cls_infos, ratio in zip(list(cls_infos.values()), ratios):
-            sampled_infos += np.random.choice(
-                cur_cls_infos, int(len(cur_cls_infos) * ratio)
+        for cur_cls_inds, ratio in zip(list(cls_inds.values()), ratios):
+            sampled_inds += np.random.choice(
+                cur_cls_inds, int(len(cur_cls_inds) * ratio)
             ).tolist()
+        sampled_infos = info_store.select_infos(infos, sampled_inds)
         self.logger.info('Total samples after balanced resampling: %s' % (len(sampled_infos)))
 
         cls_infos_new = {name: [] for name in self.class_names}
@@ -79,7 +79,9 @@ class NuScenesDataset(DatasetTemplate):
             return points[mask]
 
         lidar_path = self.root_path / sweep_info['lidar_path']
-        points_sweep = np.fromfile(str(lidar_path), dtype=np.float32, count=-1).reshape([-1, 5])[:, :4]
+        points_sweep = self.get_cached_frame(
+            str(lidar_path), lambda: np.fromfile(str(lidar_path), dtype=np.float32, count=-1).reshape([-1, 5])[:, :4]
+        )
         points_sweep = remove_ego_points(points_sweep).T
         if sweep_info['transform_matrix'] is not None:
             num_points = points_sweep.shape[1]
@@ -92,7 +94,9 @@ class NuScenesDataset(DatasetTemplate):
     def get_lidar_with_sweeps(self, index, max_sweeps=1):
         info = self.infos[index]
         lidar_path = self.root_path / info['lidar_path']
-        points = np.fromfile(str(lidar_path), dtype=np.float32, count=-1).reshape([-1, 5])[:, :4]
+        points = self.get_cached_frame(
+            str(lidar_path), lambda: np.fromfile(str(lidar_path), dtype=np.float32, count=-1).reshape([-1, 5])[:, :4]
+        )
 
         sweep_points_list = [points]
         sweep_times_list = [np.zeros((points.shape[0], 1))]
@@ -118,7 +122,7 @@ class NuScenesDataset(DatasetTemplate):
         if self._merge_all_iters_to_one_epoch:
             index = index % len(self.infos)
 
-        info = copy.deepcopy(self.infos[index])
+        info = info_store.get_info_copy(self.infos, index)
         points = self.get_lidar_with_sweeps(index, max_sweeps=self.dataset_cfg.MAX_SWEEPS)
 
         input_dict = {
@@ -151,7 +155,7 @@ class NuScenesDataset(DatasetTemplate):
         return data_dict
 
     @staticmethod
-    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None):
+    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None, result_writer=None):
         """
         Args:
             batch_dict:
@@ -162,6 +166,7 @@ class NuScenesDataset(DatasetTemplate):
                 pred_labels: (N), Tensor
             class_names:
             output_path:
+            result_writer:
         Returns:
         """
         def get_template_prediction(num_samples):
@@ -256,9 +261,12 @@ class NuScenesDataset(DatasetTemplate):
 
         database_save_path = self.root_path / f'gt_database_{max_sweeps}sweeps_withvelo'
         db_info_save_path = self.root_path / f'nuscenes_dbinfos_{max_sweeps}sweeps_withvelo.pkl'
+        db_data_save_path = self.root_path / f'gt_database_{max_sweeps}sweeps_withvelo_global.npy'
 
         database_save_path.mkdir(parents=True, exist_ok=True)
         all_db_infos = {}
+        point_offset_cnt = 0
+        stacked_gt_points = []
 
         for idx in tqdm(range(len(self.infos))):
             sample_idx = idx
@@ -285,6 +293,10 @@ class NuScenesDataset(DatasetTemplate):
                     db_path = str(filepath.relative_to(self.root_path))  # gt_database/xxxxx.bin
                     db_info = {'name': gt_names[i], 'path': db_path, 'image_idx': sample_idx, 'gt_idx': i,
                                'box3d_lidar': gt_boxes[i], 'num_points_in_gt': gt_points.shape[0]}
+                    # it will be used if you choose to use shared memory or memory-mapped reads for gt sampling
+                    stacked_gt_points.append(gt_points)
+                    db_info['global_data_offset'] = [point_offset_cnt, point_offset_cnt + gt_points.shape[0]]
+                    point_offset_cnt += gt_points.shape[0]
                     if gt_names[i] in all_db_infos:
                         all_db_infos[gt_names[i]].append(db_info)
                     else:
@@ -295,6 +307,10 @@ class NuScenesDataset(DatasetTemplate):
         with open(db_info_save_path, 'wb') as f:
             pickle.dump(all_db_infos, f)
 
+        # it will be used if you choose to use shared memory or memory-mapped reads for gt sampling
+        stacked_gt_points = np.concatenate(stacked_gt_points, axis=0)
+        np.save(db_data_save_path, stacked_gt_points)
+
 
 def create_nuscenes_info(version, data_path, save_path, max_sweeps=10):
     from nuscenes.nuscenes import NuScenes
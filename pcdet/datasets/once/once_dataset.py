@@ -7,7 +7,9 @@ import torch
 import torch.nn.functional as F
 from pathlib import Path
 
+from .. import info_store
 from ..dataset import DatasetTemplate
+from ..evaluator import DatasetEvaluator
 from ...ops.roiaware_pool3d import roiaware_pool3d_utils
 from ...utils import box_utils
 from .once_toolkits import Octopus
@@ -43,21 +45,17 @@ class ONCEDataset(DatasetTemplate):
         once_infos = []
 
         for info_path in self.dataset_cfg.INFO_PATH[split]:
-            info_path = self.root_path / info_path
+            info_path = self.get_info_path(self.root_path / info_path)
             if not info_path.exists():
                 continue
-            with open(info_path, 'rb') as f:
-                infos = pickle.load(f)
-                once_infos.extend(infos)
-
-        def check_annos(info):
-            return 'annos' in info
+            once_infos.append(info_store.load_infos(info_path))
+        once_infos = info_store.merge_infos(*once_infos)
 
         # if self.split != 'raw':
         if self.split not in ['raw', 'test']:
-            once_infos = list(filter(check_annos, once_infos))
+            once_infos = info_store.filter_infos_by_key(once_infos, 'annos')
 
-        self.once_infos.extend(once_infos)
+        self.once_infos = info_store.merge_infos(self.once_infos, once_infos)
 
         if self.logger is not None:
             self.logger.info('Total samples for ONCE dataset: %d' % (len(once_infos)))
@@ -72,7 +70,9 @@ class ONCEDataset(DatasetTemplate):
         self.sample_seq_list = [x.strip() for x in open(split_dir).readlines()] if split_dir.exists() else None
 
     def get_lidar(self, sequence_id, frame_id):
-        return self.toolkits.load_point_cloud(sequence_id, frame_id)
+        return self.get_cached_frame(
+            (sequence_id, frame_id), lambda: self.toolkits.load_point_cloud(sequence_id, frame_id)
+        )
 
     def get_image(self, sequence_id, frame_id, cam_name):
         return self.toolkits.load_image(sequence_id, frame_id, cam_name)
@@ -128,7 +128,7 @@ class ONCEDataset(DatasetTemplate):
         if self._merge_all_iters_to_one_epoch:
             index = index % len(self.once_infos)
 
-        info = copy.deepcopy(self.once_infos[index])
+        info = info_store.get_info_copy(self.once_infos, index)
         frame_id = info['frame_id']
         seq_id = info['sequence_id']
         points = self.get_lidar(seq_id, frame_id)
@@ -297,9 +297,12 @@ class ONCEDataset(DatasetTemplate):
 
         database_save_path = Path(self.root_path) / ('gt_database' if split == 'train' else ('gt_database_%s' % split))
         db_info_save_path = Path(self.root_path) / ('once_dbinfos_%s.pkl' % split)
+        db_data_save_path = Path(self.root_path) / ('once_gt_database_%s_global.npy' % split)
 
         database_save_path.mkdir(parents=True, exist_ok=True)
         all_db_infos = {}
+        point_offset_cnt = 0
+        stacked_gt_points = []
 
         with open(info_path, 'rb') as f:
             infos = pickle.load(f)
@@ -333,6 +336,10 @@ class ONCEDataset(DatasetTemplate):
                 db_path = str(filepath.relative_to(self.root_path))  # gt_database/xxxxx.bin
                 db_info = {'name': names[i], 'path': db_path, 'gt_idx': i,
                             'box3d_lidar': gt_boxes[i], 'num_points_in_gt': gt_points.shape[0]}
+                # it will be used if you choose to use shared memory or memory-mapped reads for gt sampling
+                stacked_gt_points.append(gt_points)
+                db_info['global_data_offset'] = [point_offset_cnt, point_offset_cnt + gt_points.shape[0]]
+                point_offset_cnt += gt_points.shape[0]
                 if names[i] in all_db_infos:
                     all_db_infos[names[i]].append(db_info)
                 else:
@@ -344,8 +351,12 @@ class ONCEDataset(DatasetTemplate):
         with open(db_info_save_path, 'wb') as f:
             pickle.dump(all_db_infos, f)
 
+        # it will be used if you choose to use shared memory or memory-mapped reads for gt sampling
+        stacked_gt_points = np.concatenate(stacked_gt_points, axis=0)
+        np.save(db_data_save_path, stacked_gt_points)
+
     @staticmethod
-    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None):
+    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None, result_writer=None):
         def get_template_prediction(num_samples):
             ret_dict = {
                 'name': np.zeros(num_samples), 'score': np.zeros(num_samples),
@@ -389,6 +400,51 @@ class ONCEDataset(DatasetTemplate):
 
         return ap_result_str, ap_dict
 
+    def build_evaluator(self, class_names, **kwargs):
+        if 'annos' not in self.once_infos[0].keys():
+            return super().build_evaluator(class_names, **kwargs)
+        return ONCEEvaluator(self, class_names, **kwargs)
+
+
+class ONCEEvaluator(DatasetEvaluator):
+    """
+    Computes the IoUs and matching statistics of the frames as their predictions arrive, only the AP reduction is
+    left for evaluate(). The results are the same as the ones of ONCEDataset.evaluation
+    """
+    def __init__(self, dataset, class_names, **kwargs):
+        from .once_eval.evaluation import get_eval_classes
+
+        super().__init__(dataset, class_names, **kwargs)
+        self.gt_annos = {info['frame_id']: info['annos'] for info in dataset.once_infos}
+        self.eval_classes, self.iou_thresholds = get_eval_classes(class_names)
+        self.frame_statistics = {}
+
+    def update(self, det_annos):
+        from .once_eval.evaluation import compute_frame_statistics
+
+        gt_annos = [self.gt_annos[anno['frame_id']] for anno in det_annos]
+        frame_statistics = compute_frame_statistics(gt_annos, det_annos, self.eval_classes, self.iou_thresholds)
+        for anno, statistics in zip(det_annos, frame_statistics):
+            self.frame_statistics[anno['frame_id']] = statistics
+
+    def get_results(self):
+        return self.frame_statistics
+
+    def merge_results(self, results_list):
+        # keyed by frame id, so the padding of the DistributedSampler is only counted once
+        self.frame_statistics = {}
+        for results in results_list:
+            self.frame_statistics.update(results)
+
+    def evaluate(self):
+        from .once_eval.evaluation import reduce_frame_statistics
+
+        frame_statistics = [
+            self.frame_statistics[frame_id] for frame_id in self.gt_annos.keys() if frame_id in self.frame_statistics
+        ]
+        return reduce_frame_statistics(frame_statistics, self.eval_classes, self.iou_thresholds)
+
+
 def create_once_infos(dataset_cfg, class_names, data_path, save_path, workers=4):
     dataset = ONCEDataset(dataset_cfg=dataset_cfg, class_names=class_names, root_path=data_path, training=False)
 
@@ -33,74 +33,151 @@ def get_evaluation_results(gt_annos, pred_annos, classes,
                            print_ok=False
                            ):
 
+    assert len(gt_annos) == len(pred_annos), "the number of GT must match predictions"
+    classes, iou_thresholds = get_eval_classes(classes, use_superclass, iou_thresholds, difficulty_mode)
+    frame_statistics = compute_frame_statistics(gt_annos, pred_annos, classes, iou_thresholds,
+                                                use_superclass=use_superclass,
+                                                difficulty_mode=difficulty_mode,
+                                                ap_with_heading=ap_with_heading,
+                                                num_parts=num_parts)
+    return reduce_frame_statistics(frame_statistics, classes, iou_thresholds,
+                                   num_pr_points=num_pr_points,
+                                   difficulty_mode=difficulty_mode,
+                                   print_ok=print_ok)
+
+def get_eval_classes(classes, use_superclass=True, iou_thresholds=None, difficulty_mode='Overall&Distance'):
+    """
+    Returns:
+        classes: evaluated classes, Car/Bus/Truck are replaced by Vehicle with use_superclass
+        iou_thresholds: dict of the IoU threshold of every class
+    """
     if iou_thresholds is None:
         if use_superclass:
             iou_thresholds = superclass_iou_threshold_dict
         else:
             iou_thresholds = iou_threshold_dict
 
-    assert len(gt_annos) == len(pred_annos), "the number of GT must match predictions"
     assert difficulty_mode in ['Overall&Distance', 'Overall', 'Distance'], "difficulty mode is not supported"
     if use_superclass:
         if ('Car' in classes) or ('Bus' in classes) or ('Truck' in classes):
             assert ('Car' in classes) and ('Bus' in classes) and ('Truck' in classes), "Car/Bus/Truck must all exist for vehicle detection"
         classes = [cls_name for cls_name in classes if cls_name not in ['Car', 'Bus', 'Truck']]
         classes.insert(0, 'Vehicle')
+    return classes, iou_thresholds
 
-    num_samples = len(gt_annos)
-    split_parts = compute_split_parts(num_samples, num_parts)
-    ious = compute_iou3d(gt_annos, pred_annos, split_parts, with_heading=ap_with_heading)
-
-    num_classes = len(classes)
+def get_difficulty_types(difficulty_mode):
     if difficulty_mode == 'Distance':
-        num_difficulties = 3
         difficulty_types = ['0-30m', '30-50m', '50m-inf']
     elif difficulty_mode == 'Overall':
-        num_difficulties = 1
         difficulty_types = ['overall']
     elif difficulty_mode == 'Overall&Distance':
-        num_difficulties = 4
         difficulty_types = ['overall', '0-30m', '30-50m', '50m-inf']
     else:
         raise NotImplementedError
+    return difficulty_types
+
+def compute_frame_statistics(gt_annos, pred_annos, classes, iou_thresholds,
+                             use_superclass=True,
+                             difficulty_mode='Overall&Distance',
+                             ap_with_heading=True,
+                             num_parts=100):
+    """
+    The part of the evaluation that only depends on each frame itself, it can be computed batch by batch during
+    inference and reduced with reduce_frame_statistics at the end
+
+    Args:
+        gt_annos/pred_annos: list of dicts for each sample
+        classes/iou_thresholds: from get_eval_classes
+
+    Returns:
+        frame_statistics: list of dicts for each sample
+            num_gt/num_pred:
+            score: (num_pred), scores of the predictions
+            iou_indices: (K, 2), [gt_idx, pred_idx] of the pairs that can be matched with any class, i.e. with an IoU
+                above the lowest IoU threshold, the IoU of the other pairs is never used
+            iou: (K), IoU of these pairs
+            gt_flags/pred_flags: (num_classes, num_difficulties, num_gt/num_pred), see filter_data
+            accum_scores: nested list [cls_idx][diff_idx] of the scores of the matched predictions
+    """
+    num_samples = len(gt_annos)
+    split_parts = compute_split_parts(num_samples, num_parts)
+    ious = compute_iou3d(gt_annos, pred_annos, split_parts, with_heading=ap_with_heading)
+    min_iou_threshold = min([iou_thresholds[cur_class] for cur_class in classes])
+    num_difficulties = len(get_difficulty_types(difficulty_mode))
+
+    frame_statistics = []
+    for sample_idx in range(num_samples):
+        gt_anno = gt_annos[sample_idx]
+        pred_anno = pred_annos[sample_idx]
+        pred_score = pred_anno['score']
+        iou = ious[sample_idx]
+        num_gt, num_pred = iou.shape
+        gt_flags = np.zeros((len(classes), num_difficulties, num_gt), dtype=np.int8)
+        pred_flags = np.zeros((len(classes), num_difficulties, num_pred), dtype=np.int8)
+        accum_scores = []
+        for cls_idx, cur_class in enumerate(classes):
+            accum_scores.append([])
+            for diff_idx in range(num_difficulties):
+                gt_flag, pred_flag = filter_data(gt_anno, pred_anno, difficulty_mode,
+                                                    difficulty_level=diff_idx, class_name=cur_class, use_superclass=use_superclass)
+                gt_flags[cls_idx, diff_idx] = gt_flag
+                pred_flags[cls_idx, diff_idx] = pred_flag
+                accum_scores[cls_idx].append(accumulate_scores(iou, pred_score, gt_flag, pred_flag,
+                                                               iou_threshold=iou_thresholds[cur_class]))
+        iou_indices = np.stack(np.nonzero(iou > min_iou_threshold), axis=1)
+        frame_statistics.append({
+            'num_gt': num_gt, 'num_pred': num_pred, 'score': pred_score,
+            'iou_indices': iou_indices, 'iou': iou[iou_indices[:, 0], iou_indices[:, 1]].astype(np.float64),
+            'gt_flags': gt_flags, 'pred_flags': pred_flags, 'accum_scores': accum_scores
+        })
+    return frame_statistics
+
+def reduce_frame_statistics(frame_statistics, classes, iou_thresholds,
+                            num_pr_points=50,
+                            difficulty_mode='Overall&Distance',
+                            print_ok=False):
+    """
+    Args:
+        frame_statistics: from compute_frame_statistics
+        classes/iou_thresholds: from get_eval_classes
+
+    Returns:
+        ret_str, ret_dict: AP of every class and difficulty
+    """
+    difficulty_types = get_difficulty_types(difficulty_mode)
+    num_classes = len(classes)
+    num_difficulties = len(difficulty_types)
 
     precision = np.zeros([num_classes, num_difficulties, num_pr_points+1])
     recall = np.zeros([num_classes, num_difficulties, num_pr_points+1])
 
+    # concatenated once for compute_confusion_matrix
+    all_pred_scores = np.concatenate([stats['score'] for stats in frame_statistics] + [np.zeros(0)], axis=0)
+    all_iou_indices = np.concatenate(
+        [stats['iou_indices'] for stats in frame_statistics] + [np.zeros((0, 2), dtype=np.int64)], axis=0)
+    all_ious = np.concatenate([stats['iou'] for stats in frame_statistics] + [np.zeros(0)], axis=0)
+    iou_offsets = np.cumsum([0] + [len(stats['iou']) for stats in frame_statistics])
+    gt_offsets = np.cumsum([0] + [stats['num_gt'] for stats in frame_statistics])
+    pred_offsets = np.cumsum([0] + [stats['num_pred'] for stats in frame_statistics])
+
     for cls_idx, cur_class in enumerate(classes):
         iou_threshold = iou_thresholds[cur_class]
         for diff_idx in range(num_difficulties):
-            ### filter data & determine score thresholds on p-r curve ###
-            accum_all_scores, gt_flags, pred_flags = [], [], []
-            num_valid_gt = 0
-            for sample_idx in range(num_samples):
-                gt_anno = gt_annos[sample_idx]
-                pred_anno = pred_annos[sample_idx]
-                pred_score = pred_anno['score']
-                iou = ious[sample_idx]
-                gt_flag, pred_flag = filter_data(gt_anno, pred_anno, difficulty_mode,
-                                                    difficulty_level=diff_idx, class_name=cur_class, use_superclass=use_superclass)
-                gt_flags.append(gt_flag)
-                pred_flags.append(pred_flag)
-                num_valid_gt += sum(gt_flag == 0)
-                accum_scores = accumulate_scores(iou, pred_score, gt_flag, pred_flag,
-                                                 iou_threshold=iou_threshold)
-                accum_all_scores.append(accum_scores)
-            all_scores = np.concatenate(accum_all_scores, axis=0)
+            ### determine score thresholds on p-r curve ###
+            gt_flags = np.concatenate(
+                [stats['gt_flags'][cls_idx, diff_idx] for stats in frame_statistics] + [np.zeros(0, dtype=np.int8)])
+            pred_flags = np.concatenate(
+                [stats['pred_flags'][cls_idx, diff_idx] for stats in frame_statistics] + [np.zeros(0, dtype=np.int8)])
+            num_valid_gt = np.sum(gt_flags == 0)
+            all_scores = np.concatenate(
+                [stats['accum_scores'][cls_idx][diff_idx] for stats in frame_statistics] + [np.zeros(0)], axis=0)
             thresholds = get_thresholds(all_scores, num_valid_gt, num_pr_points=num_pr_points)
 
             ### compute tp/fp/fn ###
-            confusion_matrix = np.zeros([len(thresholds), 3]) # only record tp/fp/fn
-            for sample_idx in range(num_samples):
-                pred_score = pred_annos[sample_idx]['score']
-                iou = ious[sample_idx]
-                gt_flag, pred_flag = gt_flags[sample_idx], pred_flags[sample_idx]
-                for th_idx, score_th in enumerate(thresholds):
-                    tp, fp, fn = compute_statistics(iou, pred_score, gt_flag, pred_flag,
-                                                    score_threshold=score_th, iou_threshold=iou_threshold)
-                    confusion_matrix[th_idx, 0] += tp
-                    confusion_matrix[th_idx, 1] += fp
-                    confusion_matrix[th_idx, 2] += fn
+            confusion_matrix = compute_confusion_matrix(
+                all_ious, all_iou_indices, iou_offsets, all_pred_scores, gt_flags, pred_flags,
+                gt_offsets, pred_offsets, np.array(thresholds, dtype=np.float64), iou_threshold
+            ) # only record tp/fp/fn
 
             ### draw p-r curve ###
             for th_idx in range(len(thresholds)):
@@ -255,6 +332,52 @@ def compute_statistics(iou, pred_scores, gt_flag, pred_flag, score_threshold, io
 
     return tp, fp, fn
 
+@numba.jit(nopython=True)
+def compute_confusion_matrix(ious, iou_indices, iou_offsets, pred_scores, gt_flags, pred_flags, gt_offsets,
+                             pred_offsets, thresholds, iou_threshold):
+    """
+    Sums compute_statistics over all samples for every score threshold. The matching of a sample only depends on
+    which of its predictions are above the threshold, so it is only redone when a threshold lets more of them through
+
+    Args:
+        ious/iou_indices: (K)/(K, 2) concatenated iou pairs of compute_frame_statistics,
+            sample i is iou_offsets[i]:iou_offsets[i + 1], the other pairs have an IoU of 0
+        pred_scores/pred_flags: concatenated over all samples, sample i is pred_offsets[i]:pred_offsets[i + 1]
+        gt_flags: concatenated over all samples, sample i is gt_offsets[i]:gt_offsets[i + 1]
+        thresholds: (T), score thresholds
+        iou_threshold:
+
+    Returns:
+        confusion_matrix: (T, 3), tp/fp/fn
+    """
+    confusion_matrix = np.zeros((thresholds.shape[0], 3))
+    for sample_idx in range(gt_offsets.shape[0] - 1):
+        num_gt = gt_offsets[sample_idx + 1] - gt_offsets[sample_idx]
+        num_pred = pred_offsets[sample_idx + 1] - pred_offsets[sample_idx]
+        iou = np.zeros((num_gt, num_pred))
+        for k in range(iou_offsets[sample_idx], iou_offsets[sample_idx + 1]):
+            iou[iou_indices[k, 0], iou_indices[k, 1]] = ious[k]
+        pred_score = pred_scores[pred_offsets[sample_idx]:pred_offsets[sample_idx + 1]]
+        gt_flag = gt_flags[gt_offsets[sample_idx]:gt_offsets[sample_idx + 1]]
+        pred_flag = pred_flags[pred_offsets[sample_idx]:pred_offsets[sample_idx + 1]]
+
+        last_num_above, tp, fp, fn = -1, 0, 0, 0
+        for th_idx in range(thresholds.shape[0]):
+            num_above = 0
+            for j in range(num_pred):
+                if pred_flag[j] != -1 and not pred_score[j] < thresholds[th_idx]:
+                    num_above += 1
+            # the sets of predictions above the thresholds are nested, so the same count is the same set
+            if num_above != last_num_above:
+                tp, fp, fn = compute_statistics(iou, pred_score, gt_flag, pred_flag,
+                                                score_threshold=thresholds[th_idx], iou_threshold=iou_threshold)
+                last_num_above = num_above
+            confusion_matrix[th_idx, 0] += tp
+            confusion_matrix[th_idx, 1] += fp
+            confusion_matrix[th_idx, 2] += fn
+
+    return confusion_matrix
+
 def filter_data(gt_anno, pred_anno, difficulty_mode, difficulty_level, class_name, use_superclass):
     """
     Filter data by class name and difficulty
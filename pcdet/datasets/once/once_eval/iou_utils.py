@@ -6,18 +6,29 @@ import numba
 import numpy as np
 from numba import cuda
 
+
+def cuda_jit(*args, **kwargs):
+    """
+    cuda.jit compiles the typed functions when they are defined, which fails without a cuda driver,
+    rotate_iou_cpu_eval is used then
+    """
+    if cuda.is_available():
+        return cuda.jit(*args, **kwargs)
+    return lambda func: func
+
+
 @numba.jit(nopython=True)
 def div_up(m, n):
     return m // n + (m % n > 0)
 
 
-@cuda.jit('(float32[:], float32[:], float32[:])', device=True, inline=True)
+@cuda_jit('(float32[:], float32[:], float32[:])', device=True, inline=True)
 def trangle_area(a, b, c):
     return ((a[0] - c[0]) * (b[1] - c[1]) - (a[1] - c[1]) *
             (b[0] - c[0])) / 2.0
 
 
-@cuda.jit('(float32[:], int32)', device=True, inline=True)
+@cuda_jit('(float32[:], int32)', device=True, inline=True)
 def area(int_pts, num_of_inter):
     area_val = 0.0
     for i in range(num_of_inter - 2):
@@ -27,7 +38,7 @@ def area(int_pts, num_of_inter):
     return area_val
 
 
-@cuda.jit('(float32[:], int32)', device=True, inline=True)
+@cuda_jit('(float32[:], int32)', device=True, inline=True)
 def sort_vertex_in_convex_polygon(int_pts, num_of_inter):
     if num_of_inter > 0:
         center = cuda.local.array((2,), dtype=numba.float32)
@@ -67,7 +78,7 @@ def sort_vertex_in_convex_polygon(int_pts, num_of_inter):
                 int_pts[j * 2 + 1] = ty
 
 
-@cuda.jit(
+@cuda_jit(
     '(float32[:], float32[:], int32, int32, float32[:])',
     device=True,
     inline=True)
@@ -113,7 +124,7 @@ def line_segment_intersection(pts1, pts2, i, j, temp_pts):
     return False
 
 
-@cuda.jit(
+@cuda_jit(
     '(float32[:], float32[:], int32, int32, float32[:])',
     device=True,
     inline=True)
@@ -155,7 +166,7 @@ def line_segment_intersection_v1(pts1, pts2, i, j, temp_pts):
     return True
 
 """
-@cuda.jit('(float32, float32, float32[:])', device=True, inline=True)
+@cuda_jit('(float32, float32, float32[:])', device=True, inline=True)
 def point_in_quadrilateral(pt_x, pt_y, corners):
     ab0 = corners[2] - corners[0]
     ab1 = corners[3] - corners[1]
@@ -174,7 +185,7 @@ def point_in_quadrilateral(pt_x, pt_y, corners):
     return abab >= abap and abap >= 0 and adad >= adap and adap >= 0
 """
 
-@cuda.jit('(float32, float32, float32[:])', device=True, inline=True)
+@cuda_jit('(float32, float32, float32[:])', device=True, inline=True)
 def point_in_quadrilateral(pt_x, pt_y, corners):
     PA0 = corners[0] - pt_x
     PA1 = corners[1] - pt_y
@@ -191,7 +202,7 @@ def point_in_quadrilateral(pt_x, pt_y, corners):
     return PAB >= 0 and PBC >= 0 and PCD >= 0 and PDA >= 0 or \
            PAB <= 0 and PBC <= 0 and PCD <= 0 and PDA <= 0
 
-@cuda.jit('(float32[:], float32[:], float32[:])', device=True, inline=True)
+@cuda_jit('(float32[:], float32[:], float32[:])', device=True, inline=True)
 def quadrilateral_intersection(pts1, pts2, int_pts):
     num_of_inter = 0
     for i in range(4):
@@ -214,7 +225,7 @@ def quadrilateral_intersection(pts1, pts2, int_pts):
 
     return num_of_inter
 
-@cuda.jit('(float32[:], float32[:])', device=True, inline=True)
+@cuda_jit('(float32[:], float32[:])', device=True, inline=True)
 def rbbox_to_corners(corners, rbbox):
     # generate clockwise corners and rotate it clockwise
     angle = rbbox[4]
@@ -241,7 +252,7 @@ def rbbox_to_corners(corners, rbbox):
                 + 1] = -a_sin * corners_x[i] + a_cos * corners_y[i] + center_y
 
 
-@cuda.jit('(float32[:], float32[:])', device=True, inline=True)
+@cuda_jit('(float32[:], float32[:])', device=True, inline=True)
 def inter(rbbox1, rbbox2):
     corners1 = cuda.local.array((8,), dtype=numba.float32)
     corners2 = cuda.local.array((8,), dtype=numba.float32)
@@ -258,7 +269,7 @@ def inter(rbbox1, rbbox2):
     return area(intersection_corners, num_intersection)
 
 
-@cuda.jit('(float32[:], float32[:], int32)', device=True, inline=True)
+@cuda_jit('(float32[:], float32[:], int32)', device=True, inline=True)
 def devRotateIoUEval(rbox1, rbox2, criterion=-1):
     area1 = rbox1[2] * rbox1[3]
     area2 = rbox2[2] * rbox2[3]
@@ -273,7 +284,7 @@ def devRotateIoUEval(rbox1, rbox2, criterion=-1):
         return area_inter
 
 
-@cuda.jit('(int64, int64, float32[:], float32[:], float32[:], int32)', fastmath=False)
+@cuda_jit('(int64, int64, float32[:], float32[:], float32[:], int32)', fastmath=False)
 def rotate_iou_kernel_eval(N, K, dev_boxes, dev_query_boxes, dev_iou, criterion=-1):
     threadsPerBlock = 8 * 8
     row_start = cuda.blockIdx.x
@@ -306,6 +317,224 @@ def rotate_iou_kernel_eval(N, K, dev_boxes, dev_query_boxes, dev_iou, criterion=
                                                block_boxes[tx * 5:tx * 5 + 5], criterion)
 
 
+@numba.njit
+def trangle_area_cpu(a, b, c):
+    return ((a[0] - c[0]) * (b[1] - c[1]) - (a[1] - c[1]) *
+            (b[0] - c[0])) / 2.0
+
+
+@numba.njit
+def area_cpu(int_pts, num_of_inter):
+    area_val = 0.0
+    for i in range(num_of_inter - 2):
+        area_val += abs(
+            trangle_area_cpu(int_pts[:2], int_pts[2 * i + 2:2 * i + 4],
+                             int_pts[2 * i + 4:2 * i + 6]))
+    return area_val
+
+
+@numba.njit
+def sort_vertex_in_convex_polygon_cpu(int_pts, num_of_inter, center, v, vs):
+    if num_of_inter > 0:
+        center[:] = 0.0
+        for i in range(num_of_inter):
+            center[0] += int_pts[2 * i]
+            center[1] += int_pts[2 * i + 1]
+        center[0] /= num_of_inter
+        center[1] /= num_of_inter
+        for i in range(num_of_inter):
+            v[0] = int_pts[2 * i] - center[0]
+            v[1] = int_pts[2 * i + 1] - center[1]
+            d = math.sqrt(v[0] * v[0] + v[1] * v[1])
+            v[0] = v[0] / d
+            v[1] = v[1] / d
+            if v[1] < 0:
+                v[0] = -2 - v[0]
+            vs[i] = v[0]
+        j = 0
+        temp = 0
+        for i in range(1, num_of_inter):
+            if vs[i - 1] > vs[i]:
+                temp = vs[i]
+                tx = int_pts[2 * i]
+                ty = int_pts[2 * i + 1]
+                j = i
+                while j > 0 and vs[j - 1] > temp:
+                    vs[j] = vs[j - 1]
+                    int_pts[j * 2] = int_pts[j * 2 - 2]
+                    int_pts[j * 2 + 1] = int_pts[j * 2 - 1]
+                    j -= 1
+
+                vs[j] = temp
+                int_pts[j * 2] = tx
+                int_pts[j * 2 + 1] = ty
+
+
+@numba.njit
+def line_segment_intersection_cpu(pts1, pts2, i, j, temp_pts):
+    A0 = pts1[2 * i]
+    A1 = pts1[2 * i + 1]
+
+    B0 = pts1[2 * ((i + 1) % 4)]
+    B1 = pts1[2 * ((i + 1) % 4) + 1]
+
+    C0 = pts2[2 * j]
+    C1 = pts2[2 * j + 1]
+
+    D0 = pts2[2 * ((j + 1) % 4)]
+    D1 = pts2[2 * ((j + 1) % 4) + 1]
+    BA0 = B0 - A0
+    BA1 = B1 - A1
+    DA0 = D0 - A0
+    CA0 = C0 - A0
+    DA1 = D1 - A1
+    CA1 = C1 - A1
+    acd = DA1 * CA0 > CA1 * DA0
+    bcd = (D1 - B1) * (C0 - B0) > (C1 - B1) * (D0 - B0)
+    if acd != bcd:
+        abc = CA1 * BA0 > BA1 * CA0
+        abd = DA1 * BA0 > BA1 * DA0
+        if abc != abd:
+            DC0 = D0 - C0
+            DC1 = D1 - C1
+            ABBA = A0 * B1 - B0 * A1
+            CDDC = C0 * D1 - D0 * C1
+            DH = BA1 * DC0 - BA0 * DC1
+            Dx = ABBA * DC0 - BA0 * CDDC
+            Dy = ABBA * DC1 - BA1 * CDDC
+            temp_pts[0] = Dx / DH
+            temp_pts[1] = Dy / DH
+            return True
+    return False
+
+
+@numba.njit
+def point_in_quadrilateral_cpu(pt_x, pt_y, corners):
+    PA0 = corners[0] - pt_x
+    PA1 = corners[1] - pt_y
+    PB0 = corners[2] - pt_x
+    PB1 = corners[3] - pt_y
+    PC0 = corners[4] - pt_x
+    PC1 = corners[5] - pt_y
+    PD0 = corners[6] - pt_x
+    PD1 = corners[7] - pt_y
+    PAB = PA0 * PB1 - PB0 * PA1
+    PBC = PB0 * PC1 - PC0 * PB1
+    PCD = PC0 * PD1 - PD0 * PC1
+    PDA = PD0 * PA1 - PA0 * PD1
+    return PAB >= 0 and PBC >= 0 and PCD >= 0 and PDA >= 0 or \
+           PAB <= 0 and PBC <= 0 and PCD <= 0 and PDA <= 0
+
+
+@numba.njit
+def quadrilateral_intersection_cpu(pts1, pts2, int_pts, temp_pts):
+    num_of_inter = 0
+    for i in range(4):
+        if point_in_quadrilateral_cpu(pts1[2 * i], pts1[2 * i + 1], pts2):
+            int_pts[num_of_inter * 2] = pts1[2 * i]
+            int_pts[num_of_inter * 2 + 1] = pts1[2 * i + 1]
+            num_of_inter += 1
+        if point_in_quadrilateral_cpu(pts2[2 * i], pts2[2 * i + 1], pts1):
+            int_pts[num_of_inter * 2] = pts2[2 * i]
+            int_pts[num_of_inter * 2 + 1] = pts2[2 * i + 1]
+            num_of_inter += 1
+    for i in range(4):
+        for j in range(4):
+            has_pts = line_segment_intersection_cpu(pts1, pts2, i, j, temp_pts)
+            if has_pts:
+                int_pts[num_of_inter * 2] = temp_pts[0]
+                int_pts[num_of_inter * 2 + 1] = temp_pts[1]
+                num_of_inter += 1
+
+    return num_of_inter
+
+
+@numba.njit
+def rbbox_to_corners_cpu(corners, rbbox, corners_x, corners_y):
+    # generate clockwise corners and rotate it clockwise
+    angle = rbbox[4]
+    a_cos = math.cos(angle)
+    a_sin = math.sin(angle)
+    center_x = rbbox[0]
+    center_y = rbbox[1]
+    x_d = rbbox[2]
+    y_d = rbbox[3]
+    corners_x[0] = -x_d / 2
+    corners_x[1] = -x_d / 2
+    corners_x[2] = x_d / 2
+    corners_x[3] = x_d / 2
+    corners_y[0] = -y_d / 2
+    corners_y[1] = y_d / 2
+    corners_y[2] = y_d / 2
+    corners_y[3] = -y_d / 2
+    for i in range(4):
+        corners[2 * i] = a_cos * corners_x[i] + a_sin * corners_y[i] + center_x
+        corners[2 * i + 1] = -a_sin * corners_x[i] + a_cos * corners_y[i] + center_y
+
+
+@numba.njit
+def inter_cpu(rbbox1, rbbox2, workspace):
+    # workspace: (64), float32, holds the local arrays of the cuda version so that they round the same way
+    corners1 = workspace[0:8]
+    corners2 = workspace[8:16]
+    intersection_corners = workspace[16:32]
+
+    rbbox_to_corners_cpu(corners1, rbbox1, workspace[32:36], workspace[36:40])
+    rbbox_to_corners_cpu(corners2, rbbox2, workspace[32:36], workspace[36:40])
+
+    num_intersection = quadrilateral_intersection_cpu(corners1, corners2, intersection_corners, workspace[40:42])
+    sort_vertex_in_convex_polygon_cpu(
+        intersection_corners, num_intersection, workspace[42:44], workspace[44:46], workspace[46:62]
+    )
+
+    return area_cpu(intersection_corners, num_intersection)
+
+
+@numba.njit
+def rotate_iou_eval_cpu(rbox1, rbox2, criterion, workspace):
+    area1 = rbox1[2] * rbox1[3]
+    area2 = rbox2[2] * rbox2[3]
+    area_inter = inter_cpu(rbox1, rbox2, workspace)
+    if criterion == -1:
+        return area_inter / (area1 + area2 - area_inter)
+    elif criterion == 0:
+        return area_inter / area1
+    elif criterion == 1:
+        return area_inter / area2
+    else:
+        return area_inter
+
+
+@numba.njit(parallel=True, cache=True)
+def rotate_iou_kernel_eval_cpu(boxes, query_boxes, iou, criterion):
+    for n in numba.prange(boxes.shape[0]):
+        workspace = np.zeros(64, dtype=np.float32)
+        for k in range(query_boxes.shape[0]):
+            iou[n, k] = rotate_iou_eval_cpu(query_boxes[k], boxes[n], criterion, workspace)
+
+
+def rotate_iou_cpu_eval(boxes, query_boxes, criterion=-1):
+    """
+    Same as rotate_iou_gpu_eval, with numba on all cpu cores, for machines without cuda
+    Args:
+        boxes (float array: [N, 5]): rbboxes. format: centers, dims, angles(clockwise when positive)
+        query_boxes (float array: [K, 5]):
+        criterion: -1: iou, 0: intersection / area of the query box, 1: intersection / area of the box,
+            else: intersection
+    Returns:
+        iou: (N, K), float32
+    """
+    boxes = np.ascontiguousarray(boxes, dtype=np.float32)
+    query_boxes = np.ascontiguousarray(query_boxes, dtype=np.float32)
+    N = boxes.shape[0]
+    K = query_boxes.shape[0]
+    iou = np.zeros((N, K), dtype=np.float32)
+    if N == 0 or K == 0:
+        return iou
+    rotate_iou_kernel_eval_cpu(boxes, query_boxes, iou, criterion)
+    return iou
+
+
 def rotate_iou_gpu_eval(boxes, query_boxes, criterion=-1, device_id=0):
     """rotated box iou running in gpu. 500x faster than cpu version
     (take 5ms in one example with numba.cuda code).
@@ -321,6 +550,9 @@ def rotate_iou_gpu_eval(boxes, query_boxes, criterion=-1, device_id=0):
     Returns:
         [type]: [description]
     """
+    if not cuda.is_available():
+        return rotate_iou_cpu_eval(boxes, query_boxes, criterion)
+
     box_dtype = boxes.dtype
     boxes = boxes.astype(np.float32)
     query_boxes = query_boxes.astype(np.float32)
@@ -67,7 +67,9 @@ class ONCESemiDataset(SemiDatasetTemplate):
         self.once_infos = infos
 
     def get_lidar(self, sequence_id, frame_id):
-        return self.toolkits.load_point_cloud(sequence_id, frame_id)
+        return self.get_cached_frame(
+            (sequence_id, frame_id), lambda: self.toolkits.load_point_cloud(sequence_id, frame_id)
+        )
 
     def get_image(self, sequence_id, frame_id, cam_name):
         return self.toolkits.load_image(sequence_id, frame_id, cam_name)
@@ -85,7 +87,7 @@ class ONCESemiDataset(SemiDatasetTemplate):
         raise NotImplementedError
 
     @staticmethod
-    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None):
+    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None, result_writer=None):
         def get_template_prediction(num_samples):
             ret_dict = {
                 'name': np.zeros(num_samples), 'score': np.zeros(num_samples),
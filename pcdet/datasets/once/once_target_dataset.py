@@ -66,7 +66,9 @@ class ONCEDataset(DatasetTemplate):
         self.sample_seq_list = [x.strip() for x in open(split_dir).readlines()] if split_dir.exists() else None
 
     def get_lidar(self, sequence_id, frame_id):
-        return self.toolkits.load_point_cloud(sequence_id, frame_id)
+        return self.get_cached_frame(
+            (sequence_id, frame_id), lambda: self.toolkits.load_point_cloud(sequence_id, frame_id)
+        )
 
     def get_image(self, sequence_id, frame_id, cam_name):
         return self.toolkits.load_image(sequence_id, frame_id, cam_name)
@@ -320,7 +322,7 @@ class ONCEDataset(DatasetTemplate):
             pickle.dump(all_db_infos, f)
 
     @staticmethod
-    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None):
+    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None, result_writer=None):
         def get_template_prediction(num_samples):
             ret_dict = {
                 'name': np.zeros(num_samples), 'score': np.zeros(num_samples),
@@ -114,7 +114,9 @@ class PandasetDataset(DatasetTemplate):
         seq_idx = info['sequence']
 
         pose = self._get_pose(info)
-        points = self._get_lidar_points(info, pose)
+        points = self.get_cached_frame(
+            (info['lidar_path'], self.dataset_cfg.get('LIDAR_DEVICE', 0)), lambda: self._get_lidar_points(info, pose)
+        )
         boxes, labels, zrot_world_to_ego = self._get_annotations(info, pose)
         pose_np = pose_dict_to_numpy(pose)
 
@@ -253,7 +255,7 @@ class PandasetDataset(DatasetTemplate):
 
 
     @staticmethod
-    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None):
+    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None, result_writer=None):
         """
         To support a custom dataset, implement this function to receive the predicted results from the model, and then
         transform the unified normative coordinate to your required coordinate, and optionally save them to disk.
@@ -266,6 +268,7 @@ class PandasetDataset(DatasetTemplate):
                 pred_labels: (N), Tensor
             class_names:
             output_path: if it is not None, save the results to this path
+            result_writer: optional ResultWriter, if it is not None, the results are saved by its background threads
         Returns:
 
         """
@@ -348,7 +351,10 @@ class PandasetDataset(DatasetTemplate):
                 cur_det_file = os.path.join(output_path, seq_id, 'predictions',
                                             'cuboids', ("{}.pkl.gz".format(frame_id)))
                 os.makedirs(os.path.dirname(cur_det_file), exist_ok=True)
-                single_pred_df.to_pickle(cur_det_file)
+                if result_writer is not None:
+                    result_writer.submit(single_pred_df.to_pickle, cur_det_file)
+                else:
+                    single_pred_df.to_pickle(cur_det_file)
 
             annos.append(single_pred_dict)
 
@@ -388,9 +394,13 @@ class PandasetDataset(DatasetTemplate):
                 'gt_database' if split == 'train' else 'gt_database_{}'.format(split))
         db_info_save_path = os.path.join(self.root_path,
                 'pandaset_dbinfos_{}.pkl'.format(split))
+        db_data_save_path = os.path.join(self.root_path,
+                'pandaset_gt_database_{}_global.npy'.format(split))
 
         os.makedirs(database_save_path, exist_ok=True)
         all_db_infos = {}
+        point_offset_cnt = 0
+        stacked_gt_points = []
 
         with open(info_path, 'rb') as f:
             infos = pickle.load(f)
@@ -423,6 +433,10 @@ class PandasetDataset(DatasetTemplate):
                     db_info = {'name': names[i], 'path': db_path, 'gt_idx': i,
                                'box3d_lidar': gt_boxes[i], 'num_points_in_gt': gt_points.shape[0],
                                'difficulty': -1}
+                    # it will be used if you choose to use shared memory or memory-mapped reads for gt sampling
+                    stacked_gt_points.append(gt_points)
+                    db_info['global_data_offset'] = [point_offset_cnt, point_offset_cnt + gt_points.shape[0]]
+                    point_offset_cnt += gt_points.shape[0]
                     if names[i] in all_db_infos:
                         all_db_infos[names[i]].append(db_info)
                     else:
@@ -433,6 +447,10 @@ class PandasetDataset(DatasetTemplate):
         with open(db_info_save_path, 'wb') as f:
             pickle.dump(all_db_infos, f)
 
+        # it will be used if you choose to use shared memory or memory-mapped reads for gt sampling
+        stacked_gt_points = np.concatenate(stacked_gt_points, axis=0)
+        np.save(db_data_save_path, stacked_gt_points)
+
 
     def evaluation(self, det_annos, class_names, **kwargs):
         self.logger.warning('Evaluation is not implemented for Pandaset as there is no official one. ' +
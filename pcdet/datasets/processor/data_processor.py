@@ -60,8 +60,84 @@ class VoxelGeneratorWrapper():
         return voxels, coordinates, num_points
 
 
+class NumpyVoxelGenerator(object):
+    """
+    Voxel generator without spconv, the points are grouped by sorting their voxel keys. As in spconv, the voxels are
+    ordered by their first point and keep at most max_num_points_per_voxel points in input order, with mean_pooling
+    every voxel holds the mean of all its points instead (num_points is 1 then)
+    """
+    def __init__(self, vsize_xyz, coors_range_xyz, num_point_features, max_num_points_per_voxel, max_num_voxels,
+                 mean_pooling=False):
+        self.voxel_size = np.array(vsize_xyz, dtype=np.float32)
+        self.coors_range = np.array(coors_range_xyz, dtype=np.float32)
+        self.grid_size = np.round((self.coors_range[3:6] - self.coors_range[0:3]) / self.voxel_size).astype(np.int64)
+        self.num_point_features = num_point_features
+        self.max_num_points_per_voxel = max_num_points_per_voxel
+        self.max_num_voxels = max_num_voxels
+        self.mean_pooling = mean_pooling
+
+    def generate_dynamic(self, points):
+        """
+        Args:
+            points: (N, 3 + C)
+        Returns:
+            point_indices: (M), indices of the points inside the grid
+            point_coords: (M, 3), [z, y, x] voxel coordinates of these points
+        """
+        coords = np.floor((points[:, 0:3] - self.coors_range[0:3]) / self.voxel_size).astype(np.int64)
+        point_indices = ((coords >= 0) & (coords < self.grid_size)).all(axis=1).nonzero()[0]
+        point_coords = coords[point_indices, ::-1].astype(np.int32)
+        return point_indices, point_coords
+
+    def get_point_voxel_ids(self, points):
+        """
+        Args:
+            points: (N, 3 + C)
+        Returns:
+            point_indices: (M), indices of the points inside the grid
+            voxel_ids: (M), voxel of each of these points, voxels are numbered by their first point
+            coordinates: (num_voxels, 3), [z, y, x]
+        """
+        point_indices, point_coords = self.generate_dynamic(points)
+
+        coords = point_coords.astype(np.int64)
+        keys = (coords[:, 0] * self.grid_size[1] + coords[:, 1]) * self.grid_size[0] + coords[:, 2]
+        _, first_indices, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        voxel_order = np.argsort(first_indices)
+        voxel_ranks = np.empty_like(voxel_order)
+        voxel_ranks[voxel_order] = np.arange(voxel_order.shape[0])
+        voxel_ids = voxel_ranks[inverse.reshape(-1)]
+        coordinates = point_coords[first_indices[voxel_order]]
+        return point_indices, voxel_ids, coordinates
+
+    def generate(self, points):
+        point_indices, voxel_ids, coordinates = self.get_point_voxel_ids(points)
+        num_voxels = min(coordinates.shape[0], self.max_num_voxels)
+        mask = voxel_ids < num_voxels
+        point_indices, voxel_ids, coordinates = point_indices[mask], voxel_ids[mask], coordinates[:num_voxels]
+
+        order = np.argsort(voxel_ids, kind='stable')
+        point_indices, voxel_ids = point_indices[order], voxel_ids[order]
+        voxel_point_counts = np.bincount(voxel_ids, minlength=num_voxels)
+        voxel_starts = np.cumsum(voxel_point_counts) - voxel_point_counts
+
+        if self.mean_pooling:
+            voxel_sums = np.add.reduceat(points[point_indices].astype(np.float64), voxel_starts, axis=0) \
+                if num_voxels > 0 else np.zeros((0, points.shape[1]))
+            voxels = (voxel_sums / voxel_point_counts[:, np.newaxis]).astype(points.dtype)[:, np.newaxis, :]
+            num_points = np.ones(num_voxels, dtype=np.int32)
+            return voxels, coordinates, num_points
+
+        slots = np.arange(voxel_ids.shape[0]) - voxel_starts[voxel_ids]
+        mask = slots < self.max_num_points_per_voxel
+        voxels = np.zeros((num_voxels, self.max_num_points_per_voxel, points.shape[1]), dtype=points.dtype)
+        voxels[voxel_ids[mask], slots[mask]] = points[point_indices[mask]]
+        num_points = np.minimum(voxel_point_counts, self.max_num_points_per_voxel).astype(np.int32)
+        return voxels, coordinates, num_points
+
+
 class DataProcessor(object):
-    def __init__(self, processor_configs, point_cloud_range, training, num_point_features):
+    def __init__(self, processor_configs, point_cloud_range, training, num_point_features, num_gpu_processors=0):
         self.point_cloud_range = point_cloud_range
         self.training = training
         self.num_point_features = num_point_features
@@ -74,6 +150,8 @@ class DataProcessor(object):
         for cur_cfg in processor_configs:
             cur_processor = getattr(self, cur_cfg.NAME)(config=cur_cfg)
             self.data_processor_queue.append(cur_processor)
+        # the last num_gpu_processors are only bound for the grid size, they run in the model instead
+        self.data_processor_queue = self.data_processor_queue[:len(self.data_processor_queue) - num_gpu_processors]
 
     def mask_points_and_boxes_outside_range(self, data_dict=None, config=None):
         if data_dict is None:
@@ -111,14 +189,39 @@ class DataProcessor(object):
             # to avoid pickling issues in multiprocess spawn
             return partial(self.transform_points_to_voxels, config=config)
 
+        if config.get('DYNAMIC', False):
+            # dynamic voxelization, only the voxel of every point is kept and the VFE reduces the points per voxel
+            if self.voxel_generator is None:
+                self.voxel_generator = NumpyVoxelGenerator(
+                    vsize_xyz=config.VOXEL_SIZE,
+                    coors_range_xyz=self.point_cloud_range,
+                    num_point_features=self.num_point_features,
+                    max_num_points_per_voxel=config.MAX_POINTS_PER_VOXEL,
+                    max_num_voxels=config.MAX_NUMBER_OF_VOXELS[self.mode]
+                )
+            point_indices, point_coords = self.voxel_generator.generate_dynamic(data_dict['points'])
+            data_dict['points'] = data_dict['points'][point_indices]
+            data_dict['point_voxel_coords'] = point_coords
+            return data_dict
+
         if self.voxel_generator is None:
-            self.voxel_generator = VoxelGeneratorWrapper(
-                vsize_xyz=config.VOXEL_SIZE,
-                coors_range_xyz=self.point_cloud_range,
-                num_point_features=self.num_point_features,
-                max_num_points_per_voxel=config.MAX_POINTS_PER_VOXEL,
-                max_num_voxels=config.MAX_NUMBER_OF_VOXELS[self.mode],
-            )
+            if config.get('VOXELIZER', 'spconv') == 'numpy':
+                self.voxel_generator = NumpyVoxelGenerator(
+                    vsize_xyz=config.VOXEL_SIZE,
+                    coors_range_xyz=self.point_cloud_range,
+                    num_point_features=self.num_point_features,
+                    max_num_points_per_voxel=config.MAX_POINTS_PER_VOXEL,
+                    max_num_voxels=config.MAX_NUMBER_OF_VOXELS[self.mode],
+                    mean_pooling=config.get('MEAN_POOLING', False)
+                )
+            else:
+                self.voxel_generator = VoxelGeneratorWrapper(
+                    vsize_xyz=config.VOXEL_SIZE,
+                    coors_range_xyz=self.point_cloud_range,
+                    num_point_features=self.num_point_features,
+                    max_num_points_per_voxel=config.MAX_POINTS_PER_VOXEL,
+                    max_num_voxels=config.MAX_NUMBER_OF_VOXELS[self.mode],
+                )
 
         points = data_dict['points']
         voxel_output = self.voxel_generator.generate(points)
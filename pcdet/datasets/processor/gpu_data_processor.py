@@ -0,0 +1,209 @@
+import numpy as np
+import torch
+import torch.nn as nn
+
+from ...utils import box_utils, common_utils
+from ..augmentor import augmentor_utils
+
+GPU_AUGMENTOR_NAMES = augmentor_utils.GLOBAL_TRANSFORM_NAMES
+GPU_PROCESSOR_NAMES = ['mask_points_and_boxes_outside_range', 'shuffle_points', 'transform_points_to_voxels']
+
+
+def get_gpu_stage_configs(dataset_cfg):
+    """
+    The part of the training pipeline that is moved to the GPU, it has to be a suffix of the pipeline: the trailing
+    DATA_PROCESSOR entries in GPU_PROCESSOR_NAMES, and if these are all of DATA_PROCESSOR, also the trailing global
+    augmentations of DATA_AUGMENTOR (the point feature encoder in between only selects point features)
+    Args:
+        dataset_cfg:
+    Returns:
+        augmentor_configs: list of the DATA_AUGMENTOR configs that run on the GPU
+        processor_configs: list of the DATA_PROCESSOR configs that run on the GPU
+    """
+    def get_trailing_configs(config_list, names):
+        num_trailing = 0
+        while num_trailing < len(config_list) and config_list[-num_trailing - 1].NAME in names:
+            num_trailing += 1
+        return config_list[len(config_list) - num_trailing:]
+
+    processor_configs = get_trailing_configs(dataset_cfg.DATA_PROCESSOR, GPU_PROCESSOR_NAMES)
+    augmentor_configs = []
+    if len(processor_configs) == len(dataset_cfg.DATA_PROCESSOR):
+        aug_config_list = [
+            cur_cfg for cur_cfg in dataset_cfg.DATA_AUGMENTOR.AUG_CONFIG_LIST
+            if cur_cfg.NAME not in dataset_cfg.DATA_AUGMENTOR.DISABLE_AUG_LIST
+        ]
+        augmentor_configs = get_trailing_configs(aug_config_list, GPU_AUGMENTOR_NAMES)
+    return augmentor_configs, processor_configs
+
+
+class GPUDataProcessor(nn.Module):
+    """
+    Runs the global augmentations, range masking, point shuffling and voxelization of get_gpu_stage_configs for a
+    whole collated batch at the beginning of the forward of the detector, only in training. The voxels are the same
+    as the ones of NumpyVoxelGenerator: ordered by their first point, with at most MAX_POINTS_PER_VOXEL points in
+    point order, and at most MAX_NUMBER_OF_VOXELS['train'] voxels per sample
+    """
+    def __init__(self, augmentor_configs, processor_configs, point_cloud_range):
+        super().__init__()
+        self.augmentor_configs = augmentor_configs
+        self.processor_configs = processor_configs
+        self.point_cloud_range = point_cloud_range
+
+    def random_world_transform(self, batch_dict, config=None):
+        """
+        Every sample draws its own transform with get_global_transform, so the augmentations are the same as the
+        ones of the dataloader
+        """
+        batch_size = batch_dict['batch_size']
+        transforms = [augmentor_utils.get_global_transform(config) for _ in range(batch_size)]
+        points, gt_boxes = batch_dict['points'], batch_dict['gt_boxes']
+        affine = points.new_tensor(np.stack([x['affine'] for x in transforms]))  # (B, 3, 4)
+        heading = points.new_tensor(np.stack([x['heading'] for x in transforms]))  # (B, 2)
+        scale = points.new_tensor([x['scale'] for x in transforms])  # (B)
+        velocity = points.new_tensor(np.stack([x['velocity'] for x in transforms]))  # (B, 2, 2)
+
+        point_affine = affine[points[:, 0].long()]
+        points[:, 1:4] = (point_affine[:, :, :3] @ points[:, 1:4, None]).squeeze(-1) + point_affine[:, :, 3]
+
+        # the zero padding of gt_boxes stays zero
+        valid_mask = (gt_boxes != 0).any(dim=-1, keepdim=True)
+        new_boxes = gt_boxes.clone()
+        new_boxes[..., 0:3] = gt_boxes[..., 0:3] @ affine[:, :, :3].transpose(1, 2) + affine[:, None, :, 3]
+        new_boxes[..., 3:6] = gt_boxes[..., 3:6] * scale[:, None, None]
+        # wrapped as in DataAugmentor.forward
+        new_boxes[..., 6] = common_utils.limit_period(
+            heading[:, None, 0] * gt_boxes[..., 6] + heading[:, None, 1], offset=0.5, period=2 * np.pi
+        )
+        if gt_boxes.shape[-1] > 8:
+            # [x, y, z, dx, dy, dz, heading, vx, vy, ..., class]
+            new_boxes[..., 7:9] = gt_boxes[..., 7:9] @ velocity.transpose(-1, -2)
+        batch_dict['gt_boxes'] = torch.where(valid_mask, new_boxes, gt_boxes)
+        batch_dict['points'] = points
+        return batch_dict
+
+    def mask_points_and_boxes_outside_range(self, batch_dict, config=None):
+        points = batch_dict['points']
+        limit_range = points.new_tensor(self.point_cloud_range)
+        mask = (points[:, 1] >= limit_range[0]) & (points[:, 1] <= limit_range[3]) \
+            & (points[:, 2] >= limit_range[1]) & (points[:, 2] <= limit_range[4])
+        batch_dict['points'] = points[mask]
+
+        if config.REMOVE_OUTSIDE_BOXES:
+            gt_boxes = batch_dict['gt_boxes']
+            batch_size, max_gt, code_size = gt_boxes.shape
+            corners = box_utils.boxes_to_corners_3d(gt_boxes.view(-1, code_size)[:, 0:7]).view(batch_size, max_gt, 8, 3)
+            mask = ((corners >= limit_range[0:3]) & (corners <= limit_range[3:6])).all(dim=-1)
+            mask = (mask.sum(dim=-1) >= config.get('min_num_corners', 1)) & (gt_boxes != 0).any(dim=-1)
+
+            # the kept boxes of every sample are moved to the front, at least one zero box is kept as the target
+            # assigners expect, the dataloader never gives a batch without boxes
+            num_kept = mask.sum(dim=1)
+            new_boxes = gt_boxes.new_zeros((batch_size, max(int(num_kept.max()), 1), code_size))
+            box_slots = mask.cumsum(dim=1) - 1
+            new_boxes[mask.nonzero(as_tuple=True)[0], box_slots[mask]] = gt_boxes[mask]
+            batch_dict['gt_boxes'] = new_boxes
+        return batch_dict
+
+    def shuffle_points(self, batch_dict, config=None):
+        if config.SHUFFLE_ENABLED['train']:
+            points = batch_dict['points']
+            points = points[torch.randperm(points.shape[0], device=points.device)]
+            # the points of every sample are kept together
+            _, order = torch.sort(points[:, 0], stable=True)
+            batch_dict['points'] = points[order]
+        return batch_dict
+
+    def transform_points_to_voxels(self, batch_dict, config=None):
+        points = batch_dict['points']
+        pc_range = points.new_tensor(self.point_cloud_range)
+        voxel_size = points.new_tensor(config.VOXEL_SIZE)
+        grid_size = torch.round((pc_range[3:6] - pc_range[0:3]) / voxel_size).long()
+
+        coords = torch.floor((points[:, 1:4] - pc_range[0:3]) / voxel_size).long()
+        mask = ((coords >= 0) & (coords < grid_size)).all(dim=1)
+        points, coords = points[mask], coords[mask]
+        batch_idx = points[:, 0].long()
+        # [batch_idx, z, y, x]
+        point_coords = torch.cat((batch_idx[:, None], coords.flip(dims=[1])), dim=1)
+
+        if config.get('DYNAMIC', False):
+            batch_dict['points'] = points
+            batch_dict['point_voxel_coords'] = point_coords.float()
+            return batch_dict
+
+        keys = ((batch_idx * grid_size[2] + coords[:, 2]) * grid_size[1] + coords[:, 1]) * grid_size[0] + coords[:, 0]
+        unique_keys, inverse = torch.unique(keys, return_inverse=True)
+        point_order = torch.arange(points.shape[0], device=points.device)
+        first_indices = point_order.new_full((unique_keys.shape[0],), points.shape[0]).scatter_reduce_(
+            0, inverse, point_order, reduce='amin'
+        )
+
+        # number the voxels by their first point, the points of a sample are together so the voxels of a sample too
+        first_indices, voxel_order = torch.sort(first_indices)
+        voxel_ranks = torch.empty_like(voxel_order)
+        voxel_ranks[voxel_order] = torch.arange(voxel_order.shape[0], device=points.device)
+        voxel_ids = voxel_ranks[inverse]
+        voxel_batch_idx = batch_idx[first_indices]
+        voxel_starts = torch.searchsorted(voxel_batch_idx, voxel_batch_idx)
+        max_num_voxels = config.MAX_NUMBER_OF_VOXELS['train']
+        voxel_mask = (torch.arange(voxel_order.shape[0], device=points.device) - voxel_starts) < max_num_voxels
+        voxel_coords = point_coords[first_indices[voxel_mask]]
+
+        # remaining voxels are renumbered
+        new_voxel_ids = voxel_mask.long().cumsum(dim=0) - 1
+        point_mask = voxel_mask[voxel_ids]
+        voxel_ids, point_indices = new_voxel_ids[voxel_ids[point_mask]], point_order[point_mask]
+        num_voxels = voxel_coords.shape[0]
+
+        voxel_ids, order = torch.sort(voxel_ids, stable=True)
+        point_indices = point_indices[order]
+        voxel_point_counts = torch.bincount(voxel_ids, minlength=num_voxels)
+        point_features = points[:, 1:]
+
+        if config.get('MEAN_POOLING', False):
+            voxel_sums = point_features.new_zeros((num_voxels, point_features.shape[1]))
+            voxel_sums.index_add_(0, voxel_ids, point_features[point_indices])
+            voxels = (voxel_sums / voxel_point_counts[:, None].type_as(voxel_sums))[:, None, :]
+            voxel_num_points = torch.ones_like(voxel_point_counts)
+        else:
+            max_points = config.MAX_POINTS_PER_VOXEL
+            voxel_starts = voxel_point_counts.cumsum(dim=0) - voxel_point_counts
+            slots = torch.arange(voxel_ids.shape[0], device=points.device) - voxel_starts[voxel_ids]
+            slot_mask = slots < max_points
+            voxels = point_features.new_zeros((num_voxels, max_points, point_features.shape[1]))
+            voxels[voxel_ids[slot_mask], slots[slot_mask]] = point_features[point_indices[slot_mask]]
+            voxel_num_points = voxel_point_counts.clamp(max=max_points)
+
+        if not batch_dict['use_lead_xyz'][0]:
+            voxels = voxels[..., 3:]  # remove xyz in voxels(N, 3)
+
+        batch_dict['points'] = points
+        batch_dict['voxels'] = voxels
+        batch_dict['voxel_coords'] = voxel_coords.float()
+        batch_dict['voxel_num_points'] = voxel_num_points.float()
+        return batch_dict
+
+    @torch.no_grad()
+    def forward(self, batch_dict):
+        """
+        Args:
+            batch_dict:
+                points: (N, 1 + 3 + C), [batch_idx, x, y, z, ...]
+                gt_boxes: (B, M, 7 + C + 1), zero padded
+                use_lead_xyz: (B)
+        Returns:
+            batch_dict:
+                voxels: optional (num_voxels, max_points_per_voxel, 3 + C)
+                voxel_coords: optional (num_voxels, 4), [batch_idx, z, y, x]
+                voxel_num_points: optional (num_voxels)
+                point_voxel_coords: optional (N, 4), [batch_idx, z, y, x] with DYNAMIC
+        """
+        if not self.training:
+            return batch_dict
+
+        if len(self.augmentor_configs) > 0:
+            batch_dict = self.random_world_transform(batch_dict, config=self.augmentor_configs)
+        for cur_cfg in self.processor_configs:
+            batch_dict = getattr(self, cur_cfg.NAME)(batch_dict, config=cur_cfg)
+        return batch_dict
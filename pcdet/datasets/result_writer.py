@@ -0,0 +1,57 @@
+import queue
+import threading
+
+
+class ResultWriter(object):
+    """
+    Background threads that save the prediction files of generate_prediction_dicts(output_path=...), so that the
+    evaluation loop does not wait for the formatting and writing of the files. They are fed through a bounded queue,
+    the loop only blocks when the writers fall behind by max_queue_size files.
+    """
+    def __init__(self, num_workers=2, max_queue_size=64):
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.errors = []
+        self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(num_workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                break
+            func, args = task
+            try:
+                func(*args)
+            except Exception as e:
+                self.errors.append(e)
+
+    def _check_errors(self):
+        if len(self.errors) > 0:
+            raise self.errors[0]
+
+    def submit(self, func, *args):
+        """
+        Args:
+            func: function that saves one file, called as func(*args) by a writer thread
+            *args: the arrays in args must not be modified afterwards
+        """
+        self._check_errors()
+        self.queue.put((func, args))
+
+    def close(self, raise_errors=True):
+        """
+        Waits until all the files are saved
+        Args:
+            raise_errors: raise the first error of the writers, False when closing on another exception that it
+                should not replace
+        Returns:
+            errors: the errors of the writers
+        """
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if raise_errors:
+            self._check_errors()
+        return self.errors
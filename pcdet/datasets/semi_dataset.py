@@ -5,6 +5,8 @@ import numpy as np
 import torch.utils.data as torch_data
 
 from ..utils import common_utils
+from . import frame_cache
+from .evaluator import CollectingEvaluator
 from .augmentor.data_augmentor import DataAugmentor
 from .augmentor.ssl_data_augmentor import SSLDataAugmentor
 from .processor.data_processor import DataProcessor
@@ -55,10 +57,29 @@ class SemiDatasetTemplate(torch_data.Dataset):
         self.total_epochs = 0
         self._merge_all_iters_to_one_epoch = False
 
+        self.frame_cache = frame_cache.build_frame_cache(self.dataset_cfg, logger=self.logger)
+
     @property
     def mode(self):
         return 'train' if self.training else 'test'
 
+    def get_cached_frame(self, key, load_func):
+        """
+        Loads a decoded frame through the frame cache of FRAME_CACHE_MAX_MB, which is shared by the workers
+        Args:
+            key: key of the frame, e.g. the path of its file
+            load_func: function without arguments that loads the frame when it is not cached
+        Returns:
+            points: (N, C), owned by the caller
+        """
+        if getattr(self, 'frame_cache', None) is None:
+            return load_func()
+        points = self.frame_cache.get(key)
+        if points is None:
+            points = load_func()
+            self.frame_cache.put(key, points)
+        return points
+
     def __getstate__(self):
         d = dict(self.__dict__)
         del d['logger']
@@ -68,7 +89,7 @@ class SemiDatasetTemplate(torch_data.Dataset):
         self.__dict__.update(d)
 
     @staticmethod
-    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None):
+    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None, result_writer=None):
         """
         To support a custom dataset, implement this function to receive the predicted results from the model, and then
         transform the unified normative coordinate to your required coordinate, and optionally save them to disk.
@@ -81,10 +102,25 @@ class SemiDatasetTemplate(torch_data.Dataset):
                 pred_labels: (N), Tensor
             class_names:
             output_path: if it is not None, save the results to this path
+            result_writer: optional ResultWriter, if it is not None, the results are saved by its background threads
         Returns:
 
         """
 
+    def build_evaluator(self, class_names, **kwargs):
+        """
+        To support streaming evaluation (STREAMING_EVAL), implement this function to return a DatasetEvaluator that
+        accumulates the per-frame statistics as the predictions arrive. By default the predictions are collected and
+        passed to self.evaluation at the end.
+
+        Args:
+            class_names:
+            **kwargs: the kwargs of self.evaluation
+        Returns:
+            evaluator: DatasetEvaluator
+        """
+        return CollectingEvaluator(self, class_names, **kwargs)
+
     def merge_all_iters_to_one_epoch(self, merge=True, epochs=None):
         if merge:
             self._merge_all_iters_to_one_epoch = True
@@ -228,7 +264,7 @@ class SemiDatasetTemplate(torch_data.Dataset):
         return teacher_data_dict, student_data_dict
 
     @staticmethod
-    def collate_batch(batch_list, _unused=False):
+    def collate_batch(batch_list, _unused=False, pin_memory=False):
 
         def collate_single_batch(batch_list):
             data_dict = defaultdict(list)
@@ -244,23 +280,17 @@ class SemiDatasetTemplate(torch_data.Dataset):
             for key, val in data_dict.items():
                 try:
                     if key in ['voxels', 'voxel_num_points']:
-                        ret[key] = np.concatenate(val, axis=0)
-                    elif key in ['points', 'voxel_coords']:
-                        coors = []
-                        for i, coor in enumerate(val):
-                            coor_pad = np.pad(coor, ((0, 0), (1, 0)), mode='constant', constant_values=i)
-                            coors.append(coor_pad)
-                        ret[key] = np.concatenate(coors, axis=0)
+                        ret[key] = common_utils.concatenate_batch(val, pin_memory=pin_memory)
+                    elif key in ['points', 'voxel_coords', 'point_voxel_coords']:
+                        ret[key] = common_utils.concatenate_with_batch_index(val, pin_memory=pin_memory)
                     elif key in ['gt_boxes']:
-                        max_gt = max([len(x) for x in val])
-                        batch_gt_boxes3d = np.zeros((batch_size, max_gt, val[0].shape[-1]), dtype=np.float32)
-                        for k in range(batch_size):
-                            batch_gt_boxes3d[k, :val[k].__len__(), :] = val[k]
-                        ret[key] = batch_gt_boxes3d
+                        ret[key] = common_utils.stack_with_padding(
+                            val, pad_value=0, dtype=np.float32, pin_memory=pin_memory
+                        )
                     elif key in ['augmentation_list', 'augmentation_params']:
                         ret[key] = val
                     else:
-                        ret[key] = np.stack(val, axis=0)
+                        ret[key] = common_utils.stack_batch(val, pin_memory=pin_memory)
                 except:
                     print('Error in collate_batch: key=%s' % key)
                     raise TypeError
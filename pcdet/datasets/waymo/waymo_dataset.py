@@ -9,12 +9,12 @@ import copy
 import numpy as np
 import torch
 import multiprocessing
-import SharedArray
 import torch.distributed as dist
 from tqdm import tqdm
 from pathlib import Path
 from ...ops.roiaware_pool3d import roiaware_pool3d_utils
 from ...utils import box_utils, common_utils
+from .. import info_store
 from ..dataset import DatasetTemplate
 
 
@@ -55,23 +55,19 @@ class WaymoDataset(DatasetTemplate):
         for k in range(len(self.sample_sequence_list)):
             sequence_name = os.path.splitext(self.sample_sequence_list[k])[0]
             info_path = self.data_path / sequence_name / ('%s.pkl' % sequence_name)
-            info_path = self.check_sequence_name_with_all_version(info_path)
+            info_path = self.get_info_path(self.check_sequence_name_with_all_version(info_path))
             if not info_path.exists():
                 num_skipped_infos += 1
                 continue
-            with open(info_path, 'rb') as f:
-                infos = pickle.load(f)
-                waymo_infos.extend(infos)
+            waymo_infos.append(info_store.load_infos(info_path))
+        waymo_infos = info_store.merge_infos(*waymo_infos)
 
-        self.infos.extend(waymo_infos[:])
+        self.infos = info_store.merge_infos(self.infos, waymo_infos)
         self.logger.info('Total skipped info %s' % num_skipped_infos)
         self.logger.info('Total samples for Waymo dataset: %d' % (len(waymo_infos)))
 
         if self.dataset_cfg.SAMPLED_INTERVAL[mode] > 1:
-            sampled_waymo_infos = []
-            for k in range(0, len(self.infos), self.dataset_cfg.SAMPLED_INTERVAL[mode]):
-                sampled_waymo_infos.append(self.infos[k])
-            self.infos = sampled_waymo_infos
+            self.infos = self.infos[::self.dataset_cfg.SAMPLED_INTERVAL[mode]]
             self.logger.info('Total sampled samples for Waymo dataset: %d' % len(self.infos))
 
     def load_data_to_shared_memory(self):
@@ -97,6 +93,8 @@ class WaymoDataset(DatasetTemplate):
         self.logger.info('Training data has been saved to shared memory')
 
     def clean_shared_memory(self):
+        import SharedArray
+
         self.logger.info(f'Clean training data from shared memory (file limit={self.shared_memory_file_limit})')
 
         cur_rank, num_gpus = common_utils.get_dist_info()
@@ -176,16 +174,20 @@ class WaymoDataset(DatasetTemplate):
         if self._merge_all_iters_to_one_epoch:
             index = index % len(self.infos)
 
-        info = copy.deepcopy(self.infos[index])
+        info = info_store.get_info_copy(self.infos, index)
         pc_info = info['point_cloud']
         sequence_name = pc_info['lidar_sequence']
         sample_idx = pc_info['sample_idx']
 
         if self.use_shared_memory and index < self.shared_memory_file_limit:
+            import SharedArray
+
             sa_key = f'{sequence_name}___{sample_idx}'
             points = SharedArray.attach(f"shm://{sa_key}").copy()
         else:
-            points = self.get_lidar(sequence_name, sample_idx)
+            points = self.get_cached_frame(
+                (sequence_name, sample_idx), lambda: self.get_lidar(sequence_name, sample_idx)
+            )
 
         input_dict = {
             'points': points,
@@ -219,7 +221,7 @@ class WaymoDataset(DatasetTemplate):
         return data_dict
 
     @staticmethod
-    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None):
+    def generate_prediction_dicts(batch_dict, pred_dicts, class_names, output_path=None, result_writer=None):
         """
         Args:
             batch_dict:
@@ -230,6 +232,7 @@ class WaymoDataset(DatasetTemplate):
                 pred_labels: (N), Tensor
             class_names:
             output_path:
+            result_writer:
 
         Returns:
 
@@ -380,7 +383,7 @@ class WaymoDataset(DatasetTemplate):
                                'sample_idx': sample_idx, 'gt_idx': i, 'box3d_lidar': gt_boxes[i],
                                'num_points_in_gt': gt_points.shape[0], 'difficulty': difficulty[i]}
 
-                    # it will be used if you choose to use shared memory for gt sampling
+                    # it will be used if you choose to use shared memory or memory-mapped reads for gt sampling
                     stacked_gt_points.append(gt_points)
                     db_info['global_data_offset'] = [point_offset_cnt, point_offset_cnt + gt_points.shape[0]]
                     point_offset_cnt += gt_points.shape[0]
@@ -395,7 +398,7 @@ class WaymoDataset(DatasetTemplate):
         with open(db_info_save_path, 'wb') as f:
             pickle.dump(all_db_infos, f)
 
-        # it will be used if you choose to use shared memory for gt sampling
+        # it will be used if you choose to use shared memory or memory-mapped reads for gt sampling
         stacked_gt_points = np.concatenate(stacked_gt_points, axis=0)
         np.save(db_data_save_path, stacked_gt_points)
 
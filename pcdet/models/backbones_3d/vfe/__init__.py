@@ -1,5 +1,7 @@
 from .mean_vfe import MeanVFE
 from .pillar_vfe import PillarVFE
+from .dynamic_mean_vfe import DynamicMeanVFE
+from .dynamic_pillar_vfe import DynamicPillarVFE
 from .image_vfe import ImageVFE
 from .vfe_template import VFETemplate
 
@@ -7,5 +9,7 @@ __all__ = {
     'VFETemplate': VFETemplate,
     'MeanVFE': MeanVFE,
     'PillarVFE': PillarVFE,
+    'DynamicMeanVFE': DynamicMeanVFE,
+    'DynamicPillarVFE': DynamicPillarVFE,
     'ImageVFE': ImageVFE
 }
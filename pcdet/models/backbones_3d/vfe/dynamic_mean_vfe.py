@@ -0,0 +1,82 @@
+import torch
+
+from .vfe_template import VFETemplate
+
+
+def get_dynamic_voxels(point_voxel_coords, grid_size):
+    """
+    Args:
+        point_voxel_coords: (N, 4), [batch_idx, z, y, x] of the voxel of every point
+        grid_size: [nx, ny, nz]
+
+    Returns:
+        voxel_coords: (num_voxels, 4), [batch_idx, z, y, x]
+        point_voxel_ids: (N), index of the voxel of every point
+    """
+    nx, ny, nz = int(grid_size[0]), int(grid_size[1]), int(grid_size[2])
+    coords = point_voxel_coords.long()
+    keys = ((coords[:, 0] * nz + coords[:, 1]) * ny + coords[:, 2]) * nx + coords[:, 3]
+    voxel_keys, point_voxel_ids = torch.unique(keys, return_inverse=True)
+    voxel_coords = torch.stack((
+        voxel_keys // (nz * ny * nx), (voxel_keys // (ny * nx)) % nz, (voxel_keys // nx) % ny, voxel_keys % nx
+    ), dim=1)
+    return voxel_coords.type_as(point_voxel_coords), point_voxel_ids
+
+
+def scatter_mean(features, index, num_voxels):
+    """
+    Args:
+        features: (N, C)
+        index: (N), voxel of every feature
+        num_voxels:
+
+    Returns:
+        voxel_features: (num_voxels, C)
+    """
+    voxel_features = features.new_zeros((num_voxels, features.shape[1])).index_add_(0, index, features)
+    normalizer = torch.clamp_min(torch.bincount(index, minlength=num_voxels), min=1).type_as(features)
+    return voxel_features / normalizer.view(-1, 1)
+
+
+def scatter_max(features, index, num_voxels):
+    """
+    Args:
+        features: (N, C)
+        index: (N), voxel of every feature
+        num_voxels:
+
+    Returns:
+        voxel_features: (num_voxels, C)
+    """
+    return features.new_zeros((num_voxels, features.shape[1])).scatter_reduce_(
+        0, index.view(-1, 1).expand_as(features), features, reduce='amax', include_self=False
+    )
+
+
+class DynamicMeanVFE(VFETemplate):
+    def __init__(self, model_cfg, num_point_features, grid_size, **kwargs):
+        super().__init__(model_cfg=model_cfg)
+        self.num_point_features = num_point_features
+        self.grid_size = grid_size
+
+    def get_output_feature_dim(self):
+        return self.num_point_features
+
+    def forward(self, batch_dict, **kwargs):
+        """
+        Args:
+            batch_dict:
+                points: (N, 1 + C), [batch_idx, x, y, z, ...]
+                point_voxel_coords: (N, 4), [batch_idx, z, y, x]
+            **kwargs:
+
+        Returns:
+            vfe_features: (num_voxels, C)
+        """
+        points = batch_dict['points']
+        voxel_coords, point_voxel_ids = get_dynamic_voxels(batch_dict['point_voxel_coords'], self.grid_size)
+        points_mean = scatter_mean(points[:, 1:], point_voxel_ids, voxel_coords.shape[0])
+
+        batch_dict['voxel_features'] = points_mean.contiguous()
+        batch_dict['voxel_coords'] = voxel_coords
+        return batch_dict
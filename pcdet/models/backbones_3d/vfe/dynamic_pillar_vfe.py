@@ -0,0 +1,132 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from .vfe_template import VFETemplate
+from .dynamic_mean_vfe import get_dynamic_voxels, scatter_mean, scatter_max
+
+
+class DynamicPFNLayer(nn.Module):
+    def __init__(self,
+                 in_channels,
+                 out_channels,
+                 use_norm=True,
+                 last_layer=False):
+        super().__init__()
+
+        self.last_vfe = last_layer
+        self.use_norm = use_norm
+        if not self.last_vfe:
+            out_channels = out_channels // 2
+
+        if self.use_norm:
+            self.linear = nn.Linear(in_channels, out_channels, bias=False)
+            self.norm = nn.BatchNorm1d(out_channels, eps=1e-3, momentum=0.01)
+        else:
+            self.linear = nn.Linear(in_channels, out_channels, bias=True)
+
+        self.part = 50000
+
+    def forward(self, inputs, point_voxel_ids, num_voxels):
+        """
+        Args:
+            inputs: (N, C_in), features of the points
+            point_voxel_ids: (N), index of the voxel of every point
+            num_voxels:
+
+        Returns:
+            features: (num_voxels, C_out) for the last layer, else (N, C_out)
+        """
+        if inputs.shape[0] > self.part:
+            # nn.Linear performs randomly when batch size is too large
+            num_parts = inputs.shape[0] // self.part
+            part_linear_out = [self.linear(inputs[num_part*self.part:(num_part+1)*self.part])
+                               for num_part in range(num_parts+1)]
+            x = torch.cat(part_linear_out, dim=0)
+        else:
+            x = self.linear(inputs)
+        x = self.norm(x) if self.use_norm else x
+        x = F.relu(x)
+        x_max = scatter_max(x, point_voxel_ids, num_voxels)
+
+        if self.last_vfe:
+            return x_max
+        else:
+            x_concatenated = torch.cat([x, x_max[point_voxel_ids]], dim=1)
+            return x_concatenated
+
+
+class DynamicPillarVFE(VFETemplate):
+    def __init__(self, model_cfg, num_point_features, voxel_size, point_cloud_range, grid_size, **kwargs):
+        super().__init__(model_cfg=model_cfg)
+
+        self.use_norm = self.model_cfg.USE_NORM
+        self.with_distance = self.model_cfg.WITH_DISTANCE
+        self.use_absolute_xyz = self.model_cfg.USE_ABSLOTE_XYZ
+        num_point_features += 6 if self.use_absolute_xyz else 3
+        if self.with_distance:
+            num_point_features += 1
+
+        self.num_filters = self.model_cfg.NUM_FILTERS
+        assert len(self.num_filters) > 0
+        num_filters = [num_point_features] + list(self.num_filters)
+
+        pfn_layers = []
+        for i in range(len(num_filters) - 1):
+            in_filters = num_filters[i]
+            out_filters = num_filters[i + 1]
+            pfn_layers.append(
+                DynamicPFNLayer(in_filters, out_filters, self.use_norm, last_layer=(i >= len(num_filters) - 2))
+            )
+        self.pfn_layers = nn.ModuleList(pfn_layers)
+
+        self.grid_size = grid_size
+        self.voxel_x = voxel_size[0]
+        self.voxel_y = voxel_size[1]
+        self.voxel_z = voxel_size[2]
+        self.x_offset = self.voxel_x / 2 + point_cloud_range[0]
+        self.y_offset = self.voxel_y / 2 + point_cloud_range[1]
+        self.z_offset = self.voxel_z / 2 + point_cloud_range[2]
+
+    def get_output_feature_dim(self):
+        return self.num_filters[-1]
+
+    def forward(self, batch_dict, **kwargs):
+        """
+        Args:
+            batch_dict:
+                points: (N, 1 + C), [batch_idx, x, y, z, ...]
+                point_voxel_coords: (N, 4), [batch_idx, z, y, x]
+            **kwargs:
+
+        Returns:
+            pillar_features: (num_voxels, C)
+        """
+        points, point_coords = batch_dict['points'], batch_dict['point_voxel_coords']
+        voxel_coords, point_voxel_ids = get_dynamic_voxels(point_coords, self.grid_size)
+        num_voxels = voxel_coords.shape[0]
+
+        points_xyz = points[:, 1:4]
+        points_mean = scatter_mean(points_xyz, point_voxel_ids, num_voxels)
+        f_cluster = points_xyz - points_mean[point_voxel_ids]
+
+        f_center = torch.zeros_like(points_xyz)
+        f_center[:, 0] = points_xyz[:, 0] - (point_coords[:, 3].to(points.dtype) * self.voxel_x + self.x_offset)
+        f_center[:, 1] = points_xyz[:, 1] - (point_coords[:, 2].to(points.dtype) * self.voxel_y + self.y_offset)
+        f_center[:, 2] = points_xyz[:, 2] - (point_coords[:, 1].to(points.dtype) * self.voxel_z + self.z_offset)
+
+        if self.use_absolute_xyz:
+            features = [points[:, 1:], f_cluster, f_center]
+        else:
+            features = [points[:, 4:], f_cluster, f_center]
+
+        if self.with_distance:
+            points_dist = torch.norm(points_xyz, 2, 1, keepdim=True)
+            features.append(points_dist)
+        features = torch.cat(features, dim=-1)
+
+        for pfn in self.pfn_layers:
+            features = pfn(features, point_voxel_ids, num_voxels)
+        batch_dict['pillar_features'] = features
+        batch_dict['voxel_coords'] = voxel_coords
+        return batch_dict
@@ -57,7 +57,8 @@ class AnchorHeadTemplate(nn.Module):
                 topk=anchor_target_cfg.TOPK,
                 box_coder=self.box_coder,
                 use_multihead=self.use_multihead,
-                match_height=anchor_target_cfg.MATCH_HEIGHT
+                match_height=anchor_target_cfg.MATCH_HEIGHT,
+                anchor_chunk_size=anchor_target_cfg.get('ANCHOR_CHUNK_SIZE', None)
             )
         elif anchor_target_cfg.NAME == 'AxisAlignedTargetAssigner':
             target_assigner = AxisAlignedTargetAssigner(
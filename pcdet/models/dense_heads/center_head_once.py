@@ -4,12 +4,11 @@ import copy
 import sys
 from collections import OrderedDict
 import numpy as np
-import numba
 from ...ops.dcn import DeformConv
 from ...ops.iou3d_nms import iou3d_nms_cuda
 from ...ops.center_ops import center_ops_cuda
 
-from ..model_utils import centernet_box_utils
+from ..model_utils import centernet_box_utils, centernet_utils
 from ...utils import loss_utils
 from .target_assigner.center_assigner import CenterAssigner
 
@@ -84,9 +83,10 @@ class CenterHead(nn.Module):
         Returns:
 
         """
-        targets_dict = self.target_assigner.assign_targets_v2(
-            gt_boxes
-        )
+        if gt_boxes.is_cuda:
+            targets_dict = self.target_assigner.assign_targets_v2(gt_boxes)
+        else:
+            targets_dict = self.target_assigner.assign_targets_v1(gt_boxes)
 
         return targets_dict
 
@@ -310,39 +310,11 @@ class CenterHead(nn.Module):
 
         return topk_score, topk_inds, topk_clses, topk_ys, topk_xs
 
-    @numba.jit(nopython=True)
-    def circle_nms(self, dets, thresh):
-        x1 = dets[:, 0]
-        y1 = dets[:, 1]
-        scores = dets[:, 2]
-        order = scores.argsort()[::-1].astype(np.int32)  # highest->lowest
-        ndets = dets.shape[0]
-        suppressed = np.zeros((ndets), dtype=np.int32)
-        keep = []
-        for _i in range(ndets):
-            i = order[_i]  # start with highest score box
-            if suppressed[i] == 1:  # if any box have enough iou with this, remove it
-                continue
-            keep.append(i)
-            for _j in range(_i + 1, ndets):
-                j = order[_j]
-                if suppressed[j] == 1:
-                    continue
-                # calculate center distance between i and j box
-                dist = (x1[i] - x1[j]) ** 2 + (y1[i] - y1[j]) ** 2
-
-                # ovr = inter / areas[j]
-                if dist <= thresh:
-                    suppressed[j] = 1
-        return keep
-
     def _circle_nms(self, boxes, min_radius, post_max_size=83):
         """
         NMS according to center distance
         """
-        keep = np.array(self.circle_nms(boxes.cpu().numpy(), thresh=min_radius))[:post_max_size]
-        keep = torch.from_numpy(keep).long().to(boxes.device)
-        return keep
+        return centernet_utils._circle_nms(boxes, min_radius=min_radius, post_max_size=post_max_size)
 
     def _rotate_nms(self, boxes, scores, thresh, pre_maxsize=None, post_max_size=None):
         """
@@ -405,17 +377,41 @@ class CenterHead(nn.Module):
         boxes_bev[:, 4] = boxes3d[:, -1]
         return boxes_bev
 
+    @staticmethod
+    def _use_circle_nms(nms_cfg, task_id):
+        return nms_cfg.get('circle_nms', False) and (nms_cfg.min_radius[task_id] != -1)
+
     @torch.no_grad()
     def proposal_layer(self, heat, rots, rotc, hei, dim, vel, reg = None,
                        post_center_range=None, score_threshold=None, cfg=None, raw_rot=False, task_id=-1):
+        final_box_preds, final_scores, final_preds, mask = self.decode_proposals(
+            heat, rots, rotc, hei, dim, vel, reg=reg, post_center_range=post_center_range,
+            score_threshold=score_threshold, cfg=cfg, raw_rot=raw_rot, task_id=task_id
+        )
+        nms_cfg = cfg.nms.train if self.training else cfg.nms.test
+        if self._use_circle_nms(nms_cfg, task_id):
+            mask = centernet_utils.circle_nms_batched(
+                final_box_preds[..., 0:2], final_scores, thresh=nms_cfg.min_radius[task_id],
+                valid_mask=mask, post_max_size=nms_cfg.post_max_size
+            )
+        return self.select_proposals(final_box_preds, final_scores, final_preds, mask, cfg=cfg, task_id=task_id)
 
+    @torch.no_grad()
+    def decode_proposals(self, heat, rots, rotc, hei, dim, vel, reg = None,
+                         post_center_range=None, score_threshold=None, cfg=None, raw_rot=False, task_id=-1):
+        """
+        Returns:
+            final_box_preds: (B, K, 7 + C) top K candidates of the heatmap by descending score
+            final_scores: (B, K)
+            final_preds: (B, K) labels in the task
+            mask: (B, K) candidates inside post_center_range and above score_threshold
+        """
         assert self.encode_background_as_zeros is True
         assert self.use_sigmoid_score is True
         batch, cat, _, _ = heat.size()
         nms_cfg = cfg.nms.train if self.training else cfg.nms.test
         K = nms_cfg.nms_pre_max_size # topK selected
         maxpool = nms_cfg.get('max_pool_nms', False) or (nms_cfg.get('circle_nms', False) and (nms_cfg.min_radius[task_id] == -1))
-        use_circle_nms = nms_cfg.get('circle_nms', False) and (nms_cfg.min_radius[task_id] != -1)
         if maxpool:
             heat = self._nms(heat)
         scores, inds, clses, ys, xs = self._topk(heat, K=K)
@@ -468,26 +464,30 @@ class CenterHead(nn.Module):
         assert score_threshold is not None
         thresh_mask = final_scores > score_threshold
         mask &= thresh_mask
+        return final_box_preds, final_scores, final_preds, mask
+
+    @torch.no_grad()
+    def select_proposals(self, final_box_preds, final_scores, final_preds, mask, cfg=None, task_id=-1):
+        """
+        Args:
+            final_box_preds, final_scores, final_preds, mask: decode_proposals of one task, the circle nms is already
+                applied to the mask
+        Returns:
+            predictions_dicts: boxes, scores and labels of every sample
+        """
+        nms_cfg = cfg.nms.train if self.training else cfg.nms.test
+        maxpool = nms_cfg.get('max_pool_nms', False) or (nms_cfg.get('circle_nms', False) and (nms_cfg.min_radius[task_id] == -1))
+        use_circle_nms = self._use_circle_nms(nms_cfg, task_id)
 
         predictions_dicts = []
-        for i in range(batch):
+        for i in range(final_box_preds.shape[0]):
             cmask = mask[i, :]
             boxes3d = final_box_preds[i, cmask]
             scores = final_scores[i, cmask]
             labels = final_preds[i, cmask]
 
-            # circle nms
-            if use_circle_nms:
-                centers = boxes3d[:, [0, 1]]
-                boxes = torch.cat([centers, scores.view(-1, 1)], dim=1)
-                keep = self._circle_nms(boxes, min_radius=nms_cfg.min_radius[task_id], post_max_size=nms_cfg.post_max_size)
-
-                boxes3d = boxes3d[keep]
-                scores = scores[keep]
-                labels = labels[keep]
-
-            # rotate nms
-            elif nms_cfg.get('use_rotate_nms', False):
+            # rotate nms, the circle nms is already applied to the mask
+            if not use_circle_nms and nms_cfg.get('use_rotate_nms', False):
                 assert not maxpool
                 top_scores = scores
                 if top_scores.shape[0] != 0:
@@ -504,7 +504,7 @@ class CenterHead(nn.Module):
                 scores = scores[selected]
 
             # iou 3d nms
-            elif nms_cfg.get('use_iou_3d_nms', False):
+            elif not use_circle_nms and nms_cfg.get('use_iou_3d_nms', False):
                 assert not maxpool
                 top_scores = scores
                 if top_scores.shape[0] != 0:
@@ -542,6 +542,7 @@ class CenterHead(nn.Module):
         task_box_preds = {}
         task_score_preds = {}
         task_label_preds = {}
+        task_proposals = []
         for task_id, pred_dict in enumerate(pred_dicts):
             batch_size = pred_dict['hm'].shape[0]
             if double_flip:
@@ -572,7 +573,7 @@ class CenterHead(nn.Module):
                     batch_vel = None
 
             #decode
-            boxes = self.proposal_layer(
+            task_proposals.append(list(self.decode_proposals(
                 batch_hm,
                 batch_rots,
                 batch_rotc,
@@ -584,7 +585,25 @@ class CenterHead(nn.Module):
                 score_threshold=self.post_cfg.score_threshold,
                 cfg=self.post_cfg,
                 task_id=task_id
+            )))
+
+        # circle nms of all the samples and tasks at once on the padded candidates, the tasks have the same K
+        nms_cfg = self.post_cfg.nms.train if self.training else self.post_cfg.nms.test
+        circle_task_ids = [task_id for task_id in range(len(pred_dicts)) if self._use_circle_nms(nms_cfg, task_id)]
+        if len(circle_task_ids) > 0:
+            batch_size = task_proposals[0][0].shape[0]
+            keep = centernet_utils.circle_nms_batched(
+                torch.cat([task_proposals[task_id][0][..., 0:2] for task_id in circle_task_ids], dim=0),
+                torch.cat([task_proposals[task_id][1] for task_id in circle_task_ids], dim=0),
+                thresh=torch.tensor([nms_cfg.min_radius[task_id] for task_id in circle_task_ids]).repeat_interleave(batch_size),
+                valid_mask=torch.cat([task_proposals[task_id][3] for task_id in circle_task_ids], dim=0),
+                post_max_size=nms_cfg.post_max_size
             )
+            for k, task_id in enumerate(circle_task_ids):
+                task_proposals[task_id][3] = keep[k * batch_size:(k + 1) * batch_size]
+
+        for task_id, proposals in enumerate(task_proposals):
+            boxes = self.select_proposals(*proposals, cfg=self.post_cfg, task_id=task_id)
             task_box_preds[task_id] = [box['boxes'] for box in boxes]
             task_score_preds[task_id] = [box['scores'] for box in boxes]
             task_label_preds[task_id] = [box['labels'] for box in boxes] #labels are local here
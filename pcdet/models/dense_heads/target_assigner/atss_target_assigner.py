@@ -8,19 +8,33 @@ class ATSSTargetAssigner(object):
     """
     Reference: https://arxiv.org/abs/1912.02424
     """
-    def __init__(self, topk, box_coder, match_height=False):
+    def __init__(self, topk, box_coder, match_height=False, use_multihead=False, anchor_chunk_size=None):
+        """
+        Args:
+            topk:
+            box_coder:
+            match_height:
+            use_multihead:
+            anchor_chunk_size: the anchors x gt_boxes distances and ious are computed by chunks of anchor_chunk_size
+                anchors to bound the memory, all the anchors at once by default
+        """
         self.topk = topk
         self.box_coder = box_coder
         self.match_height = match_height
+        self.use_multihead = use_multihead
+        self.anchor_chunk_size = anchor_chunk_size
 
-    def assign_targets(self, anchors_list, gt_boxes_with_classes, use_multihead=False):
+    def assign_targets(self, anchors_list, gt_boxes_with_classes, use_multihead=None):
         """
         Args:
             anchors: [(N, 7), ...]
             gt_boxes: (B, M, 8)
+            use_multihead: defaults to self.use_multihead
         Returns:
 
         """
+        if use_multihead is None:
+            use_multihead = self.use_multihead
         if not isinstance(anchors_list, list):
             anchors_list = [anchors_list]
             single_set_of_anchor = True
@@ -83,16 +97,37 @@ class ATSSTargetAssigner(object):
         """
         num_anchor = anchors.shape[0]
         num_gt = gt_boxes.shape[0]
-
-        # select topk anchors for each gt_boxes
-        if self.match_height:
-            ious = iou3d_nms_utils.boxes_iou3d_gpu(anchors[:, 0:7], gt_boxes[:, 0:7])  # (N, M)
-        else:
-            ious = iou3d_nms_utils.boxes_iou_bev(anchors[:, 0:7], gt_boxes[:, 0:7])
-
-        distance = (anchors[:, None, 0:3] - gt_boxes[None, :, 0:3]).norm(dim=-1)  # (N, M)
-        _, topk_idxs = distance.topk(self.topk, dim=0, largest=False)  # (K, M)
-        candidate_ious = ious[topk_idxs, torch.arange(num_gt)]  # (K, M)
+        gt_idxs = torch.arange(num_gt, device=anchors.device)
+        chunk_size = num_anchor if self.anchor_chunk_size is None else max(self.anchor_chunk_size, self.topk)
+
+        # select topk anchors for each gt_boxes, the (C, M) distances and ious of every chunk of anchors are merged
+        # into the topk candidates, the distances are compared as the int bits of the positive floats followed by
+        # the anchor index so that the ties are broken by the anchor index whatever the chunks
+        topk_keys = gt_idxs.new_zeros((0, num_gt))
+        candidate_ious = anchors.new_zeros((0, num_gt))
+        max_iou_of_each_gt = anchors.new_full((num_gt,), -1)
+        argmax_iou_of_each_gt = gt_idxs.new_zeros((num_gt,))
+        for start in range(0, num_anchor, chunk_size):
+            cur_anchors = anchors[start:start + chunk_size]
+            if self.match_height:
+                ious = iou3d_nms_utils.boxes_iou3d_gpu(cur_anchors[:, 0:7], gt_boxes[:, 0:7])  # (C, M)
+            else:
+                ious = iou3d_nms_utils.boxes_iou_bev(cur_anchors[:, 0:7], gt_boxes[:, 0:7])
+
+            # the first anchor with the maximum iou of each gt
+            cur_max_iou, cur_argmax_iou = ious.max(dim=0)
+            is_larger = cur_max_iou > max_iou_of_each_gt
+            max_iou_of_each_gt = torch.where(is_larger, cur_max_iou, max_iou_of_each_gt)
+            argmax_iou_of_each_gt = torch.where(is_larger, cur_argmax_iou + start, argmax_iou_of_each_gt)
+
+            distance = (cur_anchors[:, None, 0:3] - gt_boxes[None, :, 0:3]).norm(dim=-1)  # (C, M)
+            anchor_idxs = torch.arange(start, start + cur_anchors.shape[0], device=anchors.device)
+            keys = torch.cat([topk_keys, (distance.view(torch.int32).long() << 32) + anchor_idxs[:, None]], dim=0)
+            ious = torch.cat([candidate_ious, ious], dim=0)
+            topk_keys, topk_pos = keys.topk(min(self.topk, keys.shape[0]), dim=0, largest=False)
+            candidate_ious = ious.gather(0, topk_pos)  # (K, M)
+
+        topk_idxs = topk_keys & 0xFFFFFFFF  # (K, M)
         iou_mean_per_gt = candidate_ious.mean(dim=0)
         iou_std_per_gt = candidate_ious.std(dim=0)
         iou_thresh_per_gt = iou_mean_per_gt + iou_std_per_gt + 1e-6
@@ -110,21 +145,22 @@ class ATSSTargetAssigner(object):
         is_in_gt = ((xy_local <= lw / 2) & (xy_local >= -lw / 2)).all(dim=-1).view(-1, num_gt)  # (K, M)
         is_pos = is_pos & is_in_gt  # (K, M)
 
-        for ng in range(num_gt):
-            topk_idxs[:, ng] += ng * num_anchor
-
-        # select the highest IoU if an anchor box is assigned with multiple gt_boxes
+        # select the highest IoU if an anchor box is assigned with multiple gt_boxes, the first gt_box on ties
         INF = -0x7FFFFFFF
-        ious_inf = torch.full_like(ious, INF).t().contiguous().view(-1)  # (MxN)
-        index = topk_idxs.view(-1)[is_pos.view(-1)]
-        ious_inf[index] = ious.t().contiguous().view(-1)[index]
-        ious_inf = ious_inf.view(num_gt, -1).t()  # (N, M)
-
-        anchors_to_gt_values, anchors_to_gt_indexs = ious_inf.max(dim=1)
+        pos_anchor_idxs = topk_idxs[is_pos]
+        pos_ious = candidate_ious[is_pos]
+        pos_gt_idxs = gt_idxs[None, :].expand_as(topk_idxs)[is_pos]
+        anchors_to_gt_values = anchors.new_full((num_anchor,), INF).scatter_reduce(
+            0, pos_anchor_idxs, pos_ious, reduce='amax'
+        )
+        is_max = pos_ious == anchors_to_gt_values[pos_anchor_idxs]
+        anchors_to_gt_indexs = gt_idxs.new_full((num_anchor,), num_gt).scatter_reduce(
+            0, pos_anchor_idxs[is_max], pos_gt_idxs[is_max], reduce='amin'
+        )
+        anchors_to_gt_indexs[anchors_to_gt_indexs == num_gt] = 0
 
         # match the gt_boxes to the anchors which have maximum iou with them
-        max_iou_of_each_gt, argmax_iou_of_each_gt = ious.max(dim=0)
-        anchors_to_gt_indexs[argmax_iou_of_each_gt] = torch.arange(0, num_gt, device=ious.device)
+        anchors_to_gt_indexs[argmax_iou_of_each_gt] = torch.arange(0, num_gt, device=anchors.device)
         anchors_to_gt_values[argmax_iou_of_each_gt] = max_iou_of_each_gt
 
         cls_labels = gt_classes[anchors_to_gt_indexs]
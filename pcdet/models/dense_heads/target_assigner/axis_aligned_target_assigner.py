@@ -41,7 +41,11 @@ class AxisAlignedTargetAssigner(object):
         Returns:
 
         """
+        if self.pos_fraction is None and gt_boxes_with_classes.is_cuda:
+            return self.assign_targets_batch(all_anchors, gt_boxes_with_classes)
 
+        # the sampling of POS_FRACTION is done for every sample and anchor class, on CPU the loop is faster since it
+        # only computes the IoUs of the gt boxes of each anchor class
         bbox_targets = []
         cls_labels = []
         reg_weights = []
@@ -129,6 +133,115 @@ class AxisAlignedTargetAssigner(object):
         }
         return all_targets_dict
 
+    def assign_targets_batch(self, all_anchors, gt_boxes_with_classes):
+        """
+        Same targets as assign_targets_single without POS_FRACTION, for all the samples and anchor classes at once:
+        the zero-padded gt boxes are masked instead of removed and the IoUs of all the samples are computed in one call
+        Args:
+            all_anchors: [(N, 7), ...]
+            gt_boxes_with_classes: (B, M, 8)
+        Returns:
+
+        """
+        if gt_boxes_with_classes.shape[1] == 0:
+            gt_boxes_with_classes = gt_boxes_with_classes.new_zeros((gt_boxes_with_classes.shape[0], 1, gt_boxes_with_classes.shape[2]))
+        batch_size, num_gt = gt_boxes_with_classes.shape[0], gt_boxes_with_classes.shape[1]
+        gt_classes = gt_boxes_with_classes[:, :, -1].int()
+        gt_boxes = gt_boxes_with_classes[:, :, :-1]
+
+        anchors_list = []
+        for anchors in all_anchors:
+            if self.use_multihead:
+                anchors = anchors.permute(3, 4, 0, 1, 2, 5).contiguous().view(-1, anchors.shape[-1])
+            else:
+                feature_map_size = anchors.shape[:3]
+                anchors = anchors.view(-1, anchors.shape[-1])
+            anchors_list.append(anchors)
+        num_anchors_list = [anchors.shape[0] for anchors in anchors_list]
+        anchors = torch.cat(anchors_list, dim=0)
+        num_anchors = anchors.shape[0]
+
+        # gt class and thresholds of every anchor
+        anchor_class_inds = torch.cat([
+            torch.full((num, ), k, dtype=torch.long, device=anchors.device) for k, num in enumerate(num_anchors_list)
+        ])
+        class_names = self.class_names.tolist()
+        anchor_class_ids = torch.tensor(
+            [class_names.index(name) + 1 if name in class_names else -1 for name in self.anchor_class_names],
+            dtype=torch.int32, device=anchors.device
+        )[anchor_class_inds]
+        matched_thresholds = anchors.new_tensor(
+            [self.matched_thresholds[name] for name in self.anchor_class_names]
+        )[anchor_class_inds]
+        unmatched_thresholds = anchors.new_tensor(
+            [self.unmatched_thresholds[name] for name in self.anchor_class_names]
+        )[anchor_class_inds]
+
+        # the zero boxes padded at the end of every sample are masked out (the first box is always kept)
+        gt_inds = torch.arange(num_gt, device=gt_boxes.device)
+        nonzero_inds = torch.where(gt_boxes.sum(dim=-1) != 0, gt_inds, torch.zeros_like(gt_inds))
+        gt_valid_mask = gt_inds <= nonzero_inds.max(dim=1, keepdim=True)[0]
+        # (B, N, M) the gt boxes are only matched to the anchors of their class
+        pair_mask = gt_valid_mask[:, None, :] & (gt_classes[:, None, :] == anchor_class_ids[None, :, None])
+        has_gt = pair_mask.any(dim=2)
+
+        flat_gt_boxes = gt_boxes.view(-1, gt_boxes.shape[-1])
+        anchor_by_gt_overlap = iou3d_nms_utils.boxes_iou3d_gpu(anchors[:, 0:7], flat_gt_boxes[:, 0:7]) \
+            if self.match_height else box_utils.boxes3d_nearest_bev_iou(anchors[:, 0:7], flat_gt_boxes[:, 0:7])
+        anchor_by_gt_overlap = anchor_by_gt_overlap.view(num_anchors, batch_size, num_gt).transpose(0, 1)
+        anchor_by_gt_overlap = anchor_by_gt_overlap.masked_fill(~pair_mask, -1)
+
+        anchor_to_gt_argmax = anchor_by_gt_overlap.argmax(dim=2)
+        anchor_to_gt_max = anchor_by_gt_overlap.gather(2, anchor_to_gt_argmax.unsqueeze(-1)).squeeze(-1)
+
+        gt_to_anchor_max = anchor_by_gt_overlap.max(dim=1)[0]
+        gt_to_anchor_max[gt_to_anchor_max == 0] = -1
+        anchors_with_max_overlap = (pair_mask & (anchor_by_gt_overlap == gt_to_anchor_max[:, None, :])).any(dim=2)
+
+        matched_gt_classes = gt_classes.gather(1, anchor_to_gt_argmax)
+        labels = torch.full_like(matched_gt_classes, -1)
+        labels = torch.where(anchor_to_gt_max >= matched_thresholds, matched_gt_classes, labels)
+        labels = labels.masked_fill(anchor_to_gt_max < unmatched_thresholds, 0)
+        labels = torch.where(anchors_with_max_overlap, matched_gt_classes, labels)
+        labels = labels.masked_fill(~has_gt, 0)
+        fg_mask = labels > 0
+
+        matched_gt_boxes = gt_boxes.gather(1, anchor_to_gt_argmax.unsqueeze(-1).repeat(1, 1, gt_boxes.shape[-1]))
+        bbox_targets = self.box_coder.encode_torch(
+            matched_gt_boxes.view(-1, gt_boxes.shape[-1]), anchors.repeat(batch_size, 1)
+        ).view(batch_size, num_anchors, -1)
+        bbox_targets = bbox_targets.masked_fill(~fg_mask.unsqueeze(-1), 0)
+
+        if self.norm_by_num_examples:
+            # normalized by the examples of the sample and the anchor class
+            num_examples = anchors.new_zeros((batch_size, len(num_anchors_list))).scatter_add_(
+                1, anchor_class_inds.repeat(batch_size, 1), (labels >= 0).float()
+            )
+            num_examples = torch.clamp_min(num_examples, min=1.0)[:, anchor_class_inds]
+            reg_weights = fg_mask.float() / num_examples
+        else:
+            reg_weights = fg_mask.float()
+
+        if not self.use_multihead:
+            # the anchors of every location are ordered by anchor class
+            labels = torch.cat([
+                t.view(batch_size, *feature_map_size, -1) for t in labels.split(num_anchors_list, dim=1)
+            ], dim=-1).view(batch_size, -1)
+            bbox_targets = torch.cat([
+                t.view(batch_size, *feature_map_size, -1, self.box_coder.code_size)
+                for t in bbox_targets.split(num_anchors_list, dim=1)
+            ], dim=-2).view(batch_size, -1, self.box_coder.code_size)
+            reg_weights = torch.cat([
+                t.view(batch_size, *feature_map_size, -1) for t in reg_weights.split(num_anchors_list, dim=1)
+            ], dim=-1).view(batch_size, -1)
+
+        all_targets_dict = {
+            'box_cls_labels': labels,
+            'box_reg_targets': bbox_targets,
+            'reg_weights': reg_weights
+        }
+        return all_targets_dict
+
     def assign_targets_single(self, anchors, gt_boxes, gt_classes, matched_threshold=0.6, unmatched_threshold=0.45):
 
         num_anchors = anchors.shape[0]
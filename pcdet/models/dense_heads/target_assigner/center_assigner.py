@@ -2,6 +2,7 @@
 import torch
 import math
 from ....ops.center_ops import center_ops_cuda
+from ...model_utils import centernet_utils
 
 class CenterAssigner(object):
     def __init__(self, assigner_cfg, num_classes, no_log, grid_size, pc_range, voxel_size):
@@ -70,8 +71,47 @@ class CenterAssigner(object):
     def limit_period(self, val, offset=0.5, period=math.pi):
         return val - math.floor(val / period + offset) * period
 
+    def draw_gaussians(self, heatmap, batch_inds, class_inds, center_x, center_y, radius):
+        """
+        Draws the gaussians of draw_gaussian for all the boxes at once with a scatter max
+        Args:
+            heatmap: (B, num_class, H, W)
+            batch_inds: (N)
+            class_inds: (N)
+            center_x: (N) int
+            center_y: (N) int
+            radius: (N) int
+
+        Returns:
+            heatmap:
+        """
+        if radius.shape[0] == 0:
+            return heatmap
+        _, num_class, height, width = heatmap.shape
+
+        # one gaussian of gaussian_2d per radius, centered in a window of the largest radius
+        radius_list, gaussian_inds = torch.unique(radius, return_inverse=True)
+        radius_list = radius_list.tolist()
+        max_radius = radius_list[-1]
+        gaussians = heatmap.new_zeros((len(radius_list), 2 * max_radius + 1, 2 * max_radius + 1))
+        for k, cur_radius in enumerate(radius_list):
+            diameter = 2 * cur_radius + 1
+            start = max_radius - cur_radius
+            gaussians[k, start:start + diameter, start:start + diameter] = \
+                self.gaussian_2d((diameter, diameter), sigma=diameter / 6)
+
+        offsets = torch.arange(-max_radius, max_radius + 1, device=heatmap.device)
+        ys = center_y.long().view(-1, 1, 1) + offsets.view(1, -1, 1)
+        xs = center_x.long().view(-1, 1, 1) + offsets.view(1, 1, -1)
+        values = gaussians[gaussian_inds]  # (N, 2R + 1, 2R + 1)
+        mask = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width) & (values > 0)
+        flat_inds = (((batch_inds * num_class + class_inds).view(-1, 1, 1) * height + ys) * width + xs)
+        heatmap.view(-1).scatter_reduce_(0, flat_inds[mask], values[mask], reduce='amax')
+        return heatmap
+
     def assign_targets_v1(self, gt_boxes):
         """
+        Vectorized over the samples and the boxes, works on any device
         Args:
             gt_boxes: (B, M, C + cls)
 
@@ -80,115 +120,80 @@ class CenterAssigner(object):
         """
         max_objs = self._max_objs * self.dense_reg
         feature_map_size = self.grid_size[:2] // self.out_size_factor # grid_size WxHxD feature_map_size WxH
+        width, height = int(feature_map_size[0]), int(feature_map_size[1])
 
-        batch_size = gt_boxes.shape[0]
-        gt_classes = gt_boxes[:, :, -1] #begin from 1
+        batch_size, num_boxes = gt_boxes.shape[0], gt_boxes.shape[1]
+        gt_classes = gt_boxes[:, :, -1].int() #begin from 1
         gt_boxes = gt_boxes[:, :, :-1]
 
+        # the all-zero boxes padded at the end of every sample are dropped (the first box is always kept)
+        box_inds = torch.arange(num_boxes, device=gt_boxes.device)
+        nonzero_inds = torch.where(gt_boxes.sum(dim=-1) != 0, box_inds, torch.zeros_like(box_inds))
+        valid_mask = box_inds <= nonzero_inds.max(dim=1, keepdim=True)[0]
+
+        # same float32 operations as the per-box loop
+        r = gt_boxes[:, :, 6]
+        period = math.pi * 2
+        r = r - (torch.floor(r / period + 0.5).double() * period).float()  # limit_period, r -> [-pi, pi]
+        w = gt_boxes[:, :, 3] / self.voxel_size[0] / self.out_size_factor
+        l = gt_boxes[:, :, 4] / self.voxel_size[1] / self.out_size_factor
+        radius = centernet_utils.gaussian_radius(l, w, min_overlap=self.gaussian_overlap)
+        radius = torch.clamp(radius.int(), min=self._min_radius)
+
+        coor_x = (gt_boxes[:, :, 0] - self.pc_range[0]) / self.voxel_size[0] / self.out_size_factor
+        coor_y = (gt_boxes[:, :, 1] - self.pc_range[1]) / self.voxel_size[1] / self.out_size_factor
+        ct_x, ct_y = coor_x.int(), coor_y.int() #float to int conversion torch/np
+        in_range = (ct_x >= 0) & (ct_x < width) & (ct_y >= 0) & (ct_y < height)
+
+        # Note that w,l has been modified, so in box encoding we use original w,l,h
+        dims = gt_boxes[:, :, 3:6]
+        if not self.no_log:
+            dims = torch.log(dims.double()).float()
+        box_encodings = torch.cat([
+            (coor_x - ct_x).unsqueeze(-1), (coor_y - ct_y).unsqueeze(-1), gt_boxes[:, :, 2:3], dims,
+            torch.sin(r.double()).float().unsqueeze(-1), torch.cos(r.double()).float().unsqueeze(-1),
+            gt_boxes[:, :, 7:9]
+        ], dim=-1)
+
         heatmaps = {}
         gt_inds = {}
         gt_masks = {}
         gt_box_encodings = {}
         gt_cats = {}
         for task_id, task in enumerate(self.tasks):
-            heatmaps[task_id] = []
-            gt_inds[task_id] = []
-            gt_masks[task_id] = []
-            gt_box_encodings[task_id] = []
-            gt_cats[task_id] = []
-
-        for k in range(batch_size):
-            cur_gt = gt_boxes[k]
-            cnt = cur_gt.__len__() - 1
-            while cnt > 0 and cur_gt[cnt].sum() == 0:
-                cnt -= 1
-            cur_gt = cur_gt[:cnt + 1]
-            cur_gt_classes = gt_classes[k][:cnt + 1].int()
-
-            for task_id, task in enumerate(self.tasks):
-                # heatmap size is supposed to be (cls_group, H, W)
-                heatmap = torch.zeros((len(task.class_names), feature_map_size[1], feature_map_size[0]), dtype = torch.float32).to(cur_gt.device) #transpose ????
-                gt_ind = torch.zeros(max_objs, dtype=torch.long).to(cur_gt.device)
-                gt_mask = torch.zeros(max_objs, dtype=torch.bool).to(cur_gt.device)
-                gt_cat = torch.zeros(max_objs, dtype=torch.long).to(cur_gt.device)
-                gt_box_encoding = torch.zeros((max_objs, 10), dtype=torch.float32).to(cur_gt.device)
-
-                cur_gts_of_task = []
-                cur_classes_of_task = []
-                class_offset = 0
-                for class_name in task.class_names:
-                    class_idx = self.class_to_idx[class_name]
-                    class_mask = (cur_gt_classes == class_idx)
-                    cur_gt_of_task = cur_gt[class_mask]
-                    cur_class_of_task = cur_gt.new_full((cur_gt_of_task.shape[0],), class_offset).long()
-                    cur_gts_of_task.append(cur_gt_of_task)
-                    cur_classes_of_task.append(cur_class_of_task)
-                    class_offset += 1
-                cur_gts_of_task = torch.cat(cur_gts_of_task, dim = 0)
-                cur_classes_of_task = torch.cat(cur_classes_of_task, dim = 0)
-
-                num_boxes_of_task = cur_gts_of_task.shape[0]
-                for i in range(num_boxes_of_task):
-                    cat = cur_classes_of_task[i]
-                    x, y, z, w, l, h, r, vx, vy = cur_gts_of_task[i]
-                    #r -> [-pi, pi]
-                    r = self.limit_period(r, offset=0.5, period=math.pi * 2)
-                    w, l = w / self.voxel_size[0] / self.out_size_factor, l / self.voxel_size[1] / self.out_size_factor
-                    radius = self.gaussian_radius(l, w, min_overlap=self.gaussian_overlap)
-                    radius = max(self._min_radius, int(radius))
-
-                    coor_x = (x - self.pc_range[0]) / self.voxel_size[0] / self.out_size_factor
-                    coor_y = (y - self.pc_range[1]) / self.voxel_size[1] / self.out_size_factor
-                    ct_ft = torch.tensor([coor_x, coor_y], dtype = torch.float32)
-                    ct_int = ct_ft.int() #float to int conversion torch/np
-
-                    if not (0 <= ct_int[0] < feature_map_size[0] and 0 <= ct_int[1] < feature_map_size[1]):
-                        continue
-
-                    self.draw_gaussian(heatmap[cat], ct_int, radius) #pass functions
-
-                    gt_cat[i] = cat
-                    gt_mask[i] = 1
-                    gt_ind[i] = ct_int[1] * feature_map_size[0] + ct_int[0]
-                    assert gt_ind[i] < feature_map_size[0] * feature_map_size[1]
-                    # Note that w,l has been modified, so in box encoding we use original w,l,h
-                    if not self.no_log:
-                        gt_box_encoding[i] = torch.tensor([ct_ft[0] - ct_int[0],
-                                                           ct_ft[1] - ct_int[1],
-                                                           z,
-                                                           math.log(cur_gts_of_task[i,3]),
-                                                           math.log(cur_gts_of_task[i,4]),
-                                                           math.log(cur_gts_of_task[i,5]),
-                                                           math.sin(r),
-                                                           math.cos(r),
-                                                           vx,
-                                                           vy
-                                                           ], dtype=torch.float32).to(gt_box_encoding.device)
-                    else:
-                        gt_box_encoding[i] = torch.tensor([ct_ft[0] - ct_int[0],
-                                                           ct_ft[1] - ct_int[1],
-                                                           z,
-                                                           cur_gts_of_task[i,3],
-                                                           cur_gts_of_task[i,4],
-                                                           cur_gts_of_task[i,5],
-                                                           math.sin(r),
-                                                           math.cos(r),
-                                                           vx,
-                                                           vy
-                                                           ], dtype=torch.float32).to(gt_box_encoding.device)
-
-                heatmaps[task_id].append(heatmap)
-                gt_inds[task_id].append(gt_ind)
-                gt_cats[task_id].append(gt_cat)
-                gt_masks[task_id].append(gt_mask)
-                gt_box_encodings[task_id].append(gt_box_encoding)
-
-        for task_id, tasks in enumerate(self.tasks):
-            heatmaps[task_id] = torch.stack(heatmaps[task_id], dim = 0).contiguous()
-            gt_inds[task_id] = torch.stack(gt_inds[task_id], dim = 0).contiguous()
-            gt_masks[task_id] = torch.stack(gt_masks[task_id], dim = 0).contiguous()
-            gt_cats[task_id] = torch.stack(gt_cats[task_id], dim = 0).contiguous()
-            gt_box_encodings[task_id] = torch.stack(gt_box_encodings[task_id], dim = 0).contiguous()
+            num_task_classes = len(task.class_names)
+            cats = torch.full_like(box_inds.expand(batch_size, -1), -1)
+            for class_offset, class_name in enumerate(task.class_names):
+                cats[gt_classes == self.class_to_idx[class_name]] = class_offset
+            task_mask = valid_mask & (cats >= 0)
+
+            # the boxes of a task are numbered by class and then by index, the ones out of the map keep their slot
+            sort_keys = torch.where(task_mask, cats * num_boxes + box_inds, num_task_classes * num_boxes)
+            slots = torch.empty_like(sort_keys).scatter_(
+                1, torch.argsort(sort_keys, dim=1), box_inds.repeat(batch_size, 1)
+            )
+            batch_idx, box_idx = (task_mask & in_range & (slots < max_objs)).nonzero(as_tuple=True)
+            slot_idx = slots[batch_idx, box_idx]
+            cat = cats[batch_idx, box_idx]
+
+            heatmap = torch.zeros((batch_size, num_task_classes, height, width), dtype=torch.float32, device=gt_boxes.device)
+            heatmaps[task_id] = self.draw_gaussians(
+                heatmap, batch_idx, cat, ct_x[batch_idx, box_idx], ct_y[batch_idx, box_idx], radius[batch_idx, box_idx]
+            )
+
+            gt_ind = torch.zeros((batch_size, max_objs), dtype=torch.long, device=gt_boxes.device)
+            gt_mask = torch.zeros((batch_size, max_objs), dtype=torch.bool, device=gt_boxes.device)
+            gt_cat = torch.zeros((batch_size, max_objs), dtype=torch.long, device=gt_boxes.device)
+            gt_box_encoding = torch.zeros((batch_size, max_objs, 10), dtype=torch.float32, device=gt_boxes.device)
+            gt_ind[batch_idx, slot_idx] = (ct_y * width + ct_x)[batch_idx, box_idx].long()
+            gt_mask[batch_idx, slot_idx] = True
+            gt_cat[batch_idx, slot_idx] = cat
+            gt_box_encoding[batch_idx, slot_idx] = box_encodings[batch_idx, box_idx]
+
+            gt_inds[task_id] = gt_ind
+            gt_masks[task_id] = gt_mask
+            gt_cats[task_id] = gt_cat
+            gt_box_encodings[task_id] = gt_box_encoding
 
         target_dict = {
             'heatmap': heatmaps,
@@ -21,7 +21,7 @@ class Detector3DTemplate(nn.Module):
         self.register_buffer('global_step', torch.LongTensor(1).zero_())
 
         self.module_topology = [
-            'vfe', 'backbone_3d', 'map_to_bev_module', 'pfe',
+            'gpu_processor', 'vfe', 'backbone_3d', 'map_to_bev_module', 'pfe',
             'backbone_2d', 'dense_head',  'point_head', 'roi_head'
         ]
 
@@ -49,6 +49,22 @@ class Detector3DTemplate(nn.Module):
             self.add_module(module_name, module)
         return model_info_dict['module_list']
 
+    def build_gpu_processor(self, model_info_dict):
+        if len(getattr(self.dataset, 'gpu_augmentor_configs', [])) == 0 and \
+                len(getattr(self.dataset, 'gpu_processor_configs', [])) == 0:
+            return None, model_info_dict
+
+        # imported here so that pcdet.models does not depend on pcdet.datasets, only the configs of the dataset need it
+        from ...datasets.processor.gpu_data_processor import GPUDataProcessor
+
+        gpu_processor_module = GPUDataProcessor(
+            augmentor_configs=self.dataset.gpu_augmentor_configs,
+            processor_configs=self.dataset.gpu_processor_configs,
+            point_cloud_range=self.dataset.point_cloud_range
+        )
+        model_info_dict['module_list'].append(gpu_processor_module)
+        return gpu_processor_module, model_info_dict
+
     def build_vfe(self, model_info_dict):
         if self.model_cfg.get('VFE', None) is None:
             return None, model_info_dict
@@ -196,6 +212,12 @@ class Detector3DTemplate(nn.Module):
         batch_size = batch_dict['batch_size']
         recall_dict = {}
         pred_dicts = []
+
+        # the candidates of all the samples are gathered first and suppressed by one batched nms, in which every
+        # sample (and class with MULTI_CLASSES_NMS) is an independent group
+        src_box_preds_list, box_preds_list = [], []
+        cand_box_inds, cand_scores, cand_output_scores, cand_labels, cand_groups = [], [], [], [], []
+        num_prev_boxes, num_groups_per_sample = 0, 1
         for index in range(batch_size):
             if batch_dict.get('batch_index', None) is not None:
                 assert batch_dict['batch_box_preds'].shape.__len__() == 2
@@ -227,26 +249,23 @@ class Detector3DTemplate(nn.Module):
                     multihead_label_mapping = [torch.arange(1, self.num_class, device=cls_preds[0].device)]
                 else:
                     multihead_label_mapping = batch_dict['multihead_label_mapping']
+                num_groups_per_sample = sum([len(x) for x in multihead_label_mapping])
 
                 cur_start_idx = 0
-                pred_scores, pred_labels, pred_boxes = [], [], []
+                cur_group_offset = index * num_groups_per_sample
                 for cur_cls_preds, cur_label_mapping in zip(cls_preds, multihead_label_mapping):
                     assert cur_cls_preds.shape[1] == len(cur_label_mapping)
-                    cur_box_preds = box_preds[cur_start_idx: cur_start_idx + cur_cls_preds.shape[0]]
-                    cur_pred_scores, cur_pred_labels, cur_pred_boxes = model_nms_utils.multi_classes_nms(
-                        cls_scores=cur_cls_preds, box_preds=cur_box_preds,
-                        nms_config=post_process_cfg.NMS_CONFIG,
-                        score_thresh=post_process_cfg.SCORE_THRESH
+                    cur_box_inds, cur_cls_inds = model_nms_utils.get_multi_classes_candidates(
+                        cur_cls_preds, score_thresh=post_process_cfg.SCORE_THRESH
                     )
-                    cur_pred_labels = cur_label_mapping[cur_pred_labels]
-                    pred_scores.append(cur_pred_scores)
-                    pred_labels.append(cur_pred_labels)
-                    pred_boxes.append(cur_pred_boxes)
+                    cur_scores = cur_cls_preds[cur_box_inds, cur_cls_inds]
+                    cand_box_inds.append(cur_box_inds + cur_start_idx + num_prev_boxes)
+                    cand_scores.append(cur_scores)
+                    cand_output_scores.append(cur_scores)
+                    cand_labels.append(cur_label_mapping[cur_cls_inds])
+                    cand_groups.append(cur_cls_inds + cur_group_offset)
                     cur_start_idx += cur_cls_preds.shape[0]
-
-                final_scores = torch.cat(pred_scores, dim=0)
-                final_labels = torch.cat(pred_labels, dim=0)
-                final_boxes = torch.cat(pred_boxes, dim=0)
+                    cur_group_offset += len(cur_label_mapping)
             else:
                 cls_preds, label_preds = torch.max(cls_preds, dim=-1)
                 if batch_dict.get('has_class_labels', False):
@@ -254,30 +273,52 @@ class Detector3DTemplate(nn.Module):
                     label_preds = batch_dict[label_key][index]
                 else:
                     label_preds = label_preds + 1
-                selected, selected_scores = model_nms_utils.class_agnostic_nms(
-                    box_scores=cls_preds, box_preds=box_preds,
-                    nms_config=post_process_cfg.NMS_CONFIG,
-                    score_thresh=post_process_cfg.SCORE_THRESH
-                )
 
                 if post_process_cfg.OUTPUT_RAW_SCORE:
                     max_cls_preds, _ = torch.max(src_cls_preds, dim=-1)
-                    selected_scores = max_cls_preds[selected]
+                else:
+                    max_cls_preds = cls_preds
+
+                cand_box_inds.append(torch.arange(box_preds.shape[0], device=box_preds.device) + num_prev_boxes)
+                cand_scores.append(cls_preds)
+                cand_output_scores.append(max_cls_preds)
+                cand_labels.append(label_preds)
+                cand_groups.append(cls_preds.new_full((cls_preds.shape[0],), index, dtype=torch.long))
+
+            src_box_preds_list.append(src_box_preds)
+            box_preds_list.append(box_preds)
+            num_prev_boxes += box_preds.shape[0]
+
+        all_box_preds = torch.cat(box_preds_list, dim=0)
+        cand_box_inds = torch.cat(cand_box_inds, dim=0)
+        cand_scores = torch.cat(cand_scores, dim=0)
+        cand_groups = torch.cat(cand_groups, dim=0)
+        selected = model_nms_utils.batched_nms(
+            box_scores=cand_scores, box_preds=all_box_preds[cand_box_inds], group_ids=cand_groups,
+            nms_config=post_process_cfg.NMS_CONFIG, score_thresh=post_process_cfg.SCORE_THRESH
+        )
 
-                final_scores = selected_scores
-                final_labels = label_preds[selected]
-                final_boxes = box_preds[selected]
+        # the selected candidates are sorted by group, so the ones of every sample are contiguous
+        sample_counts = torch.bincount(
+            torch.div(cand_groups[selected], num_groups_per_sample, rounding_mode='floor'), minlength=batch_size
+        ).tolist()
+        final_box_preds = all_box_preds[cand_box_inds[selected]]
+        final_scores_list = torch.cat(cand_output_scores, dim=0)[selected].split(sample_counts)
+        final_labels_list = torch.cat(cand_labels, dim=0)[selected].split(sample_counts)
+        final_boxes_list = final_box_preds.split(sample_counts)
 
+        for index in range(batch_size):
+            final_boxes = final_boxes_list[index]
             recall_dict = self.generate_recall_record(
-                box_preds=final_boxes if 'rois' not in batch_dict else src_box_preds,
+                box_preds=final_boxes if 'rois' not in batch_dict else src_box_preds_list[index],
                 recall_dict=recall_dict, batch_index=index, data_dict=batch_dict,
                 thresh_list=post_process_cfg.RECALL_THRESH_LIST
             )
 
             record_dict = {
                 'pred_boxes': final_boxes,
-                'pred_scores': final_scores,
-                'pred_labels': final_labels
+                'pred_scores': final_scores_list[index],
+                'pred_labels': final_labels_list[index]
             }
             pred_dicts.append(record_dict)
 
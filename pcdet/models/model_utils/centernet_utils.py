@@ -104,13 +104,75 @@ def circle_nms(dets, thresh):
     return keep
 
 
+def circle_nms_batched(centers, scores, thresh, valid_mask=None, post_max_size=None):
+    """
+    Tensor version of circle_nms for padded candidates on their own device, every row is suppressed independently.
+    A candidate is suppressed by a kept candidate with a higher score whose squared center distance is <= thresh, the
+    keep decisions are the same as circle_nms: they are the fixed point of the suppression in score order, which is
+    reached after at most K iterations (the first k candidates are final after k iterations), usually a few.
+    Args:
+        centers: (B, K, 2)
+        scores: (B, K)
+        thresh: float or (B), squared center distance of every row
+        valid_mask: (B, K) bool, the other candidates are ignored
+        post_max_size: number of candidates with the highest scores kept at most in every row
+
+    Returns:
+        keep: (B, K) bool
+    """
+    batch_size, num_candidates = scores.shape
+    if valid_mask is None:
+        valid_mask = torch.ones_like(scores, dtype=torch.bool)
+
+    # sort by descending score, the invalid candidates last
+    order = torch.argsort(scores.masked_fill(~valid_mask, -np.inf), dim=1, descending=True)
+    sorted_centers = torch.gather(centers, 1, order.unsqueeze(-1).expand(-1, -1, 2))
+    sorted_valid = torch.gather(valid_mask, 1, order)
+
+    # same float32 distances as circle_nms, compared in float64 with thresh. Only the bool (B, K, K) matrix is kept,
+    # the float distances are computed by chunks of rows of about 2 ** 22 elements
+    thresh = torch.as_tensor(thresh, dtype=torch.float64, device=centers.device).view(-1, 1, 1)
+    overlap = torch.zeros((batch_size, num_candidates, num_candidates), dtype=torch.bool, device=centers.device)
+    chunk_size = max(2 ** 22 // max(batch_size * num_candidates, 1), 1)
+    for start in range(0, num_candidates, chunk_size):
+        chunk_centers = sorted_centers[:, start:start + chunk_size]
+        dx = chunk_centers[:, :, None, 0] - sorted_centers[:, None, :, 0]
+        dy = chunk_centers[:, :, None, 1] - sorted_centers[:, None, :, 1]
+        overlap[:, start:start + chunk_size] = (dx ** 2 + dy ** 2) <= thresh
+    overlap &= sorted_valid[:, :, None]
+    overlap &= sorted_valid[:, None, :]
+    overlap.triu_(diagonal=1)  # only a higher score suppresses
+
+    # the iterations past the fixed point do not change it, so the convergence check, which waits for the device, is
+    # only done every few iterations
+    keep_sorted = sorted_valid
+    for k in range(num_candidates):
+        suppressed = (overlap & keep_sorted[:, :, None]).any(dim=1)
+        cur_keep = sorted_valid & ~suppressed
+        if (k + 1) % 4 == 0 and torch.equal(cur_keep, keep_sorted):
+            break
+        keep_sorted = cur_keep
+
+    if post_max_size is not None:
+        keep_sorted = keep_sorted & (torch.cumsum(keep_sorted.int(), dim=1) <= post_max_size)
+
+    keep = torch.zeros_like(valid_mask).scatter_(1, order, keep_sorted)
+    return keep
+
+
 def _circle_nms(boxes, min_radius, post_max_size=83):
     """
     NMS according to center distance
+    Args:
+        boxes: (N, 3) [x, y, score]
+    Returns:
+        keep: indices of the kept boxes by descending score, on the device of the boxes
     """
-    keep = np.array(circle_nms(boxes.cpu().numpy(), thresh=min_radius))[:post_max_size]
-
-    keep = torch.from_numpy(keep).long().to(boxes.device)
+    keep_mask = circle_nms_batched(
+        boxes[None, :, 0:2], boxes[None, :, 2], thresh=min_radius, post_max_size=post_max_size
+    )[0]
+    order = torch.argsort(boxes[:, 2], descending=True)
+    keep = order[keep_mask[order]]
 
     return keep
 
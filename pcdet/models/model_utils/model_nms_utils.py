@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 
 from ...ops.iou3d_nms import iou3d_nms_utils
@@ -34,33 +35,112 @@ def multi_classes_nms(cls_scores, box_preds, nms_config, score_thresh=None):
         score_thresh:
 
     Returns:
+        pred_scores, pred_labels, pred_boxes: sorted by class and by descending score within a class
+    """
+    box_inds, pred_labels = get_multi_classes_candidates(cls_scores, score_thresh=score_thresh)
+    box_scores = cls_scores[box_inds, pred_labels]
+    selected = batched_nms(box_scores, box_preds[box_inds], pred_labels, nms_config)
+
+    return box_scores[selected], pred_labels[selected], box_preds[box_inds[selected]]
+
+
+def get_multi_classes_candidates(cls_scores, score_thresh=None):
+    """
+    Args:
+        cls_scores: (N, num_class)
+        score_thresh:
+
+    Returns:
+        box_inds: (M) box of every (box, class) pair with a score above score_thresh
+        cls_inds: (M) class of every pair, starting from 0
+    """
+    if score_thresh is None:
+        num_boxes, num_class = cls_scores.shape
+        box_inds = torch.arange(num_boxes, device=cls_scores.device).repeat_interleave(num_class)
+        cls_inds = torch.arange(num_class, device=cls_scores.device).repeat(num_boxes)
+        return box_inds, cls_inds
+    box_inds, cls_inds = (cls_scores >= score_thresh).nonzero(as_tuple=True)
+    return box_inds, cls_inds
+
 
+def get_ranks_in_groups(sorted_group_ids):
     """
-    pred_scores, pred_labels, pred_boxes = [], [], []
-    for k in range(cls_scores.shape[1]):
-        if score_thresh is not None:
-            scores_mask = (cls_scores[:, k] >= score_thresh)
-            box_scores = cls_scores[scores_mask, k]
-            cur_box_preds = box_preds[scores_mask]
-        else:
-            box_scores = cls_scores[:, k]
-            cur_box_preds = box_preds
-
-        selected = []
-        if box_scores.shape[0] > 0:
-            box_scores_nms, indices = torch.topk(box_scores, k=min(nms_config.NMS_PRE_MAXSIZE, box_scores.shape[0]))
-            boxes_for_nms = cur_box_preds[indices]
-            keep_idx, selected_scores = getattr(iou3d_nms_utils, nms_config.NMS_TYPE)(
-                    boxes_for_nms[:, 0:7], box_scores_nms, nms_config.NMS_THRESH, **nms_config
-            )
-            selected = indices[keep_idx[:nms_config.NMS_POST_MAXSIZE]]
-
-        pred_scores.append(box_scores[selected])
-        pred_labels.append(box_scores.new_ones(len(selected)).long() * k)
-        pred_boxes.append(cur_box_preds[selected])
-
-    pred_scores = torch.cat(pred_scores, dim=0)
-    pred_labels = torch.cat(pred_labels, dim=0)
-    pred_boxes = torch.cat(pred_boxes, dim=0)
-
-    return pred_scores, pred_labels, pred_boxes
+    Args:
+        sorted_group_ids: (N) sorted
+
+    Returns:
+        ranks: (N) position of every element in its group
+    """
+    _, group_counts = torch.unique_consecutive(sorted_group_ids, return_counts=True)
+    group_starts = torch.cumsum(group_counts, dim=0) - group_counts
+    ranks = torch.arange(sorted_group_ids.shape[0], device=sorted_group_ids.device)
+    return ranks - torch.repeat_interleave(group_starts, group_counts)
+
+
+def batched_nms(box_scores, box_preds, group_ids, nms_config, score_thresh=None):
+    """
+    Independent nms of several groups of boxes in a few calls, e.g. of all the classes and samples of a batch
+    instead of one call per (sample, class). The boxes of every group are moved to their own cell of a grid in the
+    BEV so that boxes of different groups never overlap, NMS_PRE_MAXSIZE and NMS_POST_MAXSIZE are applied per group.
+    The groups are split into chunks of at most NMS_BATCH_MAX_BOXES boxes (a larger group has its own chunk) to bound
+    the (N, N) overlap mask of the nms.
+
+    Args:
+        box_scores: (N)
+        box_preds: (N, 7 + C)
+        group_ids: (N) int, the boxes of different groups do not suppress each other
+        nms_config:
+        score_thresh:
+
+    Returns:
+        selected: (M) indices of the kept boxes, sorted by group id and by descending score within a group
+    """
+    src_inds = None
+    if score_thresh is not None:
+        src_inds = (box_scores >= score_thresh).nonzero().view(-1)
+        box_scores, box_preds, group_ids = box_scores[src_inds], box_preds[src_inds], group_ids[src_inds]
+
+    if box_scores.shape[0] == 0:
+        return group_ids.new_zeros(0).long()
+
+    # sort by group and by descending score within a group
+    order = torch.sort(box_scores, descending=True, stable=True)[1]
+    order = order[torch.sort(group_ids[order], stable=True)[1]]
+    order = order[get_ranks_in_groups(group_ids[order]) < nms_config.NMS_PRE_MAXSIZE]
+    sorted_group_ids = group_ids[order]
+    _, group_pos, group_counts = torch.unique_consecutive(sorted_group_ids, return_inverse=True, return_counts=True)
+
+    boxes = box_preds[order, 0:7]
+    scores = box_scores[order]
+    xy_min = boxes[:, 0:2].min(dim=0)[0]
+    cell_size = (boxes[:, 0:2].max(dim=0)[0] - xy_min).max() + boxes[:, 3:5].norm(dim=-1).max() + 1.0
+
+    max_boxes = nms_config.get('NMS_BATCH_MAX_BOXES', 16384)
+    kept_list = []
+    chunk_start = chunk_end = chunk_first_group = 0
+    group_counts = group_counts.tolist()
+    for group_idx, count in enumerate(group_counts):
+        chunk_end += count
+        if group_idx + 1 < len(group_counts) and chunk_end - chunk_start + group_counts[group_idx + 1] <= max_boxes:
+            continue
+
+        chunk_boxes = boxes[chunk_start:chunk_end]
+        num_groups = group_idx + 1 - chunk_first_group
+        if num_groups > 1:
+            num_cols = int(np.ceil(np.sqrt(num_groups)))
+            cell_inds = group_pos[chunk_start:chunk_end] - chunk_first_group
+            chunk_boxes = chunk_boxes.clone()
+            chunk_boxes[:, 0] += (cell_inds % num_cols) * cell_size - xy_min[0]
+            chunk_boxes[:, 1] += torch.div(cell_inds, num_cols, rounding_mode='floor') * cell_size - xy_min[1]
+        keep_idx, _ = getattr(iou3d_nms_utils, nms_config.NMS_TYPE)(
+            chunk_boxes.contiguous(), scores[chunk_start:chunk_end], nms_config.NMS_THRESH, **nms_config
+        )
+        kept_list.append(torch.sort(keep_idx)[0] + chunk_start)
+        chunk_start, chunk_first_group = chunk_end, group_idx + 1
+    kept = torch.cat(kept_list, dim=0)
+    kept = kept[get_ranks_in_groups(sorted_group_ids[kept]) < nms_config.NMS_POST_MAXSIZE]
+
+    selected = order[kept]
+    if src_inds is not None:
+        selected = src_inds[selected]
+    return selected
@@ -2,7 +2,6 @@ import torch.nn as nn
 import pdb
 import torch
 import numpy as np
-from numpy import *
 import torch.nn.functional as F
 
 from ...utils import common_utils
@@ -36,6 +35,7 @@ class CT3DHead(RoIHeadTemplate):
         num_queries = model_cfg.Transformer.num_queries
         hidden_dim = model_cfg.Transformer.hidden_dim
         self.num_points = model_cfg.Transformer.num_points
+        self.point_sample_seed = model_cfg.get('POINT_SAMPLE_SEED', 0)
 
         self.class_embed = nn.Linear(hidden_dim, 1)
         self.bbox_embed = MLP(hidden_dim, hidden_dim, self.box_coder.code_size * self.num_class, 4)
@@ -106,6 +106,45 @@ class CT3DHead(RoIHeadTemplate):
         src = torch.cat([dis, phi, the], dim = -1)
         return src
 
+    def sample_roi_points(self, points, rois, generator=None):
+        """
+        Samples num_points points in the cylinder of every roi (1.2x the half BEV diagonal), randomly with replacement
+        if the roi has more points, otherwise all its points padded with copies of the first one
+        Args:
+            points: (num_points, 5) [bs_idx, x, y, z, intensity]
+            rois: (B, N, 7 + C)
+            generator: torch.Generator of the random sampling, on the device of the rois
+        Returns:
+            src: (B, N, num_sample, 4)
+        """
+        batch_size, num_rois = rois.shape[0], rois.shape[1]
+        num_sample = self.num_points
+        src = rois.new_zeros(batch_size, num_rois, num_sample, 4)
+        sample_idxs = torch.arange(num_sample, device=rois.device)
+
+        for bs_idx in range(batch_size):
+            cur_points = points[(points[:, 0] == bs_idx)][:, 1:5]
+            if cur_points.shape[0] == 0:
+                continue
+            cur_batch_boxes = rois[bs_idx]
+            cur_radiis = torch.sqrt((cur_batch_boxes[:, 3] / 2) ** 2 + (cur_batch_boxes[:, 4] / 2) ** 2) * 1.2
+            dis = torch.norm(cur_points[None, :, :2] - cur_batch_boxes[:, None, :2], dim=2)
+            point_mask = (dis <= cur_radiis.unsqueeze(-1))  # (N, num_points)
+            num_roi_points = point_mask.sum(dim=1, keepdim=True)  # (N, 1)
+
+            # rank of the sampled points among the points of each roi
+            random_ranks = torch.rand((num_rois, num_sample), generator=generator, device=rois.device)
+            random_ranks = torch.min((random_ranks * num_roi_points).long(), num_roi_points - 1)
+            padded_ranks = torch.where(sample_idxs[None, :] < num_roi_points, sample_idxs[None, :], 0)
+            ranks = torch.where(num_roi_points >= num_sample, random_ranks, padded_ranks)
+
+            # the point of rank r is the first one where the cumulative count of the mask reaches r + 1
+            point_idxs = torch.searchsorted(point_mask.cumsum(dim=1, dtype=torch.int32), (ranks + 1).int())
+            cur_src = cur_points[point_idxs.clamp(max=cur_points.shape[0] - 1)]
+            src[bs_idx] = cur_src * (num_roi_points > 0).unsqueeze(-1)
+
+        return src
+
     def forward(self, batch_dict):
         """
         :param input_data: input dict
@@ -130,32 +169,10 @@ class CT3DHead(RoIHeadTemplate):
         corner_points = corner_points.view(batch_size, num_rois, -1, corner_points.shape[-1])  # (B, N, 2x2x2, 3)
 
         num_sample = self.num_points
-        src = rois.new_zeros(batch_size, num_rois, num_sample, 4)
-
-        for bs_idx in range(batch_size):
-            cur_points = batch_dict['points'][(batch_dict['points'][:, 0] == bs_idx)][:,1:5] 
-            cur_batch_boxes = batch_dict['rois'][bs_idx]
-            cur_radiis = torch.sqrt((cur_batch_boxes[:,3]/2) ** 2 + (cur_batch_boxes[:,4]/2) ** 2) * 1.2
-            dis = torch.norm((cur_points[:,:2].unsqueeze(0) - cur_batch_boxes[:,:2].unsqueeze(1).repeat(1,cur_points.shape[0],1)), dim = 2)
-            point_mask = (dis <= cur_radiis.unsqueeze(-1))
-            for roi_box_idx in range(0, num_rois):
-                cur_roi_points = cur_points[point_mask[roi_box_idx]]
-
-                if cur_roi_points.shape[0] >= num_sample:
-                    random.seed(0)
-                    index = np.random.randint(cur_roi_points.shape[0], size=num_sample)
-                    cur_roi_points_sample = cur_roi_points[index]
-
-                elif cur_roi_points.shape[0] == 0:
-                    cur_roi_points_sample = cur_roi_points.new_zeros(num_sample, 4)
-
-                else:
-                    empty_num = num_sample - cur_roi_points.shape[0]
-                    add_zeros = cur_roi_points.new_zeros(empty_num, 4)
-                    add_zeros = cur_roi_points[0].repeat(empty_num, 1)
-                    cur_roi_points_sample = torch.cat([cur_roi_points, add_zeros], dim = 0)
-
-                src[bs_idx, roi_box_idx, :, :] = cur_roi_points_sample
+        # seeded in every forward so that the same input always gives the same sampling
+        generator = torch.Generator(device=rois.device)
+        generator.manual_seed(self.point_sample_seed)
+        src = self.sample_roi_points(batch_dict['points'], rois, generator=generator)
 
         src = src.view(batch_size * num_rois, -1, src.shape[-1])  # (b*128, 256, 4)
 
@@ -4,7 +4,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 from ...utils import box_coder_utils, common_utils, loss_utils
-from ..model_utils.model_nms_utils import class_agnostic_nms
+from ..model_utils.model_nms_utils import batched_nms, get_ranks_in_groups
 from .target_assigner.proposal_target_layer import ProposalTargetLayer
 
 
@@ -71,28 +71,31 @@ class RoIHeadTemplate(nn.Module):
         roi_scores = batch_box_preds.new_zeros((batch_size, nms_config.NMS_POST_MAXSIZE))
         roi_labels = batch_box_preds.new_zeros((batch_size, nms_config.NMS_POST_MAXSIZE), dtype=torch.long)
 
-        for index in range(batch_size):
-            if batch_dict.get('batch_index', None) is not None:
-                assert batch_cls_preds.shape.__len__() == 2
-                batch_mask = (batch_dict['batch_index'] == index)
-            else:
-                assert batch_dict['batch_cls_preds'].shape.__len__() == 3
-                batch_mask = index
-            box_preds = batch_box_preds[batch_mask]
-            cls_preds = batch_cls_preds[batch_mask]
-
-            cur_roi_scores, cur_roi_labels = torch.max(cls_preds, dim=1)
-
-            if nms_config.MULTI_CLASSES_NMS:
-                raise NotImplementedError
-            else:
-                selected, selected_scores = class_agnostic_nms(
-                    box_scores=cur_roi_scores, box_preds=box_preds, nms_config=nms_config
-                )
+        if batch_dict.get('batch_index', None) is not None:
+            assert batch_cls_preds.shape.__len__() == 2
+            box_preds, cls_preds = batch_box_preds, batch_cls_preds
+            batch_index = batch_dict['batch_index'].long()
+        else:
+            assert batch_dict['batch_cls_preds'].shape.__len__() == 3
+            box_preds = batch_box_preds.view(-1, batch_box_preds.shape[-1])
+            cls_preds = batch_cls_preds.view(-1, batch_cls_preds.shape[-1])
+            batch_index = torch.arange(batch_size, device=box_preds.device).repeat_interleave(batch_box_preds.shape[1])
+
+        cur_roi_scores, cur_roi_labels = torch.max(cls_preds, dim=1)
+
+        if nms_config.MULTI_CLASSES_NMS:
+            raise NotImplementedError
+        else:
+            # the samples are independent groups of one batched nms, the selected boxes are sorted by sample
+            selected = batched_nms(
+                box_scores=cur_roi_scores, box_preds=box_preds, group_ids=batch_index, nms_config=nms_config
+            )
 
-            rois[index, :len(selected), :] = box_preds[selected]
-            roi_scores[index, :len(selected)] = cur_roi_scores[selected]
-            roi_labels[index, :len(selected)] = cur_roi_labels[selected]
+        selected_batch_index = batch_index[selected]
+        selected_roi_index = get_ranks_in_groups(selected_batch_index)
+        rois[selected_batch_index, selected_roi_index, :] = box_preds[selected]
+        roi_scores[selected_batch_index, selected_roi_index] = cur_roi_scores[selected]
+        roi_labels[selected_batch_index, selected_roi_index] = cur_roi_labels[selected]
 
         batch_dict['rois'] = rois
         batch_dict['roi_scores'] = roi_scores
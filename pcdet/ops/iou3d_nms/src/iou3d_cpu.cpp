@@ -8,6 +8,7 @@ All Rights Reserved 2020.
 #include <math.h>
 #include <torch/serialize/tensor.h>
 #include <torch/extension.h>
+#include <ATen/Parallel.h>
 #include <vector>
 #include <cuda.h>
 #include <cuda_runtime_api.h>
@@ -228,6 +229,19 @@ inline float iou_bev(const float *box_a, const float *box_b){
     return s_overlap / fmaxf(sa + sb - s_overlap, EPS);
 }
 
+inline float iou_normal(const float *a, const float *b){
+    // params: a (7) [x, y, z, dx, dy, dz, heading]
+    // params: b (7) [x, y, z, dx, dy, dz, heading]
+    float left = fmaxf(a[0] - a[3] / 2, b[0] - b[3] / 2), right = fminf(a[0] + a[3] / 2, b[0] + b[3] / 2);
+    float top = fmaxf(a[1] - a[4] / 2, b[1] - b[4] / 2), bottom = fminf(a[1] + a[4] / 2, b[1] + b[4] / 2);
+    float width = fmaxf(right - left, 0.f), height = fmaxf(bottom - top, 0.f);
+    float interS = width * height;
+    float Sa = a[3] * a[4];
+    float Sb = b[3] * b[4];
+    return interS / fmaxf(Sa + Sb - interS, EPS);
+}
+
+
 
 int boxes_iou_bev_cpu(at::Tensor boxes_a_tensor, at::Tensor boxes_b_tensor, at::Tensor ans_iou_tensor){
     // params boxes_a_tensor: (N, 7) [x, y, z, dx, dy, dz, heading]
@@ -243,10 +257,88 @@ int boxes_iou_bev_cpu(at::Tensor boxes_a_tensor, at::Tensor boxes_b_tensor, at::
     const float *boxes_b = boxes_b_tensor.data<float>();
     float *ans_iou = ans_iou_tensor.data<float>();
 
-    for (int i = 0; i < num_boxes_a; i++){
-        for (int j = 0; j < num_boxes_b; j++){
-            ans_iou[i * num_boxes_b + j] = iou_bev(boxes_a + i * 7, boxes_b + j * 7);
+    at::parallel_for(0, num_boxes_a, 16, [&](int64_t start, int64_t end){
+        for (int64_t i = start; i < end; i++){
+            for (int j = 0; j < num_boxes_b; j++){
+                ans_iou[i * num_boxes_b + j] = iou_bev(boxes_a + i * 7, boxes_b + j * 7);
+            }
         }
-    }
+    });
+    return 1;
+}
+
+
+int boxes_overlap_bev_cpu(at::Tensor boxes_a_tensor, at::Tensor boxes_b_tensor, at::Tensor ans_overlap_tensor){
+    // params boxes_a_tensor: (N, 7) [x, y, z, dx, dy, dz, heading]
+    // params boxes_b_tensor: (M, 7) [x, y, z, dx, dy, dz, heading]
+    // params ans_overlap_tensor: (N, M)
+
+    CHECK_CONTIGUOUS(boxes_a_tensor);
+    CHECK_CONTIGUOUS(boxes_b_tensor);
+
+    int num_boxes_a = boxes_a_tensor.size(0);
+    int num_boxes_b = boxes_b_tensor.size(0);
+    const float *boxes_a = boxes_a_tensor.data<float>();
+    const float *boxes_b = boxes_b_tensor.data<float>();
+    float *ans_overlap = ans_overlap_tensor.data<float>();
+
+    at::parallel_for(0, num_boxes_a, 16, [&](int64_t start, int64_t end){
+        for (int64_t i = start; i < end; i++){
+            for (int j = 0; j < num_boxes_b; j++){
+                ans_overlap[i * num_boxes_b + j] = box_overlap(boxes_a + i * 7, boxes_b + j * 7);
+            }
+        }
+    });
     return 1;
 }
+
+
+template <typename IouFunc>
+int nms_cpu_launcher(at::Tensor boxes_tensor, at::Tensor keep_tensor, float nms_overlap_thresh, IouFunc iou_func){
+    // params boxes_tensor: (N, 7) [x, y, z, dx, dy, dz, heading], sorted by score
+    // params keep_tensor: (N)
+
+    CHECK_CONTIGUOUS(boxes_tensor);
+    CHECK_CONTIGUOUS(keep_tensor);
+
+    int boxes_num = boxes_tensor.size(0);
+    const float *boxes = boxes_tensor.data<float>();
+    long *keep = keep_tensor.data<long>();
+
+    // radius of the bounding circles, the boxes whose circles do not overlap have an iou of 0 and are skipped
+    std::vector<float> radius(boxes_num);
+    for (int i = 0; i < boxes_num; i++){
+        radius[i] = sqrtf(boxes[i * 7 + 3] * boxes[i * 7 + 3] + boxes[i * 7 + 4] * boxes[i * 7 + 4]) / 2;
+    }
+
+    // same greedy order as the GPU version: a box is suppressed by the kept boxes with a higher score
+    std::vector<char> removed(boxes_num, 0);
+    int num_to_keep = 0;
+    for (int i = 0; i < boxes_num; i++){
+        if (removed[i]) continue;
+        keep[num_to_keep++] = i;
+        const float *cur_box = boxes + i * 7;
+        at::parallel_for(i + 1, boxes_num, 256, [&](int64_t start, int64_t end){
+            for (int64_t j = start; j < end; j++){
+                if (removed[j]) continue;
+                float center_dx = cur_box[0] - boxes[j * 7 + 0], center_dy = cur_box[1] - boxes[j * 7 + 1];
+                float max_dist = radius[i] + radius[j] + 2e-2;  // MARGIN of check_in_box2d
+                if (center_dx * center_dx + center_dy * center_dy > max_dist * max_dist) continue;
+                if (iou_func(cur_box, boxes + j * 7) > nms_overlap_thresh){
+                    removed[j] = 1;
+                }
+            }
+        });
+    }
+    return num_to_keep;
+}
+
+
+int nms_cpu(at::Tensor boxes_tensor, at::Tensor keep_tensor, float nms_overlap_thresh){
+    return nms_cpu_launcher(boxes_tensor, keep_tensor, nms_overlap_thresh, iou_bev);
+}
+
+
+int nms_normal_cpu(at::Tensor boxes_tensor, at::Tensor keep_tensor, float nms_overlap_thresh){
+    return nms_cpu_launcher(boxes_tensor, keep_tensor, nms_overlap_thresh, iou_normal);
+}
@@ -14,4 +14,7 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
 	m.def("nms_gpu", &nms_gpu, "oriented nms gpu");
 	m.def("nms_normal_gpu", &nms_normal_gpu, "nms gpu");
 	m.def("boxes_iou_bev_cpu", &boxes_iou_bev_cpu, "oriented boxes iou");
+	m.def("boxes_overlap_bev_cpu", &boxes_overlap_bev_cpu, "oriented boxes overlap cpu");
+	m.def("nms_cpu", &nms_cpu, "oriented nms cpu");
+	m.def("nms_normal_cpu", &nms_normal_cpu, "nms cpu");
 }
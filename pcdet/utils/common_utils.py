@@ -2,9 +2,7 @@ import logging
 import os
 import pickle
 import random
-import shutil
 import subprocess
-import SharedArray
 
 import numpy as np
 import torch
@@ -125,6 +123,80 @@ def get_pad_params(desired_size, cur_size):
     return pad_params
 
 
+def empty_batch_array(shape, dtype, pin_memory=False):
+    """
+    np.empty, in page-locked memory if pin_memory so that it can be copied to the GPU without staging,
+    dtypes that torch does not support (str, object) are never pinned
+    """
+    if pin_memory and np.dtype(dtype).kind in 'biuf':
+        torch_dtype = torch.from_numpy(np.empty(0, dtype=dtype)).dtype
+        return torch.empty(tuple(shape), dtype=torch_dtype, pin_memory=True).numpy()
+    return np.empty(shape, dtype=dtype)
+
+
+def concatenate_with_batch_index(arrays, pin_memory=False):
+    """
+    Same as concatenating the arrays padded with their batch index in front, but written into one preallocated array
+    Args:
+        arrays: list of (N_i, C)
+        pin_memory:
+    Returns:
+        batch_array: (sum(N_i), 1 + C), [batch_idx, ...]
+    """
+    num_rows = [x.shape[0] for x in arrays]
+    batch_array = empty_batch_array((sum(num_rows), arrays[0].shape[1] + 1), np.result_type(*arrays), pin_memory)
+    batch_array[:, 0] = np.repeat(np.arange(len(arrays)), num_rows)
+    start = 0
+    for x, cur_num in zip(arrays, num_rows):
+        batch_array[start:start + cur_num, 1:] = x
+        start += cur_num
+    return batch_array
+
+
+def concatenate_batch(arrays, pin_memory=False):
+    """
+    np.concatenate along the first dim, into pinned memory if pin_memory
+    """
+    if not pin_memory:
+        return np.concatenate(arrays, axis=0)
+    out = empty_batch_array((sum([x.shape[0] for x in arrays]), *arrays[0].shape[1:]), np.result_type(*arrays), True)
+    return np.concatenate(arrays, axis=0, out=out)
+
+
+def stack_batch(arrays, pin_memory=False):
+    """
+    np.stack along a new first dim, into pinned memory if pin_memory
+    """
+    if not pin_memory:
+        return np.stack(arrays, axis=0)
+    arrays = [np.asarray(x) for x in arrays]
+    out = empty_batch_array((len(arrays), *arrays[0].shape), np.result_type(*arrays), True)
+    return np.stack(arrays, axis=0, out=out)
+
+
+def stack_with_padding(arrays, pad_value=0, dtype=None, pin_memory=False):
+    """
+    Stacks arrays whose sizes differ, every array is padded with pad_value at the end of each dim to the largest size
+    Args:
+        arrays: list of (D_i0, D_i1, ...)
+        pad_value:
+        dtype: defaults to the common dtype of the arrays
+        pin_memory:
+    Returns:
+        batch_array: (B, max(D_i0), max(D_i1), ...)
+    """
+    max_shape = np.max([x.shape for x in arrays], axis=0)
+    dtype = np.result_type(*arrays) if dtype is None else dtype
+    batch_array = empty_batch_array((len(arrays), *max_shape), dtype, pin_memory)
+    for k, x in enumerate(arrays):
+        batch_array[(k, *[slice(0, cur_size) for cur_size in x.shape])] = x
+        # only the padding is filled, slab by slab along each dim
+        for dim, cur_size in enumerate(x.shape):
+            if cur_size < max_shape[dim]:
+                batch_array[(k, *[slice(0, size) for size in x.shape[:dim]], slice(cur_size, None))] = pad_value
+    return batch_array
+
+
 def keep_arrays_by_name(gt_names, used_classes):
     inds = [i for i, x in enumerate(gt_names) if x in used_classes]
     inds = np.array(inds, dtype=np.int64)
@@ -196,30 +268,63 @@ def get_dist_info(return_gpu_per_machine=False):
     return rank, world_size
 
 
-def merge_results_dist(result_part, size, tmpdir):
+def gather_results_dist(result_part, dst=0):
+    """
+    Gathers the picklable results of every rank on rank dst with torch.distributed collectives, so no shared
+    filesystem or temporary files are needed. all_gather_object is used since NCCL only supports gather_object
+    from torch 1.11
+    Args:
+        result_part: results of this rank
+        dst: rank that receives the results
+    Returns:
+        part_list: list of the result_part of every rank in rank order on rank dst, None on the other ranks
+    """
     rank, world_size = get_dist_info()
-    os.makedirs(tmpdir, exist_ok=True)
+    if world_size == 1:
+        return [result_part]
 
-    dist.barrier()
-    pickle.dump(result_part, open(os.path.join(tmpdir, 'result_part_{}.pkl'.format(rank)), 'wb'))
-    dist.barrier()
+    part_list = [None] * world_size
+    dist.all_gather_object(part_list, result_part)
+    return part_list if rank == dst else None
 
-    if rank != 0:
-        return None
 
-    part_list = []
-    for i in range(world_size):
-        part_file = os.path.join(tmpdir, 'result_part_{}.pkl'.format(i))
-        part_list.append(pickle.load(open(part_file, 'rb')))
+def merge_results_dist(result_part, size, tmpdir=None):
+    """
+    Args:
+        result_part: list of the results of this rank, in the order of its DistributedSampler
+        size: number of results, the padding of the DistributedSampler is dropped
+        tmpdir: deprecated and ignored, the results are no longer exchanged through files
+    Returns:
+        results: merged list in dataset order on rank 0, None on the other ranks
+    """
+    part_list = gather_results_dist(result_part)
+    if part_list is None:
+        return None
 
     ordered_results = []
     for res in zip(*part_list):
         ordered_results.extend(list(res))
     ordered_results = ordered_results[:size]
-    shutil.rmtree(tmpdir)
     return ordered_results
 
 
+def load_pickle_stream(file_path):
+    """
+    Loads the objects that were pickled one after another to a file, e.g. the annos of every batch in the
+    result_stream.pkl of STREAMING_EVAL
+    Returns:
+        objects: list of the pickled objects
+    """
+    objects = []
+    with open(file_path, 'rb') as f:
+        while True:
+            try:
+                objects.append(pickle.load(f))
+            except EOFError:
+                break
+    return objects
+
+
 def scatter_point_inds(indices, point_inds, shape):
     ret = -1 * torch.ones(*shape, dtype=point_inds.dtype, device=point_inds.device)
     ndim = indices.shape[-1]
@@ -241,6 +346,8 @@ def generate_voxel2pinds(sparse_tensor):
 
 
 def sa_create(name, var):
+    import SharedArray
+
     x = SharedArray.create(name, var.shape, dtype=var.dtype)
     x[...] = var[...]
     x.flags.writeable = False
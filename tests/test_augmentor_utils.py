@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from pcdet.datasets.augmentor import augmentor_utils
+
+
+def random_scene(seed, overlapping):
+    rng = np.random.RandomState(seed)
+    num_boxes = 20
+    gt_boxes = np.zeros((num_boxes, 7), dtype=np.float32)
+    gt_boxes[:, 0:2] = rng.uniform(-10, 10, (num_boxes, 2)) if overlapping else \
+        np.stack(np.meshgrid(np.arange(5), np.arange(4)), axis=-1).reshape(-1, 2) * 8.0
+    gt_boxes[:, 2] = rng.uniform(-1, 1, num_boxes)
+    gt_boxes[:, 3:6] = rng.uniform(1, 4, (num_boxes, 3))
+    gt_boxes[:, 6] = rng.uniform(-np.pi, np.pi, num_boxes)
+
+    # points around the boxes and in the background
+    box_idx = rng.randint(0, num_boxes, 3000)
+    box_points = gt_boxes[box_idx, 0:3] + rng.uniform(-0.6, 0.6, (3000, 3)) * gt_boxes[box_idx, 3:6]
+    background = rng.uniform(-15, 40, (1000, 3))
+    points = np.concatenate([box_points, background], axis=0)
+    points = np.concatenate([points, rng.rand(points.shape[0], 1)], axis=1).astype(np.float32)
+    return gt_boxes, points
+
+
+AUGMENTATIONS = [
+    ('random_local_translation_along_x', [-0.5, 0.5]),
+    ('random_local_translation_along_y', [-0.5, 0.5]),
+    ('random_local_translation_along_z', [-0.5, 0.5]),
+    ('local_scaling', [0.9, 1.1]),
+    ('local_rotation', [-0.3, 0.3]),
+    ('local_frustum_dropout_top', [0, 0.2]),
+    ('local_frustum_dropout_bottom', [0, 0.2]),
+    ('local_frustum_dropout_left', [0, 0.2]),
+    ('local_frustum_dropout_right', [0, 0.2]),
+]
+
+
+@pytest.mark.parametrize('overlapping', [False, True])
+@pytest.mark.parametrize('name, aug_range', AUGMENTATIONS)
+def test_batched_augmentation_matches_loop(name, aug_range, overlapping):
+    for seed in range(5):
+        gt_boxes, points = random_scene(seed, overlapping)
+
+        np.random.seed(seed)
+        loop_boxes, loop_points = getattr(augmentor_utils, name)(gt_boxes.copy(), points.copy(), aug_range)
+        loop_next = np.random.rand()
+
+        np.random.seed(seed)
+        batched_boxes, batched_points = getattr(augmentor_utils, name + '_batched')(
+            gt_boxes.copy(), points.copy(), aug_range
+        )
+        batched_next = np.random.rand()
+
+        # the same random numbers are drawn
+        assert loop_next == batched_next
+        assert np.allclose(batched_boxes, loop_boxes, atol=1e-5)
+        assert batched_points.shape == loop_points.shape
+        assert np.allclose(batched_points, loop_points, atol=1e-5)
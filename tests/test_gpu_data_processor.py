@@ -0,0 +1,74 @@
+import numpy as np
+import torch
+from easydict import EasyDict
+
+from pcdet.datasets.augmentor.data_augmentor import DataAugmentor
+from pcdet.datasets.processor.gpu_data_processor import GPUDataProcessor
+
+POINT_CLOUD_RANGE = [-75.2, -75.2, -2, 75.2, 75.2, 4]
+AUG_CONFIGS = [
+    EasyDict(NAME='random_world_flip', ALONG_AXIS_LIST=['x', 'y']),
+    EasyDict(NAME='random_world_rotation', WORLD_ROT_ANGLE=[-0.78539816, 0.78539816]),
+    EasyDict(NAME='random_world_scaling', WORLD_SCALE_RANGE=[0.95, 1.05]),
+]
+
+
+def random_sample(num_boxes, num_points):
+    gt_boxes = np.zeros((num_boxes, 9))
+    gt_boxes[:, 0:3] = np.random.uniform(-50, 50, (num_boxes, 3))
+    gt_boxes[:, 3:6] = np.random.uniform(0.5, 5, (num_boxes, 3))
+    gt_boxes[:, 6] = np.random.uniform(-np.pi, np.pi, num_boxes)
+    gt_boxes[:, 7:9] = np.random.normal(0, 5, (num_boxes, 2))
+    points = np.random.uniform(-50, 50, (num_points, 4))
+    return gt_boxes, points
+
+
+def test_random_world_transform_matches_data_augmentor():
+    num_boxes = [12, 5]
+    np.random.seed(0)
+    samples = [random_sample(n, 100) for n in num_boxes]
+
+    for seed in range(20):
+        np.random.seed(seed)
+        augmentor = DataAugmentor(None, AUG_CONFIGS, class_names=['Car'])
+        cpu_outputs = [
+            augmentor.forward({'gt_boxes': gt_boxes.copy(), 'points': points.copy()})
+            for gt_boxes, points in samples
+        ]
+
+        batch_gt_boxes = np.zeros((len(samples), max(num_boxes), 10), dtype=np.float32)
+        batch_points = []
+        for k, (gt_boxes, points) in enumerate(samples):
+            batch_gt_boxes[k, :gt_boxes.shape[0], :9] = gt_boxes
+            batch_gt_boxes[k, :gt_boxes.shape[0], 9] = 1
+            batch_points.append(np.pad(points, ((0, 0), (1, 0)), constant_values=k))
+        batch_dict = {
+            'batch_size': len(samples),
+            'gt_boxes': torch.from_numpy(batch_gt_boxes),
+            'points': torch.from_numpy(np.concatenate(batch_points).astype(np.float32)),
+        }
+        np.random.seed(seed)
+        processor = GPUDataProcessor(AUG_CONFIGS, [], POINT_CLOUD_RANGE).train()
+        batch_dict = processor(batch_dict)
+
+        for k, cpu_output in enumerate(cpu_outputs):
+            gpu_boxes = batch_dict['gt_boxes'][k, :num_boxes[k], :9].numpy()
+            assert np.allclose(gpu_boxes, cpu_output['gt_boxes'], atol=1e-4)
+            assert (gpu_boxes[:, 6] >= -np.pi).all() and (gpu_boxes[:, 6] < np.pi).all()
+            assert (batch_dict['gt_boxes'][k, num_boxes[k]:] == 0).all()
+            gpu_points = batch_dict['points'][batch_dict['points'][:, 0] == k, 1:].numpy()
+            assert np.allclose(gpu_points, cpu_output['points'], atol=1e-4)
+
+
+def test_remove_outside_boxes_keeps_one_slot():
+    gt_boxes = torch.zeros((2, 3, 8))
+    gt_boxes[:, :, 0] = 100
+    gt_boxes[:, :, 3:6] = 1
+    gt_boxes[:, :, 7] = 1
+    batch_dict = {'gt_boxes': gt_boxes, 'points': torch.zeros((4, 5))}
+    processor = GPUDataProcessor([], [], POINT_CLOUD_RANGE)
+    batch_dict = processor.mask_points_and_boxes_outside_range(
+        batch_dict, config=EasyDict(REMOVE_OUTSIDE_BOXES=True)
+    )
+    assert batch_dict['gt_boxes'].shape == (2, 1, 8)
+    assert (batch_dict['gt_boxes'] == 0).all()
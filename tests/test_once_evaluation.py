@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from pcdet.datasets.once.once_eval import evaluation
+from pcdet.datasets.once.once_eval.eval_utils import compute_split_parts
+
+CLASS_NAMES = ['Car', 'Bus', 'Truck', 'Pedestrian', 'Cyclist']
+
+
+def random_annos(num_samples, tied_scores, seed):
+    rng = np.random.RandomState(seed)
+    gt_annos, pred_annos = [], []
+    for _ in range(num_samples):
+        num_gt = rng.randint(0, 15)
+        gt_boxes = np.zeros((num_gt, 7), dtype=np.float32)
+        gt_boxes[:, 0:2] = rng.uniform(-60, 60, (num_gt, 2))
+        gt_boxes[:, 2] = rng.uniform(-1, 1, num_gt)
+        gt_boxes[:, 3:6] = rng.uniform(0.5, 5, (num_gt, 3))
+        gt_boxes[:, 6] = rng.uniform(-np.pi, np.pi, num_gt)
+        gt_names = rng.choice(CLASS_NAMES, num_gt)
+
+        # jittered copies of some gt boxes, several per box, and false positives
+        copy_idx = rng.randint(0, max(num_gt, 1), rng.randint(0, 2 * num_gt + 1)) if num_gt > 0 else np.zeros(0, int)
+        pred_boxes = gt_boxes[copy_idx] + rng.normal(0, 0.15, (len(copy_idx), 7)).astype(np.float32)
+        pred_names = gt_names[copy_idx].copy()
+        swap = rng.rand(len(copy_idx)) < 0.1
+        pred_names[swap] = rng.choice(CLASS_NAMES, swap.sum())
+        num_fp = rng.randint(0, 5)
+        fp_boxes = np.concatenate([
+            rng.uniform(-60, 60, (num_fp, 2)), rng.uniform(-1, 1, (num_fp, 1)),
+            rng.uniform(0.5, 5, (num_fp, 3)), rng.uniform(-np.pi, np.pi, (num_fp, 1))
+        ], axis=1).astype(np.float32)
+        pred_boxes = np.concatenate([pred_boxes, fp_boxes], axis=0)
+        pred_names = np.concatenate([pred_names, rng.choice(CLASS_NAMES, num_fp)])
+        scores = rng.rand(len(pred_boxes))
+        if tied_scores:
+            scores = np.round(scores * 5) / 5
+
+        gt_annos.append({'name': gt_names, 'boxes_3d': gt_boxes})
+        pred_annos.append({'name': pred_names, 'boxes_3d': pred_boxes, 'score': scores.astype(np.float32)})
+    return gt_annos, pred_annos
+
+
+def per_threshold_confusion_matrix(dense_ious):
+    """
+    The loop of get_evaluation_results before compute_confusion_matrix: compute_statistics for every sample and every
+    score threshold on the full IoU matrices
+    """
+    def confusion_matrix_func(ious, iou_indices, iou_offsets, pred_scores, gt_flags, pred_flags, gt_offsets,
+                              pred_offsets, thresholds, iou_threshold):
+        confusion_matrix = np.zeros([len(thresholds), 3])
+        for sample_idx in range(len(dense_ious)):
+            pred_score = pred_scores[pred_offsets[sample_idx]:pred_offsets[sample_idx + 1]]
+            iou = dense_ious[sample_idx]
+            gt_flag = gt_flags[gt_offsets[sample_idx]:gt_offsets[sample_idx + 1]]
+            pred_flag = pred_flags[pred_offsets[sample_idx]:pred_offsets[sample_idx + 1]]
+            for th_idx, score_th in enumerate(thresholds):
+                tp, fp, fn = evaluation.compute_statistics(iou, pred_score, gt_flag, pred_flag,
+                                                           score_threshold=score_th, iou_threshold=iou_threshold)
+                confusion_matrix[th_idx, 0] += tp
+                confusion_matrix[th_idx, 1] += fp
+                confusion_matrix[th_idx, 2] += fn
+        return confusion_matrix
+    return confusion_matrix_func
+
+
+@pytest.mark.parametrize('tied_scores', [False, True])
+@pytest.mark.parametrize('use_superclass', [False, True])
+@pytest.mark.parametrize('difficulty_mode', ['Overall&Distance', 'Overall', 'Distance'])
+def test_confusion_matrix_matches_per_threshold_loop(monkeypatch, tied_scores, use_superclass, difficulty_mode):
+    gt_annos, pred_annos = random_annos(60, tied_scores, seed=int(tied_scores))
+    ret_str, ret_dict = evaluation.get_evaluation_results(
+        gt_annos, pred_annos, list(CLASS_NAMES), use_superclass=use_superclass, difficulty_mode=difficulty_mode
+    )
+
+    dense_ious = evaluation.compute_iou3d(gt_annos, pred_annos, compute_split_parts(len(gt_annos), 100),
+                                          with_heading=True)
+    monkeypatch.setattr(evaluation, 'compute_confusion_matrix', per_threshold_confusion_matrix(dense_ious))
+    old_ret_str, old_ret_dict = evaluation.get_evaluation_results(
+        gt_annos, pred_annos, list(CLASS_NAMES), use_superclass=use_superclass, difficulty_mode=difficulty_mode
+    )
+
+    assert ret_str == old_ret_str
+    assert ret_dict.keys() == old_ret_dict.keys()
+    for key in ret_dict:
+        assert ret_dict[key] == old_ret_dict[key], key
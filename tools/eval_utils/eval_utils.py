@@ -1,10 +1,12 @@
 import pickle
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import torch
 import tqdm
 
+from pcdet.datasets.result_writer import ResultWriter
 from pcdet.models import load_data_to_gpu
 from pcdet.utils import common_utils
 
@@ -19,7 +21,15 @@ def statistics_info(cfg, ret_dict, metric, disp_dict):
         '(%d, %d) / %d' % (metric['recall_roi_%s' % str(min_thresh)], metric['recall_rcnn_%s' % str(min_thresh)], metric['gt_num'])
 
 
-def eval_one_epoch(cfg, model, dataloader, epoch_id, logger, dist_test=False, save_to_file=False, result_dir=None):
+def eval_one_epoch(cfg, model, dataloader, epoch_id, logger, dist_test=False, save_to_file=False, result_dir=None,
+                   eval_executor=None):
+    """
+    Args:
+        eval_executor: if given, the evaluation of the gathered predictions is submitted to it and a future of the
+            ret_dict is returned, so that the caller can run the inference of the next checkpoint in the meantime
+    Returns:
+        ret_dict: the recalls and the metrics of dataset.evaluation, empty on the ranks other than 0
+    """
     result_dir.mkdir(parents=True, exist_ok=True)
 
     final_output_dir = result_dir / 'final_result' / 'data'
@@ -37,6 +47,21 @@ def eval_one_epoch(cfg, model, dataloader, epoch_id, logger, dist_test=False, sa
     class_names = dataset.class_names
     det_annos = []
 
+    # the predictions are evaluated batch by batch on a background thread and streamed to disk instead of being kept
+    streaming_eval = dataset.dataset_cfg.get('STREAMING_EVAL', False)
+    if streaming_eval:
+        rank, world_size = common_utils.get_dist_info()
+        evaluator = dataset.build_evaluator(
+            class_names, eval_metric=cfg.MODEL.POST_PROCESSING.EVAL_METRIC, output_path=final_output_dir
+        )
+        update_future = None
+        num_rank_frames = 0
+        metric['frame_num'] = metric['pred_num'] = 0
+
+        def update_evaluator(annos):
+            pickle.dump(annos, result_file)
+            evaluator.update(annos)
+
     logger.info('*************** EPOCH %s EVALUATION *****************' % epoch_id)
     if dist_test:
         num_gpus = torch.cuda.device_count()
@@ -51,44 +76,105 @@ def eval_one_epoch(cfg, model, dataloader, epoch_id, logger, dist_test=False, sa
     if cfg.LOCAL_RANK == 0:
         progress_bar = tqdm.tqdm(total=len(dataloader), leave=True, desc='eval', dynamic_ncols=True)
     start_time = time.time()
-    for i, batch_dict in enumerate(dataloader):
-        load_data_to_gpu(batch_dict)
-        with torch.no_grad():
-            pred_dicts, ret_dict = model(batch_dict)
-        disp_dict = {}
-
-        statistics_info(cfg, ret_dict, metric, disp_dict)
-        annos = dataset.generate_prediction_dicts(
-            batch_dict, pred_dicts, class_names,
-            output_path=final_output_dir if save_to_file else None
-        )
-        det_annos += annos
-        if cfg.LOCAL_RANK == 0:
-            progress_bar.set_postfix(disp_dict)
-            progress_bar.update()
+    # the files are closed and the background threads joined even if the inference fails
+    if streaming_eval:
+        result_file = open(result_dir / ('result_stream_%d.pkl' % rank if dist_test else 'result_stream.pkl'), 'wb')
+        update_executor = ThreadPoolExecutor(max_workers=1)
+    result_writer = ResultWriter() if save_to_file else None
+    loop_done = False
+    try:
+        for i, batch_dict in enumerate(dataloader):
+            load_data_to_gpu(batch_dict)
+            with torch.no_grad():
+                pred_dicts, ret_dict = model(batch_dict)
+            disp_dict = {}
+
+            statistics_info(cfg, ret_dict, metric, disp_dict)
+            annos = dataset.generate_prediction_dicts(
+                batch_dict, pred_dicts, class_names,
+                output_path=final_output_dir if save_to_file else None, result_writer=result_writer
+            )
+            if streaming_eval:
+                # the frame i of this rank is the sample rank + i * world_size of the DistributedSampler, the ones past
+                # len(dataset) are its padding and are not counted, as in merge_results_dist
+                for anno in annos:
+                    if rank + num_rank_frames * world_size < len(dataset):
+                        metric['frame_num'] += 1
+                        metric['pred_num'] += len(anno['name'])
+                    num_rank_frames += 1
+                # at most one batch is waiting, so the statistics keep up with the inference
+                if update_future is not None:
+                    update_future.result()
+                update_future = update_executor.submit(update_evaluator, annos)
+            else:
+                det_annos += annos
+            if cfg.LOCAL_RANK == 0:
+                progress_bar.set_postfix(disp_dict)
+                progress_bar.update()
+
+        if streaming_eval and update_future is not None:
+            update_future.result()
+        loop_done = True
+    finally:
+        if streaming_eval:
+            update_executor.shutdown()
+            result_file.close()
+        if result_writer is not None:
+            # the errors of the writers are only raised if they do not hide the one of the inference
+            writer_errors = result_writer.close(raise_errors=loop_done)
+            for error in writer_errors:
+                logger.warning('Failed to save a prediction file: %r' % error)
 
     if cfg.LOCAL_RANK == 0:
         progress_bar.close()
 
     if dist_test:
         rank, world_size = common_utils.get_dist_info()
-        det_annos = common_utils.merge_results_dist(det_annos, len(dataset), tmpdir=result_dir / 'tmpdir')
-        metric = common_utils.merge_results_dist([metric], world_size, tmpdir=result_dir / 'tmpdir')
+        if streaming_eval:
+            # the evaluator results stay sharded per rank until merge_results
+            results_list = common_utils.gather_results_dist(evaluator.get_results())
+            if rank == 0:
+                evaluator.merge_results(results_list)
+        else:
+            det_annos = common_utils.merge_results_dist(det_annos, len(dataset))
+        metric = common_utils.gather_results_dist(metric)
 
     logger.info('*************** Performance of EPOCH %s *****************' % epoch_id)
     sec_per_example = (time.time() - start_time) / len(dataloader.dataset)
     logger.info('Generate label finished(sec_per_example: %.4f second).' % sec_per_example)
 
     if cfg.LOCAL_RANK != 0:
-        return {}
+        return eval_executor.submit(dict) if eval_executor is not None else {}
 
-    ret_dict = {}
     if dist_test:
         for key, val in metric[0].items():
             for k in range(1, world_size):
                 metric[0][key] += metric[k][key]
         metric = metric[0]
 
+    if eval_executor is not None:
+        return eval_executor.submit(
+            evaluate_predictions, cfg, dataset, metric, det_annos, evaluator if streaming_eval else None,
+            epoch_id, logger, result_dir, final_output_dir
+        )
+    return evaluate_predictions(
+        cfg, dataset, metric, det_annos, evaluator if streaming_eval else None,
+        epoch_id, logger, result_dir, final_output_dir
+    )
+
+
+def evaluate_predictions(cfg, dataset, metric, det_annos, evaluator, epoch_id, logger, result_dir, final_output_dir):
+    """
+    Args:
+        metric: recall counters of eval_one_epoch, summed over the ranks
+        det_annos: predictions of the whole dataset, unused with an evaluator
+        evaluator: DatasetEvaluator of STREAMING_EVAL holding the merged results, None otherwise
+    Returns:
+        ret_dict:
+    """
+    class_names = dataset.class_names
+    ret_dict = {}
+
     gt_num_cnt = metric['gt_num']
     for cur_thresh in cfg.MODEL.POST_PROCESSING.RECALL_THRESH_LIST:
         cur_roi_recall = metric['recall_roi_%s' % str(cur_thresh)] / max(gt_num_cnt, 1)
@@ -98,20 +184,26 @@ def eval_one_epoch(cfg, model, dataloader, epoch_id, logger, dist_test=False, sa
         ret_dict['recall/roi_%s' % str(cur_thresh)] = cur_roi_recall
         ret_dict['recall/rcnn_%s' % str(cur_thresh)] = cur_rcnn_recall
 
-    total_pred_objects = 0
-    for anno in det_annos:
-        total_pred_objects += anno['name'].__len__()
-    logger.info('Average predicted number of objects(%d samples): %.3f'
-                % (len(det_annos), total_pred_objects / max(1, len(det_annos))))
-
-    with open(result_dir / 'result.pkl', 'wb') as f:
-        pickle.dump(det_annos, f)
-
-    result_str, result_dict = dataset.evaluation(
-        det_annos, class_names,
-        eval_metric=cfg.MODEL.POST_PROCESSING.EVAL_METRIC,
-        output_path=final_output_dir
-    )
+    if evaluator is not None:
+        logger.info('Average predicted number of objects(%d samples): %.3f'
+                    % (metric['frame_num'], metric['pred_num'] / max(1, metric['frame_num'])))
+
+        result_str, result_dict = evaluator.evaluate()
+    else:
+        total_pred_objects = 0
+        for anno in det_annos:
+            total_pred_objects += anno['name'].__len__()
+        logger.info('Average predicted number of objects(%d samples): %.3f'
+                    % (len(det_annos), total_pred_objects / max(1, len(det_annos))))
+
+        with open(result_dir / 'result.pkl', 'wb') as f:
+            pickle.dump(det_annos, f)
+
+        result_str, result_dict = dataset.evaluation(
+            det_annos, class_names,
+            eval_metric=cfg.MODEL.POST_PROCESSING.EVAL_METRIC,
+            output_path=final_output_dir
+        )
 
     logger.info(result_str)
     ret_dict.update(result_dict)
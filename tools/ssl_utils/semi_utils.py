@@ -61,12 +61,26 @@ def random_world_scaling(box_preds, params, reverse = False):
     box_preds[:, :6] *= noise_scale
     return box_preds
 
+def random_world_transform(box_preds, params, reverse = False):
+    affine = torch.from_numpy(params['affine']).to(box_preds)
+    heading_sign, heading_offset = params['heading']
+    if reverse:
+        box_preds[:, :3] = torch.matmul(box_preds[:, :3] - affine[:, 3], torch.inverse(affine[:, :3]).t())
+        box_preds[:, 3:6] /= params['scale']
+        box_preds[:, 6] = (box_preds[:, 6] - heading_offset) * heading_sign
+    else:
+        box_preds[:, :3] = torch.matmul(box_preds[:, :3], affine[:, :3].t()) + affine[:, 3]
+        box_preds[:, 3:6] *= params['scale']
+        box_preds[:, 6] = box_preds[:, 6] * heading_sign + heading_offset
+    return box_preds
+
 @torch.no_grad()
 def reverse_transform(teacher_boxes, teacher_dict, student_dict):
     augmentation_functions = {
         'random_world_flip': random_world_flip,
         'random_world_rotation': random_world_rotation,
-        'random_world_scaling': random_world_scaling
+        'random_world_scaling': random_world_scaling,
+        'random_world_transform': random_world_transform
     }
     for bs_idx, teacher_box in enumerate(teacher_boxes):
         teacher_aug_list = teacher_dict['augmentation_list'][bs_idx]
@@ -5,6 +5,7 @@ import glob
 import os
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import numpy as np
@@ -14,6 +15,7 @@ from tensorboardX import SummaryWriter
 from eval_utils import eval_utils
 from pcdet.config import cfg, cfg_from_list, cfg_from_yaml_file, log_config_to_file
 from pcdet.datasets import build_dataloader
+from pcdet.datasets.batch_cache import BatchCache
 from pcdet.models import build_network
 from pcdet.utils import common_utils
 
@@ -38,6 +40,11 @@ def parse_config():
     parser.add_argument('--eval_all', action='store_true', default=False, help='whether to evaluate all checkpoints')
     parser.add_argument('--ckpt_dir', type=str, default=None, help='specify a ckpt directory to be evaluated if needed')
     parser.add_argument('--save_to_file', action='store_true', default=False, help='')
+    parser.add_argument('--cache_batches', action='store_true', default=False,
+                        help='with --eval_all, preprocess the test set once and evaluate every checkpoint on the cached batches')
+    parser.add_argument('--cache_dir', type=str, default=None, help='directory of the batch cache, e.g. /dev/shm')
+    parser.add_argument('--async_eval', action='store_true', default=False,
+                        help='with --eval_all, evaluate the predictions of a checkpoint during the inference of the next one')
 
     args = parser.parse_args()
 
@@ -65,7 +72,7 @@ def eval_single_ckpt(model, test_loader, args, eval_output_dir, logger, epoch_id
     )
 
 
-def get_no_evaluated_ckpt(ckpt_dir, ckpt_record_file, args):
+def get_no_evaluated_ckpt(ckpt_dir, ckpt_record_file, args, pending_epoch_ids=()):
     ckpt_list = glob.glob(os.path.join(ckpt_dir, '*checkpoint_epoch_*.pth'))
     ckpt_list.sort(key=os.path.getmtime)
     evaluated_ckpt_list = [float(x.strip()) for x in open(ckpt_record_file, 'r').readlines()]
@@ -78,7 +85,8 @@ def get_no_evaluated_ckpt(ckpt_dir, ckpt_record_file, args):
         epoch_id = num_list[-1]
         if 'optim' in epoch_id:
             continue
-        if float(epoch_id) not in evaluated_ckpt_list and int(float(epoch_id)) >= args.start_epoch:
+        if float(epoch_id) not in evaluated_ckpt_list and epoch_id not in pending_epoch_ids and \
+                int(float(epoch_id)) >= args.start_epoch:
             return epoch_id, cur_ckpt
     return -1, None
 
@@ -95,10 +103,34 @@ def repeat_eval_ckpt(model, test_loader, args, eval_output_dir, logger, ckpt_dir
     total_time = 0
     first_eval = True
 
+    if args.cache_batches:
+        test_loader = BatchCache(test_loader, cache_dir=args.cache_dir, logger=logger)
+
+    # with async_eval, the checkpoint whose predictions are evaluated in the background: (epoch_id, future of tb_dict)
+    eval_executor = ThreadPoolExecutor(max_workers=1) if args.async_eval else None
+    pending_eval = None
+
+    def record_eval(epoch_id, tb_dict):
+        if cfg.LOCAL_RANK == 0:
+            for key, val in tb_dict.items():
+                tb_log.add_scalar(key, val, epoch_id)
+
+        # record this epoch which has been evaluated
+        with open(ckpt_record_file, 'a') as f:
+            print('%s' % epoch_id, file=f)
+        logger.info('Epoch %s has been evaluated' % epoch_id)
+
     while True:
         # check whether there is checkpoint which is not evaluated
-        cur_epoch_id, cur_ckpt = get_no_evaluated_ckpt(ckpt_dir, ckpt_record_file, args)
+        cur_epoch_id, cur_ckpt = get_no_evaluated_ckpt(
+            ckpt_dir, ckpt_record_file, args, pending_epoch_ids=[pending_eval[0]] if pending_eval is not None else []
+        )
         if cur_epoch_id == -1 or int(float(cur_epoch_id)) < args.start_epoch:
+            if pending_eval is not None:
+                record_eval(pending_eval[0], pending_eval[1].result())
+                pending_eval = None
+                continue
+
             wait_second = 30
             if cfg.LOCAL_RANK == 0:
                 print('Wait %s seconds for next check (progress: %.1f / %d minutes): %s \r'
@@ -119,17 +151,19 @@ def repeat_eval_ckpt(model, test_loader, args, eval_output_dir, logger, ckpt_dir
         cur_result_dir = eval_output_dir / ('epoch_%s' % cur_epoch_id) / cfg.DATA_CONFIG.DATA_SPLIT['test']
         tb_dict = eval_utils.eval_one_epoch(
             cfg, model, test_loader, cur_epoch_id, logger, dist_test=dist_test,
-            result_dir=cur_result_dir, save_to_file=args.save_to_file
+            result_dir=cur_result_dir, save_to_file=args.save_to_file, eval_executor=eval_executor
         )
 
-        if cfg.LOCAL_RANK == 0:
-            for key, val in tb_dict.items():
-                tb_log.add_scalar(key, val, cur_epoch_id)
+        if pending_eval is not None:
+            record_eval(pending_eval[0], pending_eval[1].result())
+            pending_eval = None
+        if eval_executor is not None:
+            pending_eval = (cur_epoch_id, tb_dict)
+        else:
+            record_eval(cur_epoch_id, tb_dict)
 
-        # record this epoch which has been evaluated
-        with open(ckpt_record_file, 'a') as f:
-            print('%s' % cur_epoch_id, file=f)
-        logger.info('Epoch %s has been evaluated' % cur_epoch_id)
+    if eval_executor is not None:
+        eval_executor.shutdown()
 
 
 def main():
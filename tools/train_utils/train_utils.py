@@ -120,6 +120,11 @@ def train_model(model, optimizer, train_loader, model_func, lr_scheduler, optim_
 
             # save trained model
             trained_epoch = cur_epoch + 1
+            frame_cache = getattr(train_loader.dataset, 'frame_cache', None)
+            if frame_cache is not None and tb_log is not None:
+                for key, val in frame_cache.get_stats().items():
+                    tb_log.add_scalar('frame_cache/' + key, val, trained_epoch)
+
             if trained_epoch % ckpt_save_interval == 0 and rank == 0:
 
                 ckpt_list = glob.glob(str(ckpt_save_dir / 'checkpoint_epoch_*.pth'))